@@ -1,4 +1,3 @@
-from config.config import Config, AmoCRMConfig
-
-__all__ = ['Config', 'AmoCRMConfig']
+from config.config import Config, AmoCRMConfig, get_config, reload_config, subscribe_config
 
+__all__ = ['Config', 'AmoCRMConfig', 'get_config', 'reload_config', 'subscribe_config']
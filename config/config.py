@@ -1,14 +1,15 @@
 import os
+import threading
 from dotenv import load_dotenv
 from dataclasses import dataclass
-from typing import List, Optional
+from typing import List, Optional, FrozenSet, Callable
 from logger import get_logger
 
 logger = get_logger(__name__)
 load_dotenv()
 
 
-@dataclass
+@dataclass(frozen=True)
 class AmoCRMConfig:
     subdomain: str
     client_id: str
@@ -17,9 +18,13 @@ class AmoCRMConfig:
     access_token: str
     refresh_token: str
     responsible_user_id: Optional[int] = None  # ID ответственного пользователя для сделок
+    rate_limit: float = 7.0  # Запросов в секунду к аккаунту (лимит AmoCRM - 7)
+    max_concurrency: int = 5  # Максимум одновременных запросов к аккаунту
+    tokens_path: str = './amocrm_tokens.json'  # Файл с обновленными ботом токенами
+    base_url: str = ''  # URL API (по умолчанию https://<subdomain>.amocrm.ru)
 
 
-def _load_admin_ids() -> List[int]:
+def _load_admin_ids() -> FrozenSet[int]:
     """Загружает ID администраторов из переменной окружения ADMIN_IDS"""
     admin_ids_str = os.getenv('ADMIN_IDS')
     
@@ -31,20 +36,25 @@ def _load_admin_ids() -> List[int]:
             f"Используются дефолтные значения: {default_ids}. "
             "Рекомендуется добавить ADMIN_IDS в .env файл."
         )
-        return default_ids
+        return frozenset(default_ids)
     
     try:
-        admin_ids = [int(id.strip()) for id in admin_ids_str.split(',') if id.strip()]
+        admin_ids = frozenset(int(id.strip()) for id in admin_ids_str.split(',') if id.strip())
         if not admin_ids:
             logger.warning("ADMIN_IDS задан, но список пуст. Админ-панель будет недоступна.")
         return admin_ids
     except ValueError as e:
         logger.error(f"Ошибка при парсинге ADMIN_IDS: {e}. Используются дефолтные значения.")
-        return [764643451, 874844758]
+        return frozenset([764643451, 874844758])
 
 
-@dataclass
+@dataclass(frozen=True)
 class Config:
+    """Неизменяемый снимок конфигурации
+    
+    В рабочем коде используйте get_config(): конфигурация загружается один раз,
+    а при reload_config() снимок целиком заменяется новым.
+    """
     bot_token: str
     database_path: str
     amocrm_city1: AmoCRMConfig
@@ -52,9 +62,35 @@ class Config:
     ticket_url: str
     hotline_phone: str
     hotline_email: str
-    admin_ids: List[int]
+    admin_ids: FrozenSet[int]
     bot_username: str
     link_mappings_path: str
+    link_mappings_archive_path: str
+    city_routing_path: str
+    mappings_archive_after_days: int
+    mappings_archive_interval: int
+    crm_outbox_workers: int
+    crm_outbox_max_attempts: int
+    lead_webhook_url: str
+    lead_webhook_timeout: float
+    lead_webhook_max_attempts: int
+    lead_ledger_path: str
+    amocrm_complex_leads: bool
+    crm_lead_sync_interval: int
+    task_drain_timeout: float
+    max_concurrent_updates: int
+    fsm_storage: str
+    fsm_storage_path: str
+    fsm_cache_size: int
+    fsm_state_ttl_days: float
+    bot_mode: str
+    bot_workers: int
+    telegram_api_url: str
+    webhook_url: str
+    webhook_path: str
+    webhook_host: str
+    webhook_port: int
+    webhook_secret: str
     promo_image_file_id: str
     promo_video_file_id: str
     
@@ -71,6 +107,10 @@ class Config:
                 redirect_uri=os.getenv('AMOCRM_CITY1_REDIRECT_URI', ''),
                 access_token=os.getenv('AMOCRM_CITY1_ACCESS_TOKEN', ''),
                 refresh_token=os.getenv('AMOCRM_CITY1_REFRESH_TOKEN', ''),
+                rate_limit=float(os.getenv('AMOCRM_CITY1_RATE_LIMIT', '7')),
+                max_concurrency=int(os.getenv('AMOCRM_CITY1_MAX_CONCURRENCY', '5')),
+                tokens_path=os.getenv('AMOCRM_TOKENS_PATH', './amocrm_tokens.json'),
+                base_url=os.getenv('AMOCRM_CITY1_BASE_URL', ''),
             ),
             amocrm_city2=AmoCRMConfig(
                 subdomain=os.getenv('AMOCRM_CITY2_SUBDOMAIN', ''),
@@ -79,6 +119,10 @@ class Config:
                 redirect_uri=os.getenv('AMOCRM_CITY2_REDIRECT_URI', ''),
                 access_token=os.getenv('AMOCRM_CITY2_ACCESS_TOKEN', ''),
                 refresh_token=os.getenv('AMOCRM_CITY2_REFRESH_TOKEN', ''),
+                rate_limit=float(os.getenv('AMOCRM_CITY2_RATE_LIMIT', '7')),
+                max_concurrency=int(os.getenv('AMOCRM_CITY2_MAX_CONCURRENCY', '5')),
+                tokens_path=os.getenv('AMOCRM_TOKENS_PATH', './amocrm_tokens.json'),
+                base_url=os.getenv('AMOCRM_CITY2_BASE_URL', ''),
                 responsible_user_id=int(os.getenv('AMOCRM_CITY2_RESPONSIBLE_USER_ID', '0')) if os.getenv('AMOCRM_CITY2_RESPONSIBLE_USER_ID') else None,
             ),
             ticket_url=os.getenv('TICKET_URL', 'https://your-ticket-url.com'),
@@ -87,10 +131,89 @@ class Config:
             admin_ids=_load_admin_ids(),
             bot_username=os.getenv('BOT_USERNAME', 'theatrfest_help_bot'),
             link_mappings_path=os.getenv('LINK_MAPPINGS_PATH', './link_mappings.json'),
+            link_mappings_archive_path=os.getenv('LINK_MAPPINGS_ARCHIVE_PATH', ''),
+            city_routing_path=os.getenv('CITY_ROUTING_PATH', './city_routing.json'),
+            mappings_archive_after_days=int(os.getenv('MAPPINGS_ARCHIVE_AFTER_DAYS', '3')),
+            mappings_archive_interval=int(os.getenv('MAPPINGS_ARCHIVE_INTERVAL', '3600')),
+            crm_outbox_workers=int(os.getenv('CRM_OUTBOX_WORKERS', '2')),
+            crm_outbox_max_attempts=int(os.getenv('CRM_OUTBOX_MAX_ATTEMPTS', '8')),
+            lead_webhook_url=os.getenv('LEAD_WEBHOOK_URL', ''),
+            lead_webhook_timeout=float(os.getenv('LEAD_WEBHOOK_TIMEOUT', '5')),
+            lead_webhook_max_attempts=int(os.getenv('LEAD_WEBHOOK_MAX_ATTEMPTS', '5')),
+            lead_ledger_path=os.getenv('LEAD_LEDGER_PATH', ''),
+            amocrm_complex_leads=os.getenv('AMOCRM_COMPLEX_LEADS', 'true').strip().lower() in ('1', 'true', 'yes'),
+            crm_lead_sync_interval=int(os.getenv('CRM_LEAD_SYNC_INTERVAL', '900')),
+            task_drain_timeout=float(os.getenv('TASK_DRAIN_TIMEOUT', '10')),
+            max_concurrent_updates=int(os.getenv('MAX_CONCURRENT_UPDATES', '100')),
+            fsm_storage=os.getenv('FSM_STORAGE', 'sqlite').strip().lower(),
+            fsm_storage_path=os.getenv('FSM_STORAGE_PATH', './fsm_states.db'),
+            fsm_cache_size=int(os.getenv('FSM_CACHE_SIZE', '10000')),
+            fsm_state_ttl_days=float(os.getenv('FSM_STATE_TTL_DAYS', '7')),
+            bot_mode=os.getenv('BOT_MODE', 'polling').strip().lower(),
+            bot_workers=int(os.getenv('BOT_WORKERS', '1')),
+            telegram_api_url=os.getenv('TELEGRAM_API_URL', '').rstrip('/'),
+            webhook_url=os.getenv('WEBHOOK_URL', '').rstrip('/'),
+            webhook_path=os.getenv('WEBHOOK_PATH', '/webhook'),
+            webhook_host=os.getenv('WEBHOOK_HOST', '0.0.0.0'),
+            webhook_port=int(os.getenv('WEBHOOK_PORT', '8080')),
+            webhook_secret=os.getenv('WEBHOOK_SECRET', ''),
             promo_image_file_id=os.getenv('PROMO_IMAGE_FILE_ID', ''),
             promo_video_file_id=os.getenv('PROMO_VIDEO_FILE_ID', ''),
         )
         logger.debug("Конфигурация успешно загружена")
-        logger.debug(f"Администраторы: {config.admin_ids}")
+        logger.debug(f"Администраторы: {sorted(config.admin_ids)}")
         return config
 
+
+# Поля, изменение которых требует перезапуска бота (используются при старте)
+RESTART_REQUIRED_FIELDS = ("bot_token", "database_path")
+
+_config: Optional[Config] = None
+_config_lock = threading.Lock()
+_config_subscribers: List[Callable[[Config], None]] = []
+
+
+def get_config() -> Config:
+    """Получить текущий снимок конфигурации (загружается один раз)"""
+    global _config
+    if _config is None:
+        with _config_lock:
+            if _config is None:
+                _config = Config.load()
+    return _config
+
+
+def reload_config() -> Config:
+    """Перечитать .env и атомарно заменить снимок конфигурации
+    
+    Вызывается по SIGHUP и командой администратора. Обработчики, получившие
+    старый снимок, дорабатывают с ним; новые события получают новый снимок.
+    
+    Returns:
+        Новый снимок конфигурации
+    """
+    global _config
+    with _config_lock:
+        load_dotenv(override=True)
+        new_config = Config.load()
+        previous, _config = _config, new_config
+    
+    if previous is not None:
+        for name in RESTART_REQUIRED_FIELDS:
+            if getattr(previous, name) != getattr(new_config, name):
+                logger.warning(f"Параметр {name} изменен, но применится только после перезапуска бота")
+    logger.info("Конфигурация перезагружена")
+    
+    for callback in list(_config_subscribers):
+        try:
+            callback(new_config)
+        except Exception as e:
+            logger.error(f"Ошибка в подписчике на конфигурацию {callback!r}: {e}", exc_info=True)
+    return new_config
+
+
+def subscribe_config(callback: Callable[[Config], None]) -> Callable[[Config], None]:
+    """Подписаться на перезагрузку конфигурации (колбэк получает новый снимок)"""
+    _config_subscribers.append(callback)
+    return callback
+
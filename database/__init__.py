@@ -1,4 +1,4 @@
 from database.database import Database
+from database.fsm_storage import SQLiteStorage
 
-__all__ = ['Database']
-
+__all__ = ['Database', 'SQLiteStorage']
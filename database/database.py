@@ -1,21 +1,36 @@
 import aiosqlite
+import time
 from datetime import datetime
-from typing import Optional, List
+from typing import Optional, List, Dict, Iterable, Sequence, Tuple
 import json
 from logger import get_logger
 
 logger = get_logger(__name__)
 
+# Сколько соединение ждет, пока другое соединение (или процесс бота) освободит БД, сек
+DB_BUSY_TIMEOUT = 30
+
 
 class Database:
     def __init__(self, db_path: str):
         self.db_path = db_path
         logger.debug(f"Инициализация Database с путем: {db_path}")
 
+    def _connect(self) -> aiosqlite.Connection:
+        """Соединение с БД
+
+        В БД одновременно пишут обработчики, очередь заявок и (при BOT_WORKERS > 1)
+        несколько процессов, поэтому ожидание блокировки увеличено.
+        """
+        return aiosqlite.connect(self.db_path, timeout=DB_BUSY_TIMEOUT)
+
     async def init_db(self):
         """Инициализация базы данных"""
         logger.info(f"Инициализация базы данных: {self.db_path}")
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connect() as db:
+            # WAL: чтение не блокируется записью, запись не ждет читателей.
+            # Режим сохраняется в файле БД и действует для всех соединений и процессов
+            await db.execute("PRAGMA journal_mode=WAL")
             # Таблица пользователей
             await db.execute("""
                 CREATE TABLE IF NOT EXISTS users (
@@ -68,6 +83,73 @@ class Database:
                 )
             """)
             
+            # Очередь отправки заявок в AmoCRM (outbox): заявка записывается в той же
+            # транзакции, что и выдача промокода, и не теряется при перезапуске бота
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS crm_outbox (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id INTEGER,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt_at REAL NOT NULL DEFAULT 0,
+                    last_error TEXT,
+                    created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            # Получатель заявки (см. services/lead_sinks.py): отдельная запись на каждого
+            try:
+                await db.execute("ALTER TABLE crm_outbox ADD COLUMN sink TEXT NOT NULL DEFAULT 'amocrm'")
+            except:
+                pass
+            await db.execute("DROP INDEX IF EXISTS idx_crm_outbox_due")
+            await db.execute(
+                "CREATE INDEX IF NOT EXISTS idx_crm_outbox_sink_due ON crm_outbox (sink, status, next_attempt_at)"
+            )
+            
+            # Индекс контактов AmoCRM: нормализованный телефон/email -> ID контакта в аккаунте.
+            # Повторная заявка того же зрителя привязывается к существующему контакту
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS crm_contacts (
+                    subdomain TEXT NOT NULL,
+                    contact_key TEXT NOT NULL,
+                    contact_id INTEGER NOT NULL,
+                    updated_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (subdomain, contact_key)
+                )
+            """)
+            
+            # Сделки AmoCRM, созданные ботом, и их текущие статусы (обновляются
+            # синхронизацией services.crm_sync по полю updated_at сделок)
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS crm_leads (
+                    subdomain TEXT NOT NULL,
+                    lead_id INTEGER NOT NULL,
+                    user_id INTEGER,
+                    pipeline_id INTEGER,
+                    status_id INTEGER,
+                    price INTEGER,
+                    closed_at INTEGER,
+                    amo_updated_at INTEGER,
+                    created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (subdomain, lead_id)
+                )
+            """)
+            await db.execute("CREATE INDEX IF NOT EXISTS idx_crm_leads_user ON crm_leads (user_id)")
+            
+            # Курсоры синхронизации с AmoCRM: до какого updated_at данные уже загружены
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS crm_sync_state (
+                    subdomain TEXT NOT NULL,
+                    entity TEXT NOT NULL,
+                    cursor INTEGER NOT NULL DEFAULT 0,
+                    synced_at TEXT,
+                    PRIMARY KEY (subdomain, entity)
+                )
+            """)
+            
             # Примечание: маппинги ссылок теперь хранятся в JSON файле (link_mappings.json)
             # а не в базе данных, чтобы они не терялись при удалении БД
             
@@ -91,7 +173,7 @@ class Database:
     ):
         """Создает или обновляет пользователя при переходе по ссылке"""
         logger.info(f"Создание/обновление пользователя из ссылки: user_id={user_id}, city={city}, project={project}")
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connect() as db:
             await db.execute("""
                 INSERT OR REPLACE INTO users 
                 (user_id, username, city, project, show_datetime, 
@@ -108,7 +190,7 @@ class Database:
 
     async def get_user(self, user_id: int) -> Optional[dict]:
         """Получить информацию о пользователе"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connect() as db:
             db.row_factory = aiosqlite.Row
             async with db.execute(
                 "SELECT * FROM users WHERE user_id = ?", (user_id,)
@@ -121,7 +203,7 @@ class Database:
     async def update_user_consent(self, user_id: int, consent: bool):
         """Обновить согласие на обработку данных"""
         logger.info(f"Обновление согласия пользователя {user_id}: {consent}")
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connect() as db:
             await db.execute(
                 "UPDATE users SET consent = ?, updated_at = ? WHERE user_id = ?",
                 (consent, datetime.now().isoformat(), user_id)
@@ -132,7 +214,7 @@ class Database:
     async def update_user_name(self, user_id: int, name: str):
         """Обновить имя пользователя"""
         logger.info(f"Обновление имени пользователя {user_id}: {name}")
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connect() as db:
             await db.execute(
                 "UPDATE users SET name = ?, updated_at = ? WHERE user_id = ?",
                 (name, datetime.now().isoformat(), user_id)
@@ -143,7 +225,7 @@ class Database:
     async def update_user_gender(self, user_id: int, gender: str):
         """Обновить пол пользователя"""
         logger.debug(f"Обновление пола пользователя {user_id}: {gender}")
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connect() as db:
             await db.execute(
                 "UPDATE users SET gender = ?, updated_at = ? WHERE user_id = ?",
                 (gender, datetime.now().isoformat(), user_id)
@@ -154,7 +236,7 @@ class Database:
     async def add_user_genre(self, user_id: int, genre: str):
         """Добавить жанр для пользователя"""
         logger.debug(f"Добавление жанра пользователю {user_id}: {genre}")
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connect() as db:
             await db.execute(
                 "INSERT OR IGNORE INTO user_genres (user_id, genre) VALUES (?, ?)",
                 (user_id, genre)
@@ -163,7 +245,7 @@ class Database:
 
     async def get_user_genres(self, user_id: int) -> List[str]:
         """Получить список жанров пользователя"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connect() as db:
             async with db.execute(
                 "SELECT genre FROM user_genres WHERE user_id = ?", (user_id,)
             ) as cursor:
@@ -173,7 +255,7 @@ class Database:
     async def remove_user_genre(self, user_id: int, genre: str):
         """Удалить жанр у пользователя"""
         logger.debug(f"Удаление жанра у пользователя {user_id}: {genre}")
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connect() as db:
             await db.execute(
                 "DELETE FROM user_genres WHERE user_id = ? AND genre = ?",
                 (user_id, genre)
@@ -191,6 +273,12 @@ class Database:
         service = get_link_mappings_service()
         return service.get_link_mapping(slug)
     
+    async def find_similar_link_mapping(self, slug: str) -> Optional[dict]:
+        """Найти маппинг по slug с опечаткой или в другом регистре (из JSON файла)"""
+        from services.link_mappings import get_link_mappings_service
+        service = get_link_mappings_service()
+        return service.find_similar_link_mapping(slug)
+    
     async def create_or_update_link_mapping(
         self,
         slug: str,
@@ -227,7 +315,7 @@ class Database:
     async def update_user_promo_code(self, user_id: int, promo_code: str):
         """Обновить промокод пользователя"""
         logger.info(f"Обновление промокода пользователя {user_id}: {promo_code}")
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connect() as db:
             await db.execute(
                 "UPDATE users SET promo_code = ?, promo_issued = 1, updated_at = ? WHERE user_id = ?",
                 (promo_code, datetime.now().isoformat(), user_id)
@@ -237,7 +325,7 @@ class Database:
     async def update_user_birthday(self, user_id: int, birthday: str):
         """Обновить дату рождения пользователя"""
         logger.info(f"Обновление даты рождения пользователя {user_id}: {birthday}")
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connect() as db:
             await db.execute(
                 "UPDATE users SET birthday = ?, updated_at = ? WHERE user_id = ?",
                 (birthday, datetime.now().isoformat(), user_id)
@@ -248,7 +336,7 @@ class Database:
     async def update_user_scenario(self, user_id: int, scenario: str):
         """Обновить сценарий похода в театр"""
         logger.info(f"Обновление сценария пользователя {user_id}: {scenario}")
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connect() as db:
             await db.execute(
                 "UPDATE users SET scenario = ?, updated_at = ? WHERE user_id = ?",
                 (scenario, datetime.now().isoformat(), user_id)
@@ -259,7 +347,7 @@ class Database:
     async def update_user_phone(self, user_id: int, phone: str):
         """Обновить телефон пользователя"""
         logger.info(f"Обновление телефона пользователя {user_id}")
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connect() as db:
             await db.execute(
                 "UPDATE users SET phone = ?, updated_at = ? WHERE user_id = ?",
                 (phone, datetime.now().isoformat(), user_id)
@@ -270,7 +358,7 @@ class Database:
     async def update_user_email(self, user_id: int, email: str):
         """Обновить email пользователя"""
         logger.info(f"Обновление email пользователя {user_id}: {email}")
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connect() as db:
             await db.execute(
                 "UPDATE users SET email = ?, email_confirmed = 1, updated_at = ? WHERE user_id = ?",
                 (email, datetime.now().isoformat(), user_id)
@@ -281,7 +369,7 @@ class Database:
     async def update_user_contact(self, user_id: int, phone: Optional[str] = None, email_confirmed: bool = False):
         """Обновить контакты пользователя"""
         logger.debug(f"Обновление контактов пользователя {user_id}: phone={phone}, email_confirmed={email_confirmed}")
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connect() as db:
             updates = []
             params = []
             if phone is not None:
@@ -305,14 +393,14 @@ class Database:
     # Методы для статистики
     async def get_total_users_count(self) -> int:
         """Получить общее количество пользователей"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connect() as db:
             async with db.execute("SELECT COUNT(*) FROM users") as cursor:
                 result = await cursor.fetchone()
                 return result[0] if result else 0
 
     async def get_users_by_stage(self) -> dict:
         """Получить статистику пользователей по этапам"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connect() as db:
             stats = {}
             
             # Всего зашло
@@ -363,7 +451,7 @@ class Database:
 
     async def get_users_by_city(self) -> dict:
         """Получить статистику пользователей по городам"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connect() as db:
             async with db.execute("""
                 SELECT city, COUNT(*) as count 
                 FROM users 
@@ -376,7 +464,7 @@ class Database:
 
     async def get_users_by_project(self) -> dict:
         """Получить статистику пользователей по проектам"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connect() as db:
             async with db.execute("""
                 SELECT project, COUNT(*) as count 
                 FROM users 
@@ -389,7 +477,7 @@ class Database:
 
     async def get_users_by_utm_source(self) -> dict:
         """Получить статистику пользователей по UTM source"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connect() as db:
             async with db.execute("""
                 SELECT utm_source, COUNT(*) as count 
                 FROM users 
@@ -456,7 +544,7 @@ class Database:
 
     async def get_all_users(self) -> List[dict]:
         """Получить всех пользователей с их жанрами"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connect() as db:
             db.row_factory = aiosqlite.Row
             # Получаем всех пользователей
             async with db.execute("SELECT * FROM users ORDER BY created_at DESC") as cursor:
@@ -481,3 +569,292 @@ class Database:
                 user['genres'] = ', '.join(genres) if genres else ''
             
             return users
+
+    async def issue_promo_code_with_outbox(self, user_id: int, promo_code: str, payload: dict,
+                                           sinks: Sequence[str] = ("amocrm",)) -> int:
+        """Выдать промокод и поставить заявку в очередь AmoCRM одной транзакцией
+        
+        Args:
+            user_id: ID пользователя
+            promo_code: Промокод
+            payload: Данные заявки (сериализуются в JSON)
+            sinks: Получатели заявки - по записи в очереди на каждого
+            
+        Returns:
+            ID записи в очереди первого получателя
+        """
+        logger.info(f"Выдача промокода {promo_code} и постановка заявки в очередь AmoCRM для пользователя {user_id}")
+        now = datetime.now().isoformat()
+        async with self._connect() as db:
+            await db.execute(
+                "UPDATE users SET promo_code = ?, promo_issued = 1, updated_at = ? WHERE user_id = ?",
+                (promo_code, now, user_id)
+            )
+            payload_json = json.dumps(payload, ensure_ascii=False)
+            first_id = None
+            for sink in sinks:
+                cursor = await db.execute(
+                    "INSERT INTO crm_outbox (user_id, sink, payload, next_attempt_at, created_at, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (user_id, sink, payload_json, time.time(), now, now)
+                )
+                if first_id is None:
+                    first_id = cursor.lastrowid
+            await db.commit()
+            return first_id
+
+    async def claim_outbox_items(self, limit: int, sink: str = "amocrm") -> List[dict]:
+        """Забрать заявки получателя, которые пора отправлять, и пометить их как processing
+        
+        Выборка и пометка выполняются в одной транзакции (BEGIN IMMEDIATE),
+        поэтому одна заявка не достанется двум обработчикам.
+        """
+        async with self._connect() as db:
+            db.row_factory = aiosqlite.Row
+            await db.execute("BEGIN IMMEDIATE")
+            async with db.execute(
+                "SELECT * FROM crm_outbox WHERE sink = ? AND status = 'pending' AND next_attempt_at <= ? "
+                "ORDER BY next_attempt_at LIMIT ?",
+                (sink, time.time(), limit)
+            ) as cursor:
+                items = [dict(row) for row in await cursor.fetchall()]
+            if items:
+                await db.executemany(
+                    "UPDATE crm_outbox SET status = 'processing', updated_at = ? WHERE id = ?",
+                    [(datetime.now().isoformat(), item['id']) for item in items]
+                )
+            await db.commit()
+            return items
+
+    async def complete_outbox_item(self, item_id: int):
+        """Отметить заявку как доставленную"""
+        async with self._connect() as db:
+            await db.execute(
+                "UPDATE crm_outbox SET status = 'done', attempts = attempts + 1, last_error = NULL, updated_at = ? WHERE id = ?",
+                (datetime.now().isoformat(), item_id)
+            )
+            await db.commit()
+
+    async def fail_outbox_item(self, item_id: int, error: str, next_attempt_at: Optional[float]):
+        """Записать неудачную попытку отправки заявки
+        
+        Args:
+            item_id: ID записи в очереди
+            error: Текст ошибки
+            next_attempt_at: Время следующей попытки (unix time) или None,
+                если попытки исчерпаны и заявка уходит в dead-letter
+        """
+        status = 'pending' if next_attempt_at is not None else 'dead'
+        async with self._connect() as db:
+            await db.execute(
+                "UPDATE crm_outbox SET status = ?, attempts = attempts + 1, last_error = ?, "
+                "next_attempt_at = ?, updated_at = ? WHERE id = ?",
+                (status, error[:1000], next_attempt_at or 0, datetime.now().isoformat(), item_id)
+            )
+            await db.commit()
+
+    async def defer_outbox_item(self, item_id: int, reason: str, next_attempt_at: float):
+        """Отложить заявку без расхода попытки (например, пока AmoCRM недоступен)"""
+        async with self._connect() as db:
+            await db.execute(
+                "UPDATE crm_outbox SET status = 'pending', last_error = ?, next_attempt_at = ?, updated_at = ? WHERE id = ?",
+                (reason[:1000], next_attempt_at, datetime.now().isoformat(), item_id)
+            )
+            await db.commit()
+
+    async def reset_stale_outbox_items(self) -> int:
+        """Вернуть в очередь заявки, которые обрабатывались при остановке бота"""
+        async with self._connect() as db:
+            cursor = await db.execute(
+                "UPDATE crm_outbox SET status = 'pending', updated_at = ? WHERE status = 'processing'",
+                (datetime.now().isoformat(),)
+            )
+            await db.commit()
+            return cursor.rowcount
+
+    async def get_outbox_stats(self, sink: str = "amocrm") -> Dict[str, int]:
+        """Количество заявок получателя в очереди по статусам"""
+        async with self._connect() as db:
+            async with db.execute(
+                "SELECT status, COUNT(*) FROM crm_outbox WHERE sink = ? GROUP BY status", (sink,)
+            ) as cursor:
+                return {row[0]: row[1] for row in await cursor.fetchall()}
+
+    async def get_outbox_sink_stats(self) -> Dict[str, Dict[str, int]]:
+        """Количество заявок в очереди по получателям и статусам: sink -> {status: n}"""
+        async with self._connect() as db:
+            async with db.execute(
+                "SELECT sink, status, COUNT(*) FROM crm_outbox GROUP BY sink, status"
+            ) as cursor:
+                result: Dict[str, Dict[str, int]] = {}
+                for sink, status, count in await cursor.fetchall():
+                    result.setdefault(sink, {})[status] = count
+                return result
+
+    async def get_dead_outbox_items(self, limit: int = 10) -> List[dict]:
+        """Последние заявки, которые не удалось доставить (dead-letter)"""
+        async with self._connect() as db:
+            db.row_factory = aiosqlite.Row
+            async with db.execute(
+                "SELECT id, user_id, sink, attempts, last_error, updated_at FROM crm_outbox "
+                "WHERE status = 'dead' ORDER BY updated_at DESC LIMIT ?",
+                (limit,)
+            ) as cursor:
+                return [dict(row) for row in await cursor.fetchall()]
+
+    async def replay_dead_outbox_items(self, item_id: Optional[int] = None) -> int:
+        """Вернуть заявки из dead-letter в очередь
+        
+        Args:
+            item_id: ID заявки; если не указан - все недоставленные заявки
+            
+        Returns:
+            Количество возвращенных в очередь заявок
+        """
+        query = "UPDATE crm_outbox SET status = 'pending', attempts = 0, next_attempt_at = ?, updated_at = ? WHERE status = 'dead'"
+        params = [time.time(), datetime.now().isoformat()]
+        if item_id is not None:
+            query += " AND id = ?"
+            params.append(item_id)
+        async with self._connect() as db:
+            cursor = await db.execute(query, params)
+            await db.commit()
+            return cursor.rowcount
+
+    async def find_crm_contact(self, subdomain: str, keys: List[str]) -> Optional[int]:
+        """Найти ID контакта AmoCRM по нормализованным телефону/email
+        
+        Args:
+            subdomain: Поддомен аккаунта AmoCRM
+            keys: Ключи контакта (см. services.contact_index.contact_keys)
+            
+        Returns:
+            ID контакта (последнего обновленного при нескольких совпадениях) или None
+        """
+        if not keys:
+            return None
+        placeholders = ", ".join("?" for _ in keys)
+        async with self._connect() as db:
+            async with db.execute(
+                f"SELECT contact_id FROM crm_contacts WHERE subdomain = ? AND contact_key IN ({placeholders}) "
+                "ORDER BY updated_at DESC LIMIT 1",
+                (subdomain, *keys)
+            ) as cursor:
+                row = await cursor.fetchone()
+                return row[0] if row else None
+
+    async def save_crm_contacts(self, subdomain: str, entries: Iterable[Tuple[str, int]]) -> int:
+        """Записать в индекс пары (ключ контакта, ID контакта AmoCRM)
+        
+        Returns:
+            Количество записанных ключей
+        """
+        now = datetime.now().isoformat()
+        rows = [(subdomain, key, contact_id, now) for key, contact_id in entries]
+        if not rows:
+            return 0
+        async with self._connect() as db:
+            await db.executemany(
+                "INSERT OR REPLACE INTO crm_contacts (subdomain, contact_key, contact_id, updated_at) VALUES (?, ?, ?, ?)",
+                rows
+            )
+            await db.commit()
+        return len(rows)
+
+    async def forget_crm_contact(self, subdomain: str, contact_id: int):
+        """Удалить контакт из индекса (например, если его удалили в AmoCRM)"""
+        async with self._connect() as db:
+            await db.execute(
+                "DELETE FROM crm_contacts WHERE subdomain = ? AND contact_id = ?",
+                (subdomain, contact_id)
+            )
+            await db.commit()
+
+    async def save_crm_lead(self, subdomain: str, lead_id: int, user_id: Optional[int],
+                            pipeline_id: Optional[int] = None, status_id: Optional[int] = None):
+        """Записать сделку, созданную ботом для пользователя"""
+        now = datetime.now().isoformat()
+        async with self._connect() as db:
+            await db.execute(
+                "INSERT INTO crm_leads (subdomain, lead_id, user_id, pipeline_id, status_id, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (subdomain, lead_id) DO UPDATE SET user_id = excluded.user_id, "
+                "pipeline_id = COALESCE(excluded.pipeline_id, pipeline_id), "
+                "status_id = COALESCE(excluded.status_id, status_id), updated_at = excluded.updated_at",
+                (subdomain, lead_id, user_id, pipeline_id, status_id, now, now)
+            )
+            # Синхронизация статусов аккаунта начинается с первой сделки бота,
+            # а не со всей истории аккаунта
+            await db.execute(
+                "INSERT OR IGNORE INTO crm_sync_state (subdomain, entity, cursor) VALUES (?, 'leads', ?)",
+                (subdomain, int(time.time()) - 60)
+            )
+            await db.commit()
+
+    async def update_crm_leads(self, subdomain: str, leads: Iterable[dict]) -> int:
+        """Обновить статусы сделок из ответа AmoCRM (сделки, созданные не ботом, пропускаются)
+        
+        Args:
+            subdomain: Поддомен аккаунта AmoCRM
+            leads: Сделки из API AmoCRM (поля id, pipeline_id, status_id, price, closed_at, updated_at)
+            
+        Returns:
+            Количество обновленных сделок
+        """
+        now = datetime.now().isoformat()
+        rows = [
+            (lead.get('pipeline_id'), lead.get('status_id'), lead.get('price'), lead.get('closed_at'),
+             lead.get('updated_at'), now, subdomain, lead['id'], lead.get('updated_at'))
+            for lead in leads if lead.get('id')
+        ]
+        if not rows:
+            return 0
+        async with self._connect() as db:
+            # Более старые данные (повтор страницы) не затирают более новые
+            cursor = await db.executemany(
+                "UPDATE crm_leads SET pipeline_id = ?, status_id = ?, price = ?, closed_at = ?, "
+                "amo_updated_at = ?, updated_at = ? "
+                "WHERE subdomain = ? AND lead_id = ? AND COALESCE(amo_updated_at, 0) <= ?",
+                rows
+            )
+            await db.commit()
+            return cursor.rowcount
+
+    async def get_crm_sync_cursor(self, subdomain: str, entity: str) -> int:
+        """Курсор синхронизации: updated_at (unix time), до которого данные загружены (0 - не начиналась)"""
+        async with self._connect() as db:
+            async with db.execute(
+                "SELECT cursor FROM crm_sync_state WHERE subdomain = ? AND entity = ?",
+                (subdomain, entity)
+            ) as cursor:
+                row = await cursor.fetchone()
+                return row[0] if row else 0
+
+    async def set_crm_sync_cursor(self, subdomain: str, entity: str, value: int):
+        """Сохранить курсор синхронизации"""
+        async with self._connect() as db:
+            await db.execute(
+                "INSERT OR REPLACE INTO crm_sync_state (subdomain, entity, cursor, synced_at) VALUES (?, ?, ?, ?)",
+                (subdomain, entity, value, datetime.now().isoformat())
+            )
+            await db.commit()
+
+    async def get_crm_lead_stats(self) -> Dict[str, int]:
+        """Сделки, созданные ботом, по итогам в AmoCRM
+        
+        Returns:
+            {"total", "won", "lost", "open", "users"}: всего сделок, успешно
+            реализованных (статус 142), закрытых и не реализованных (143),
+            в работе и пользователей хотя бы с одной успешной сделкой
+        """
+        async with self._connect() as db:
+            async with db.execute(
+                "SELECT COUNT(*), "
+                "SUM(CASE WHEN status_id = 142 THEN 1 ELSE 0 END), "
+                "SUM(CASE WHEN status_id = 143 THEN 1 ELSE 0 END), "
+                "COUNT(DISTINCT CASE WHEN status_id = 142 THEN user_id END) "
+                "FROM crm_leads"
+            ) as cursor:
+                total, won, lost, users = await cursor.fetchone()
+        won, lost = won or 0, lost or 0
+        return {"total": total, "won": won, "lost": lost, "open": total - won - lost, "users": users or 0}
@@ -0,0 +1,268 @@
+"""Хранилище состояний FSM (анкета, данные из ссылки) в SQLite
+
+MemoryStorage теряет состояния при каждом перезапуске бота: пользователь,
+заполнявший анкету, после деплоя начинает заново, а seat_selection_url из
+ссылки забывается. SQLiteStorage хранит состояния в отдельном файле SQLite
+(режим WAL) и держит в памяти LRU-кэш недавно активных пользователей:
+- чтение (aiogram читает состояние на каждое обновление) обслуживается из кэша,
+  в том числе для пользователей без состояния - как в MemoryStorage;
+- запись сразу меняет кэш, а в БД изменения сбрасываются пакетом фоновой
+  задачей (не реже FSM_FLUSH_INTERVAL) одной транзакцией и при остановке бота;
+- состояния, не менявшиеся дольше TTL (брошенные анкеты), удаляются.
+
+Кэш рассчитан на то, что обновления одного пользователя обрабатывает один
+процесс бота. Если процессы делят пользователей произвольно, укажите
+FSM_CACHE_SIZE=0: тогда каждое чтение идет в БД.
+"""
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+import aiosqlite
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, StateType, StorageKey
+
+from database.database import DB_BUSY_TIMEOUT
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+# Как часто сбрасывать изменения в БД, сек
+FSM_FLUSH_INTERVAL = 0.2
+# Как часто удалять брошенные состояния из БД, сек
+FSM_CLEANUP_INTERVAL = 3600
+
+
+class _FSMRecord:
+    """Состояние и данные FSM одного пользователя (чата)"""
+    __slots__ = ("state", "data", "updated_at")
+
+    def __init__(self, state: Optional[str] = None, data: Optional[Dict[str, Any]] = None,
+                 updated_at: float = 0.0):
+        self.state = state
+        self.data = data if data is not None else {}
+        self.updated_at = updated_at
+
+
+class SQLiteStorage(BaseStorage):
+    """Хранилище FSM в SQLite с LRU-кэшем в памяти и пакетной записью"""
+
+    def __init__(self, db_path: str, cache_size: int = 10000, ttl: float = 7 * 86400,
+                 flush_interval: float = FSM_FLUSH_INTERVAL):
+        """Инициализация хранилища
+
+        Args:
+            db_path: Путь к файлу SQLite (отдельный от основной БД бота)
+            cache_size: Сколько пользователей держать в памяти (0 - без кэша)
+            ttl: Через сколько секунд без изменений состояние считается брошенным
+            flush_interval: Как часто сбрасывать изменения в БД, сек
+        """
+        self.db_path = db_path
+        self.cache_size = max(cache_size, 0)
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self._key_builder = DefaultKeyBuilder(with_bot_id=True, with_business_connection_id=True,
+                                              with_destiny=True)
+        self._cache: "OrderedDict[StorageKey, _FSMRecord]" = OrderedDict()
+        # Измененные, но еще не записанные в БД записи (последняя версия)
+        self._dirty: Dict[StorageKey, _FSMRecord] = {}
+        self._db: Optional[aiosqlite.Connection] = None
+        self._open_lock = asyncio.Lock()
+        self._flush_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._flusher: Optional[asyncio.Task] = None
+        self._last_cleanup = 0.0
+        # Записи, измененные раньше этого момента, брошены; обновляется фоновой задачей,
+        # чтобы не вызывать time.time() на каждое чтение
+        self._expire_before = time.time() - ttl
+        self._closed = False
+
+    async def _connection(self) -> aiosqlite.Connection:
+        """Открыть БД при первом обращении и запустить фоновую запись"""
+        if self._db is not None:
+            return self._db
+        async with self._open_lock:
+            if self._db is None:
+                db = await aiosqlite.connect(self.db_path, timeout=DB_BUSY_TIMEOUT)
+                # WAL: чтение не блокируется записью; NORMAL достаточно для WAL
+                await db.execute("PRAGMA journal_mode=WAL")
+                await db.execute("PRAGMA synchronous=NORMAL")
+                await db.execute("""
+                    CREATE TABLE IF NOT EXISTS fsm_states (
+                        key TEXT PRIMARY KEY,
+                        state TEXT,
+                        data TEXT,
+                        updated_at REAL NOT NULL
+                    )
+                """)
+                await db.execute("CREATE INDEX IF NOT EXISTS idx_fsm_states_updated ON fsm_states (updated_at)")
+                await db.commit()
+                self._db = db
+                self._flusher = asyncio.create_task(self._flush_loop(), name="fsm_storage_flusher")
+                logger.info(f"Хранилище состояний FSM: {self.db_path} (кэш {self.cache_size})")
+        return self._db
+
+    async def _record(self, key: StorageKey) -> _FSMRecord:
+        """Запись пользователя из кэша, из несохраненных изменений или из БД
+
+        get_state/get_data обращаются сюда только при промахе кэша или для
+        брошенного состояния, попадание в кэш они обрабатывают сами.
+        """
+        record = self._cache.get(key)
+        if record is None:
+            record = self._dirty.get(key)
+            if record is None:
+                record = await self._load(key)
+            # Пока шла загрузка, запись могли загрузить или изменить параллельно
+            record = self._cache.get(key) or self._dirty.get(key) or record
+            if self.cache_size:
+                self._cache[key] = record
+                if len(self._cache) > self.cache_size:
+                    # Вытесняемая запись, если она изменена, остается в _dirty до записи в БД
+                    self._cache.popitem(last=False)
+        else:
+            self._cache.move_to_end(key)
+
+        if record.updated_at and time.time() - record.updated_at > self.ttl:
+            # Брошенное состояние: ведем себя так, будто его уже удалили
+            record.state = None
+            record.data = {}
+            record.updated_at = 0.0
+        return record
+
+    async def _load(self, key: StorageKey) -> _FSMRecord:
+        db = await self._connection()
+        async with db.execute(
+            "SELECT state, data, updated_at FROM fsm_states WHERE key = ?",
+            (self._key_builder.build(key),)
+        ) as cursor:
+            row = await cursor.fetchone()
+        if row is None:
+            return _FSMRecord()
+        return _FSMRecord(row[0], json.loads(row[1]) if row[1] else {}, row[2])
+
+    def _mark_dirty(self, key: StorageKey, record: _FSMRecord):
+        record.updated_at = time.time()
+        self._dirty[key] = record
+        if not self.cache_size:
+            self._wakeup.set()
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        record = await self._record(key)
+        record.state = state.state if isinstance(state, State) else state
+        self._mark_dirty(key, record)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        record = self._cache.get(key)
+        if record is None or 0 < record.updated_at < self._expire_before:
+            record = await self._record(key)
+        else:
+            self._cache.move_to_end(key)
+        return record.state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        record = await self._record(key)
+        record.data = data.copy()
+        self._mark_dirty(key, record)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        record = self._cache.get(key)
+        if record is None or 0 < record.updated_at < self._expire_before:
+            record = await self._record(key)
+        else:
+            self._cache.move_to_end(key)
+        return record.data.copy()
+
+    async def _flush_loop(self):
+        """Фоновая задача: пакетная запись изменений и удаление брошенных состояний"""
+        while not self._closed:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            self._expire_before = time.time() - self.ttl
+            try:
+                await self.flush()
+                if time.time() - self._last_cleanup > FSM_CLEANUP_INTERVAL:
+                    await self.cleanup()
+            except Exception as e:
+                logger.error(f"Ошибка записи состояний FSM: {e}", exc_info=True)
+
+    async def flush(self) -> int:
+        """Записать накопленные изменения в БД одной транзакцией
+
+        Returns:
+            Количество записанных пользователей
+        """
+        if not self._dirty:
+            return 0
+        async with self._flush_lock:
+            dirty, self._dirty = self._dirty, {}
+            upserts = []
+            deletes = []
+            for key, record in dirty.items():
+                db_key = self._key_builder.build(key)
+                if record.state is None and not record.data:
+                    deletes.append((db_key,))
+                    continue
+                try:
+                    data = json.dumps(record.data, ensure_ascii=False, default=str)
+                except (TypeError, ValueError) as e:
+                    logger.error(f"Данные FSM {db_key} не сериализуются в JSON и не сохранены: {e}")
+                    continue
+                upserts.append((db_key, record.state, data, record.updated_at))
+
+            db = await self._connection()
+            try:
+                if upserts:
+                    await db.executemany(
+                        "INSERT INTO fsm_states (key, state, data, updated_at) VALUES (?, ?, ?, ?) "
+                        "ON CONFLICT(key) DO UPDATE SET state = excluded.state, data = excluded.data, "
+                        "updated_at = excluded.updated_at",
+                        upserts
+                    )
+                if deletes:
+                    await db.executemany("DELETE FROM fsm_states WHERE key = ?", deletes)
+                await db.commit()
+            except BaseException:
+                # Не теряем изменения (в т.ч. при отмене во время остановки): вернем их в очередь (более новые версии не перезаписываем)
+                for key, record in dirty.items():
+                    self._dirty.setdefault(key, record)
+                raise
+            return len(dirty)
+
+    async def cleanup(self) -> int:
+        """Удалить из БД состояния, не менявшиеся дольше TTL
+
+        Returns:
+            Количество удаленных состояний
+        """
+        self._last_cleanup = time.time()
+        db = await self._connection()
+        cursor = await db.execute("DELETE FROM fsm_states WHERE updated_at < ?", (time.time() - self.ttl,))
+        await db.commit()
+        if cursor.rowcount:
+            logger.info(f"Удалено брошенных состояний FSM: {cursor.rowcount}")
+        return cursor.rowcount
+
+    async def close(self) -> None:
+        """Записать несохраненные изменения и закрыть БД"""
+        if self._closed:
+            return
+        self._closed = True
+        if self._flusher is not None:
+            # Фоновая запись завершает текущий пакет и выходит из цикла
+            self._wakeup.set()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+            self._flusher = None
+        if self._db is not None:
+            try:
+                saved = await self.flush()
+                if saved:
+                    logger.info(f"Сохранено состояний FSM при остановке: {saved}")
+            finally:
+                await self._db.close()
+                self._db = None
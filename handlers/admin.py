@@ -1,8 +1,12 @@
 """Обработчики для админ-панели"""
 from io import BytesIO
 from datetime import datetime
+from typing import Optional, Tuple
 from aiogram import Router, F
-from aiogram.types import Message, CallbackQuery, BufferedInputFile
+from aiogram.types import (
+    Message, CallbackQuery, BufferedInputFile,
+    InlineQuery, InlineQueryResultArticle, InputTextMessageContent
+)
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
@@ -10,12 +14,15 @@ from openpyxl import Workbook
 from openpyxl.styles import Font, Alignment, PatternFill
 
 from database import Database
-from config import Config
-from utils.admin import is_admin
+from config import Config, get_config, reload_config
+from utils.admin import is_admin, short_hash
 from services.bot_settings import get_bot_settings_service
+from services.link_mappings import get_link_mappings_service, MappingFilter
+from services.sharded_workers import main_process_command
 from keyboards.admin import (
     get_admin_menu_keyboard,
     get_mapping_list_keyboard,
+    get_mapping_city_filter_keyboard,
     get_mapping_actions_keyboard,
     get_confirm_delete_keyboard,
     get_settings_menu_keyboard,
@@ -27,6 +34,11 @@ from logger import get_logger
 logger = get_logger(__name__)
 router = Router()
 
+# Количество маппингов на одной странице списка
+MAPPINGS_PER_PAGE = 10
+# Telegram показывает не более 50 результатов inline-запроса
+INLINE_SEARCH_LIMIT = 50
+
 
 class AdminStates(StatesGroup):
     waiting_for_slug = State()
@@ -60,6 +72,246 @@ async def cmd_admin(message: Message, config: Config):
     await message.answer(text, reply_markup=get_admin_menu_keyboard())
 
 
+async def _answer_report(message: Message, report, db: Database, **kwargs):
+    """Выполнить команду администратора и отправить ее отчет
+    
+    Команды с состоянием очереди, AmoCRM и фоновых задач объявлены через
+    main_process_command: в многопроцессном режиме они выполняются в основном
+    процессе, а процесс-обработчик только пересылает ответ.
+    """
+    try:
+        text = await report(db, **kwargs)
+    except Exception as e:
+        logger.error(f"Ошибка команды администратора {report.__name__}: {e}", exc_info=True)
+        text = f"❌ Команда не выполнена: {e}"
+    await message.answer(text)
+
+
+@main_process_command("reload_config")
+async def reload_config_report(db: Database) -> str:
+    """Перечитать .env (в многопроцессном режиме основной процесс передает SIGHUP обработчикам)"""
+    try:
+        new_config = reload_config()
+    except Exception as e:
+        logger.error(f"Ошибка при перезагрузке конфигурации: {e}", exc_info=True)
+        return f"❌ Не удалось перезагрузить конфигурацию: {e}"
+    
+    return (
+        "✅ Конфигурация перезагружена\n\n"
+        f"Администраторов: {len(new_config.admin_ids)}\n"
+        "BOT_TOKEN и DATABASE_PATH применяются только после перезапуска."
+    )
+
+
+@router.message(Command("reload_config"))
+async def cmd_reload_config(message: Message, db: Database, config: Config):
+    """Перечитать .env без перезапуска бота (то же, что SIGHUP)"""
+    user_id = message.from_user.id
+    
+    if not is_admin(user_id, config):
+        await message.answer("❌ У вас нет доступа к админ-панели.")
+        return
+    
+    logger.info(f"Администратор {user_id} перезагружает конфигурацию")
+    await _answer_report(message, reload_config_report, db)
+
+
+@main_process_command("crm_refresh")
+async def crm_refresh_report(db: Database) -> str:
+    """Сбросить кэш AmoCRM и загрузить статусы воронки заново"""
+    from services.amocrm import invalidate_pipeline_cache, invalidate_user_directory_cache, warm_pipeline_cache
+    invalidate_pipeline_cache()
+    invalidate_user_directory_cache()
+    status_id = await warm_pipeline_cache(get_config().amocrm_city2)
+    
+    if status_id:
+        return f"✅ Кэш AmoCRM обновлен\n\nСтатус \"принято в работу\" (ЭТАЖИ): {status_id}"
+    return "⚠️ Кэш AmoCRM сброшен, но статусы воронки ЭТАЖИ загрузить не удалось. Подробности в логах."
+
+
+@router.message(Command("crm_refresh"))
+async def cmd_crm_refresh(message: Message, db: Database, config: Config):
+    """Сбросить кэш AmoCRM (статусы воронок, пользователи) и загрузить статусы заново"""
+    user_id = message.from_user.id
+    
+    if not is_admin(user_id, config):
+        await message.answer("❌ У вас нет доступа к админ-панели.")
+        return
+    
+    logger.info(f"Администратор {user_id} обновляет кэш AmoCRM")
+    await _answer_report(message, crm_refresh_report, db)
+
+
+@main_process_command("crm_queue")
+async def crm_queue_report(db: Database) -> str:
+    """Отчет об очереди заявок, доступности и лимитах AmoCRM"""
+    stats = await db.get_outbox_stats()
+    text = (
+        "📤 Очередь заявок AmoCRM\n\n"
+        f"⏳ Ожидают отправки: {stats.get('pending', 0)}\n"
+        f"🔄 Отправляются: {stats.get('processing', 0)}\n"
+        f"✅ Доставлены: {stats.get('done', 0)}\n"
+        f"❌ Не доставлены: {stats.get('dead', 0)}"
+    )
+    
+    # Дополнительные получатели заявок (вебхук, CSV-журнал)
+    sink_stats = await db.get_outbox_sink_stats()
+    sink_stats.pop('amocrm', None)
+    if sink_stats:
+        text += "\n\nДругие получатели:\n"
+        for sink, stats in sorted(sink_stats.items()):
+            text += (
+                f"{sink}: ожидают {stats.get('pending', 0) + stats.get('processing', 0)}, "
+                f"доставлены {stats.get('done', 0)}, не доставлены {stats.get('dead', 0)}\n"
+            )
+    
+    dead_items = await db.get_dead_outbox_items(limit=5)
+    if dead_items:
+        text += "\n\nПоследние недоставленные:\n"
+        for item in dead_items:
+            error = (item.get('last_error') or '')[:100]
+            text += f"#{item['id']} {item['sink']} (пользователь {item['user_id']}, попыток {item['attempts']}): {error}\n"
+        text += "\nПовторить: /crm_replay (все) или /crm_replay <id>"
+    
+    from services.circuit_breaker import get_circuit_breaker_stats, STATE_CLOSED, STATE_OPEN
+    breaker_stats = get_circuit_breaker_stats()
+    if breaker_stats:
+        text += "\n\n🩺 Доступность AmoCRM:\n"
+        for subdomain, stats in breaker_stats.items():
+            if stats['state'] == STATE_CLOSED:
+                state = "✅ работает"
+            elif stats['state'] == STATE_OPEN:
+                state = f"⛔ недоступен, проверка через {stats['retry_in']:.0f} сек"
+            else:
+                state = "🔄 проверка доступности"
+            text += f"{subdomain}: {state} (сбоев подряд {stats['consecutive_failures']}, отклонено запросов {stats['rejected']})\n"
+            if stats['last_error'] and stats['state'] != STATE_CLOSED:
+                text += f"  последняя ошибка: {stats['last_error'][:100]}\n"
+    
+    from services.rate_limiter import get_rate_limiter_stats
+    limiter_stats = get_rate_limiter_stats()
+    if limiter_stats:
+        text += "\n\n⏱ Лимиты запросов AmoCRM:\n"
+        for subdomain, stats in limiter_stats.items():
+            text += (
+                f"{subdomain}: {stats['rate']:g} запр/сек, до {stats['max_concurrency']} одновременно\n"
+                f"  запросов {stats['requests']}, в очереди {stats['waiting']}, ответов 429: {stats['throttled']}\n"
+                f"  ожидание: среднее {stats['avg_wait'] * 1000:.0f} мс, макс. {stats['max_wait'] * 1000:.0f} мс\n"
+            )
+    
+    return text
+
+
+@router.message(Command("crm_queue"))
+async def cmd_crm_queue(message: Message, db: Database, config: Config):
+    """Состояние очереди заявок AmoCRM, последние недоставленные заявки, доступность и лимиты AmoCRM"""
+    user_id = message.from_user.id
+    
+    if not is_admin(user_id, config):
+        await message.answer("❌ У вас нет доступа к админ-панели.")
+        return
+    
+    await _answer_report(message, crm_queue_report, db)
+
+
+@main_process_command("crm_replay")
+async def crm_replay_report(db: Database, item_id: Optional[int] = None) -> str:
+    """Вернуть недоставленные заявки в очередь и разбудить ее"""
+    from services.crm_outbox import notify_crm_outbox
+    count = await db.replay_dead_outbox_items(item_id)
+    notify_crm_outbox()
+    logger.info(f"В очередь AmoCRM возвращено {count} заявок (id={item_id or 'все'})")
+    return f"🔁 Возвращено в очередь: {count}"
+
+
+@router.message(Command("crm_replay"))
+async def cmd_crm_replay(message: Message, db: Database, config: Config):
+    """Вернуть недоставленные заявки в очередь AmoCRM: /crm_replay [id]"""
+    user_id = message.from_user.id
+    
+    if not is_admin(user_id, config):
+        await message.answer("❌ У вас нет доступа к админ-панели.")
+        return
+    
+    args = message.text.split()[1:]
+    item_id = None
+    if args:
+        if not args[0].isdigit():
+            await message.answer("❌ Использование: /crm_replay [id]")
+            return
+        item_id = int(args[0])
+    
+    logger.info(f"Администратор {user_id} возвращает в очередь AmoCRM заявки (id={item_id or 'все'})")
+    await _answer_report(message, crm_replay_report, db, item_id=item_id)
+
+
+@main_process_command("crm_sync")
+async def crm_sync_report(db: Database) -> str:
+    """Загрузить статусы сделок из AmoCRM (сессиями, лимитами и выключателями основного процесса)"""
+    from services.crm_sync import sync_all_leads
+    results = await sync_all_leads(db)
+    if not results:
+        return "⚠️ Аккаунты AmoCRM не настроены"
+    
+    text = "🔄 Синхронизация сделок AmoCRM\n\n"
+    for subdomain, result in results.items():
+        if 'error' in result:
+            text += f"{subdomain}: ❌ {result['error'][:100]}\n"
+        elif not result['cursor']:
+            text += f"{subdomain}: бот еще не создавал сделок\n"
+        else:
+            text += f"{subdomain}: загружено {result['fetched']}, обновлено сделок бота {result['updated']}\n"
+            if not result['complete']:
+                text += "  остальные изменения загрузятся при следующей синхронизации\n"
+    return text
+
+
+@router.message(Command("crm_sync"))
+async def cmd_crm_sync(message: Message, db: Database, config: Config):
+    """Загрузить из AmoCRM статусы сделок, не дожидаясь плановой синхронизации"""
+    user_id = message.from_user.id
+    
+    if not is_admin(user_id, config):
+        await message.answer("❌ У вас нет доступа к админ-панели.")
+        return
+    
+    logger.info(f"Администратор {user_id} запустил синхронизацию сделок AmoCRM")
+    await _answer_report(message, crm_sync_report, db)
+
+
+@main_process_command("tasks")
+async def tasks_report(db: Database) -> str:
+    """Отчет о фоновых задачах основного процесса"""
+    from services.task_supervisor import get_task_supervisor
+    task_stats = get_task_supervisor().stats()
+    if not task_stats:
+        return "⚙️ Фоновых задач не было"
+    
+    text = "⚙️ Фоновые задачи\n\n"
+    for category, stats in sorted(task_stats.items()):
+        limit = f", лимит {stats['limit']}" if stats['limit'] else ""
+        text += (
+            f"{category}: выполняются {stats['running']}, ожидают {stats['waiting']}{limit}\n"
+            f"  запущено {stats['started']}, ошибок {stats['failed']}, отменено {stats['cancelled']}\n"
+            f"  длительность: средняя {stats['avg_duration'] * 1000:.0f} мс, макс. {stats['max_duration'] * 1000:.0f} мс\n"
+        )
+        if stats['last_error']:
+            text += f"  последняя ошибка: {stats['last_error'][:100]}\n"
+    return text
+
+
+@router.message(Command("tasks"))
+async def cmd_tasks(message: Message, db: Database, config: Config):
+    """Фоновые задачи бота по категориям: выполняются, ожидают, ошибки, длительность"""
+    user_id = message.from_user.id
+    
+    if not is_admin(user_id, config):
+        await message.answer("❌ У вас нет доступа к админ-панели.")
+        return
+    
+    await _answer_report(message, tasks_report, db)
+
+
 @router.callback_query(F.data == "admin_menu")
 async def admin_menu_callback(callback: CallbackQuery, config: Config):
     """Возврат в главное меню админ-панели"""
@@ -77,9 +329,59 @@ async def admin_menu_callback(callback: CallbackQuery, config: Config):
     await callback.answer()
 
 
+def _parse_list_filter(list_filter: str) -> Tuple[MappingFilter, str]:
+    """Преобразовать код фильтра из callback_data в MappingFilter и его описание"""
+    service = get_link_mappings_service()
+    archived = list_filter.startswith("arch")
+    city_code = list_filter[len("arch"):] if archived else list_filter
+    
+    if city_code.startswith("c"):
+        for city in service.get_cities(archived=archived):
+            if short_hash(city) == city_code[1:]:
+                return MappingFilter(city=city, archived=archived), f"город {city}"
+    if list_filter == "up":
+        return MappingFilter(upcoming=True), "ближайшие спектакли"
+    return MappingFilter(archived=archived), ""
+
+
+async def _show_mapping_list(callback: CallbackQuery, list_filter: str = "all", sort: str = "slug", page: int = 0):
+    """Показать страницу списка маппингов с учетом фильтра и сортировки"""
+    mapping_filter, filter_title = _parse_list_filter(list_filter)
+    mappings, total = get_link_mappings_service().list_mappings(
+        page=page,
+        per_page=MAPPINGS_PER_PAGE,
+        sort=sort,
+        mapping_filter=mapping_filter
+    )
+    
+    if not total and list_filter == "all":
+        text = "📋 Список маппингов пуст.\n\nИспользуйте кнопку '➕ Добавить маппинг' для создания нового."
+        await callback.message.edit_text(text, reply_markup=get_admin_menu_keyboard())
+        return
+    
+    if mapping_filter.archived:
+        title = f"🗄 Архив прошедших спектаклей (всего: {total})\n\nСсылки из архива продолжают работать."
+    else:
+        title = f"📋 Список маппингов (всего: {total})"
+    if filter_title:
+        title += f"\nФильтр: {filter_title}"
+    text = f"{title}\n\nВыберите маппинг для просмотра:"
+    await callback.message.edit_text(
+        text,
+        reply_markup=get_mapping_list_keyboard(
+            mappings,
+            page=page,
+            per_page=MAPPINGS_PER_PAGE,
+            total=total,
+            list_filter=list_filter,
+            sort=sort
+        )
+    )
+
+
 @router.callback_query(F.data == "admin_list_mappings")
-async def list_mappings_callback(callback: CallbackQuery, db: Database, config: Config):
-    """Показать список всех маппингов"""
+async def list_mappings_callback(callback: CallbackQuery, config: Config):
+    """Показать список активных маппингов"""
     user_id = callback.from_user.id
     
     if not is_admin(user_id, config):
@@ -87,52 +389,71 @@ async def list_mappings_callback(callback: CallbackQuery, db: Database, config:
         return
     
     logger.info(f"Администратор {user_id} запросил список маппингов")
-    mappings = await db.get_all_link_mappings()
+    await _show_mapping_list(callback)
+    await callback.answer()
+
+
+@router.callback_query(F.data == "admin_list_archive")
+async def list_archived_mappings_callback(callback: CallbackQuery, config: Config):
+    """Показать архив маппингов (прошедшие спектакли)"""
+    user_id = callback.from_user.id
     
-    if not mappings:
-        text = "📋 Список маппингов пуст.\n\nИспользуйте кнопку '➕ Добавить маппинг' для создания нового."
-        await callback.message.edit_text(text, reply_markup=get_admin_menu_keyboard())
-        await callback.answer()
+    if not is_admin(user_id, config):
+        await callback.answer("❌ Нет доступа", show_alert=True)
         return
     
-    text = f"📋 Список маппингов (всего: {len(mappings)})\n\nВыберите маппинг для просмотра:"
-    await callback.message.edit_text(text, reply_markup=get_mapping_list_keyboard(mappings))
+    logger.info(f"Администратор {user_id} запросил архив маппингов")
+    await _show_mapping_list(callback, list_filter="arch")
     await callback.answer()
 
 
 @router.callback_query(F.data.startswith("admin_list_page_"))
-async def list_mappings_page_callback(callback: CallbackQuery, db: Database, config: Config):
-    """Пагинация списка маппингов"""
+async def list_mappings_page_callback(callback: CallbackQuery, config: Config):
+    """Пагинация, фильтрация и сортировка списка маппингов
+    
+    Формат callback_data: admin_list_page_{фильтр}_{сортировка}_{страница}
+    """
     user_id = callback.from_user.id
     
     if not is_admin(user_id, config):
         await callback.answer("❌ Нет доступа", show_alert=True)
         return
     
-    page = int(callback.data.split("_")[-1])
-    mappings = await db.get_all_link_mappings()
+    try:
+        list_filter, sort, page = callback.data[len("admin_list_page_"):].split("_")
+        page = int(page)
+    except ValueError:
+        list_filter, sort, page = "all", "slug", 0
     
-    text = f"📋 Список маппингов (всего: {len(mappings)})\n\nВыберите маппинг для просмотра:"
-    await callback.message.edit_text(text, reply_markup=get_mapping_list_keyboard(mappings, page=page))
+    await _show_mapping_list(callback, list_filter=list_filter, sort=sort, page=page)
     await callback.answer()
 
 
-@router.callback_query(F.data.startswith("admin_view_mapping_"))
-async def view_mapping_callback(callback: CallbackQuery, db: Database, config: Config):
-    """Просмотр деталей маппинга"""
+@router.callback_query(F.data.startswith("admin_list_cities_"))
+async def list_mappings_cities_callback(callback: CallbackQuery, config: Config):
+    """Выбор города для фильтра списка маппингов"""
     user_id = callback.from_user.id
     
     if not is_admin(user_id, config):
         await callback.answer("❌ Нет доступа", show_alert=True)
         return
     
-    slug = callback.data.replace("admin_view_mapping_", "")
-    mapping = await db.get_link_mapping(slug)
-    
-    if not mapping:
-        await callback.answer("❌ Маппинг не найден", show_alert=True)
+    archived = callback.data.endswith("_arch")
+    cities = get_link_mappings_service().get_cities(archived=archived)
+    if not cities:
+        await callback.answer("Нет маппингов с указанным городом", show_alert=True)
         return
     
+    await callback.message.edit_text(
+        "🏙 Выберите город для фильтра:",
+        reply_markup=get_mapping_city_filter_keyboard(cities, archived=archived)
+    )
+    await callback.answer()
+
+
+def _format_mapping_details(mapping: dict, config: Config) -> str:
+    """Текст с деталями маппинга (для просмотра и inline-поиска)"""
+    slug = mapping['slug']
     # Формируем ссылку на бота с этим slug
     bot_link = f"https://t.me/{config.bot_username}?start={slug}"
     
@@ -150,11 +471,59 @@ async def view_mapping_callback(callback: CallbackQuery, db: Database, config: C
         f"📝 Создан: {mapping.get('created_at', 'N/A')}\n"
         f"🔄 Обновлен: {mapping.get('updated_at', 'N/A')}"
     )
+    if mapping.get('archived'):
+        text += f"\n🗄 В архиве с: {mapping.get('archived_at', 'N/A')}"
+    return text
+
+
+@router.callback_query(F.data.startswith("admin_view_mapping_"))
+async def view_mapping_callback(callback: CallbackQuery, db: Database, config: Config):
+    """Просмотр деталей маппинга"""
+    user_id = callback.from_user.id
+    
+    if not is_admin(user_id, config):
+        await callback.answer("❌ Нет доступа", show_alert=True)
+        return
+    
+    slug = callback.data.replace("admin_view_mapping_", "")
+    mapping = await db.get_link_mapping(slug)
+    
+    if not mapping:
+        await callback.answer("❌ Маппинг не найден", show_alert=True)
+        return
     
-    await callback.message.edit_text(text, reply_markup=get_mapping_actions_keyboard(slug), parse_mode="HTML")
+    text = _format_mapping_details(mapping, config)
+    archived = bool(mapping.get('archived'))
+    await callback.message.edit_text(text, reply_markup=get_mapping_actions_keyboard(slug, archived=archived), parse_mode="HTML")
     await callback.answer()
 
 
+@router.inline_query()
+async def search_mappings_inline(inline_query: InlineQuery, config: Config):
+    """Inline-поиск маппингов по началу slug (@bot <префикс>)"""
+    if not is_admin(inline_query.from_user.id, config):
+        await inline_query.answer([], cache_time=60, is_personal=True)
+        return
+    
+    service = get_link_mappings_service()
+    mappings = service.search_slugs(inline_query.query, limit=INLINE_SEARCH_LIMIT)
+    results = []
+    for mapping in mappings:
+        archived_mark = "🗄 " if mapping.get('archived') else ""
+        results.append(InlineQueryResultArticle(
+            # id ограничен 64 байтами, а slug может быть длинным и на кириллице
+            id=("arch_" if mapping.get('archived') else "") + short_hash(mapping['slug'], 40),
+            title=f"{archived_mark}{mapping['slug']} — {mapping['city']}",
+            description=f"{mapping['project']}, {mapping.get('show_datetime') or 'дата не указана'}",
+            input_message_content=InputTextMessageContent(
+                message_text=_format_mapping_details(mapping, config),
+                parse_mode="HTML"
+            )
+        ))
+    
+    await inline_query.answer(results, cache_time=0, is_personal=True)
+
+
 @router.callback_query(F.data.startswith("admin_delete_"))
 async def delete_mapping_callback(callback: CallbackQuery, db: Database, config: Config):
     """Подтверждение удаления маппинга"""
@@ -204,13 +573,7 @@ async def confirm_delete_callback(callback: CallbackQuery, db: Database, config:
         # Возвращаемся к списку через 2 секунды
         import asyncio
         await asyncio.sleep(2)
-        mappings = await db.get_all_link_mappings()
-        if mappings:
-            text = f"📋 Список маппингов (всего: {len(mappings)})\n\nВыберите маппинг для просмотра:"
-            await callback.message.edit_text(text, reply_markup=get_mapping_list_keyboard(mappings))
-        else:
-            text = "📋 Список маппингов пуст.\n\nИспользуйте кнопку '➕ Добавить маппинг' для создания нового."
-            await callback.message.edit_text(text, reply_markup=get_admin_menu_keyboard())
+        await _show_mapping_list(callback)
     except Exception as e:
         logger.error(f"Ошибка при удалении маппинга {slug}: {e}")
         await callback.answer("❌ Ошибка при удалении", show_alert=True)
@@ -741,6 +1104,18 @@ async def admin_stats_funnel_callback(callback: CallbackQuery, db: Database, con
                 f"9️⃣ Подтвердили email: {funnel['confirmed_email']['count']} ({funnel['confirmed_email']['percentage']}%)\n"
                 f"🔟 Получили промокод: {funnel['got_promo']['count']} ({funnel['got_promo']['percentage']}%)\n"
             )
+            
+            # Что стало со сделками после бота (по данным синхронизации с AmoCRM)
+            leads = await db.get_crm_lead_stats()
+            if leads['total']:
+                text += (
+                    f"\n<b>Сделки в AmoCRM:</b>\n"
+                    f"📨 Создано ботом: {leads['total']}\n"
+                    f"⏳ В работе: {leads['open']}\n"
+                    f"✅ Успешно реализовано: {leads['won']} ({round(leads['won'] / leads['total'] * 100, 2)}%)\n"
+                    f"❌ Не реализовано: {leads['lost']}\n"
+                    f"👥 Пользователей с успешной сделкой: {leads['users']}\n"
+                )
         
         await callback.message.edit_text(text, reply_markup=get_statistics_menu_keyboard(), parse_mode="HTML")
         await callback.answer()
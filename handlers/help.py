@@ -8,7 +8,6 @@ from logger import get_logger
 logger = get_logger(__name__)
 router = Router()
 
-
 @router.callback_query(F.data == "how_to_apply_promo")
 async def how_to_apply_promo(callback: CallbackQuery, db: Database, config: Config):
     """Инструкция по применению промокода"""
@@ -22,10 +21,11 @@ async def how_to_apply_promo(callback: CallbackQuery, db: Database, config: Conf
     if user:
         promo_code = user.get('promo_code')
     
-    # Если у пользователя нет промокода, используем общий из настроек
+    # Если у пользователя нет промокода, используем промокод из настроек для его города/проекта
     if not promo_code:
-        settings_service = get_bot_settings_service()
-        promo_code = settings_service.get_promo_code()
+        promo_code = get_bot_settings_service().resolve(
+            user.get('city') if user else None, user.get('project') if user else None
+        ).promo_code
     
     # Получаем ссылку на выбор мест в зависимости от города и проекта пользователя
     default_seat_url = "https://teatrfest2.edinoepole.ru/api/v1/pages/default_landing_page?unifd-date=&unifd-event-id=80&unifd-refer=tg-bot"
@@ -109,19 +109,17 @@ async def hotline(callback: CallbackQuery, db: Database, config: Config):
     user_id = callback.from_user.id
     logger.debug(f"Пользователь {user_id} запросил информацию о горячей линии")
     
-    # Получаем город пользователя из БД
+    # Получаем город и проект пользователя из БД
     user = await db.get_user(user_id)
     city = user.get('city', '') if user else ''
+    project = user.get('project', '') if user else ''
     
-    # Определяем телефон по городу (используем функцию из handlers/menu.py)
-    from handlers.menu import get_phone_by_city
-    hotline_phone = get_phone_by_city(city)
+    # Настройки для города/проекта: телефон уже подставлен, строки с email убраны
+    resolved = get_bot_settings_service().resolve(city, project)
+    hotline_phone = resolved.hotline_phone
     logger.debug(f"Определен телефон для горячей линии города '{city}': {hotline_phone}")
     
-    # Получаем текст контактов из настроек
-    settings_service = get_bot_settings_service()
-    contacts_text = settings_service.get_contacts_text()
-    
+    contacts_text = resolved.hotline_text
     if not contacts_text:
         # Fallback на дефолтный текст, если настройки не заданы
         contacts_text = (
@@ -134,23 +132,6 @@ async def hotline(callback: CallbackQuery, db: Database, config: Config):
             "📱 <b>Мы в социальных сетях:</b>\n"
             "Следите за новостями и анонсами спектаклей в наших социальных сетях."
         )
-    else:
-        # Заменяем телефон в тексте на правильный для города пользователя
-        # Заменяем оба возможных телефона на нужный
-        contacts_text = contacts_text.replace("8 (800) 505-51-49", hotline_phone)
-        contacts_text = contacts_text.replace("8 (800) 555-48-52", hotline_phone)
-        # Также заменяем телефон из config, если он там есть
-        if config.hotline_phone:
-            contacts_text = contacts_text.replace(config.hotline_phone, hotline_phone)
-    
-    # Убираем Email из текста, если он там есть
-    import re
-    # Удаляем строки с Email (различные варианты написания)
-    contacts_text = re.sub(r'.*[Ee]mail[:\s]*[^\n]*\n?', '', contacts_text)
-    contacts_text = re.sub(r'.*[Ээ]лектронная почта[:\s]*[^\n]*\n?', '', contacts_text)
-    contacts_text = re.sub(r'.*[Пп]очта[:\s]*[^\n]*\n?', '', contacts_text)
-    # Убираем лишние пустые строки
-    contacts_text = re.sub(r'\n{3,}', '\n\n', contacts_text)
     
     # Создаем клавиатуру с кнопками для социальных сетей
     from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
@@ -81,10 +81,9 @@ async def my_promo_code_handler(message: Message, db: Database, config: Config):
     
     promo_code = user.get('promo_code')
     
-    # Если у пользователя нет промокода в БД, используем общий промокод из настроек
+    # Если у пользователя нет промокода в БД, используем промокод из настроек для его города/проекта
     if not promo_code:
-        settings_service = get_bot_settings_service()
-        promo_code = settings_service.get_promo_code()
+        promo_code = get_bot_settings_service().resolve(user.get('city'), user.get('project')).promo_code
         logger.debug(f"Пользователь {user_id} не имеет промокода в БД, используется общий: {promo_code}")
     
     project = user.get('project', 'Спектакль')
@@ -154,10 +153,11 @@ async def how_to_apply_promo_handler(message: Message, db: Database, config: Con
     if user:
         promo_code = user.get('promo_code')
     
-    # Если у пользователя нет промокода, используем общий из настроек
+    # Если у пользователя нет промокода, используем промокод из настроек для его города/проекта
     if not promo_code:
-        settings_service = get_bot_settings_service()
-        promo_code = settings_service.get_promo_code()
+        promo_code = get_bot_settings_service().resolve(
+            user.get('city') if user else None, user.get('project') if user else None
+        ).promo_code
     
     # Получаем ссылку на выбор мест в зависимости от города и проекта пользователя
     default_seat_url = "https://teatrfest2.edinoepole.ru/api/v1/pages/default_landing_page?unifd-date=&unifd-event-id=80&unifd-refer=tg-bot"
@@ -245,24 +245,24 @@ async def faq_handler(message: Message, db: Database, config: Config):
     if user:
         promo_code = user.get('promo_code')
     
-    # Если у пользователя нет промокода, используем общий из настроек
-    if not promo_code:
-        settings_service = get_bot_settings_service()
-        promo_code = settings_service.get_promo_code()
-    
-    # Получаем город пользователя из БД для определения номера телефона
+    # Получаем город и проект пользователя из БД для выбора настроек
     city = user.get('city', '') if user else ''
+    project = user.get('project', '') if user else ''
     
-    # Определяем телефон по городу
-    hotline_phone = get_phone_by_city(city)
+    # Настройки для города/проекта: телефон в текстах уже подставлен
+    resolved = get_bot_settings_service().resolve(city, project)
+    hotline_phone = resolved.hotline_phone
     logger.debug(f"Определен телефон для FAQ города '{city}': {hotline_phone}")
     
+    # Если у пользователя нет промокода, используем промокод из настроек
+    if not promo_code:
+        promo_code = resolved.promo_code
+    
     # Используем фиксированную ссылку для кнопки "Перейти на официальный сайт организатора"
     official_site_url = "https://love-teatrfest.ru/?utm_source=tg-bot"
     
     # Получаем текст FAQ из настроек
-    settings_service = get_bot_settings_service()
-    faq_text = settings_service.get_faq_text()
+    faq_text = resolved.faq_text
 
     if not faq_text:
         # Дефолтный текст FAQ
@@ -302,10 +302,6 @@ async def faq_handler(message: Message, db: Database, config: Config):
     else:
         # Заменяем промокод в тексте, если он есть в настройках
         faq_text = faq_text.replace("(указать промокод)", f"<code>{promo_code}</code>")
-        # Заменяем телефон в тексте на правильный для города пользователя
-        faq_text = faq_text.replace("8-800-505-51-49", hotline_phone)
-        faq_text = faq_text.replace("8 (800) 505-51-49", hotline_phone)
-        faq_text = faq_text.replace("8 (800) 555-48-52", hotline_phone)
     
     # Проверяем, есть ли у пользователя промокод
     user_has_promo = user and user.get('promo_code')
@@ -344,31 +340,12 @@ def get_phone_by_city(city: str) -> str:
         city: Название города
         
     Returns:
-        Номер телефона для соответствующего CRM
+        Номер телефона для соответствующего CRM (с учетом переопределений
+        в bot_settings.json). По умолчанию:
         ЭТАЖИ (city2): 8 (800) 505-51-49
         АТЛАНТ (city1): 8 (800) 555-48-52
     """
-    if not city:
-        # Если город не указан, возвращаем телефон по умолчанию (ЭТАЖИ)
-        return "8 (800) 505-51-49"
-    
-    city_lower = city.lower()
-    # Города для АТЛАНТ (city1) - все эти города используют номер 8 (800) 555-48-52
-    city1_cities = [
-        "волгоград", "volgograd",
-        "краснодар", "krasnodar",
-        "ростов-на-дону", "ростов", "rostov", "rostov-on-don",
-        "самара", "samara",
-        "сочи", "sochi",
-        "ставрополь", "stavropol",
-        "уфа", "ufa",
-    ]
-    
-    # Проверяем, относится ли город к city1 (АТЛАНТ)
-    if any(c in city_lower for c in city1_cities):
-        return "8 (800) 555-48-52"  # АТЛАНТ
-    else:
-        return "8 (800) 505-51-49"  # ЭТАЖИ
+    return get_bot_settings_service().resolve(city).hotline_phone
 
 
 @router.message(F.text == "☎️ Контакты и ссылки")
@@ -377,18 +354,17 @@ async def contacts_handler(message: Message, db: Database, config: Config):
     user_id = message.from_user.id
     logger.info(f"Пользователь {user_id} запросил контакты")
     
-    # Получаем город пользователя из БД
+    # Получаем город и проект пользователя из БД
     user = await db.get_user(user_id)
     city = user.get('city', '') if user else ''
+    project = user.get('project', '') if user else ''
     
-    # Определяем телефон по городу
-    hotline_phone = get_phone_by_city(city)
+    # Настройки для города/проекта: телефон в тексте контактов уже подставлен
+    resolved = get_bot_settings_service().resolve(city, project)
+    hotline_phone = resolved.hotline_phone
     logger.debug(f"Определен телефон для города '{city}': {hotline_phone}")
     
-    # Получаем текст контактов из настроек
-    settings_service = get_bot_settings_service()
-    contacts_text = settings_service.get_contacts_text()
-    
+    contacts_text = resolved.contacts_text
     if not contacts_text:
         # Fallback на дефолтный текст, если настройки не заданы
         contacts_text = (
@@ -401,14 +377,6 @@ async def contacts_handler(message: Message, db: Database, config: Config):
             "📱 <b>Мы в социальных сетях:</b>\n"
             "Следите за новостями и анонсами спектаклей в наших социальных сетях."
         )
-    else:
-        # Заменяем телефон в тексте на правильный для города пользователя
-        # Заменяем оба возможных телефона на нужный
-        contacts_text = contacts_text.replace("8 (800) 505-51-49", hotline_phone)
-        contacts_text = contacts_text.replace("8 (800) 555-48-52", hotline_phone)
-        # Также заменяем телефон из config, если он там есть
-        if config.hotline_phone:
-            contacts_text = contacts_text.replace(config.hotline_phone, hotline_phone)
     
     # Создаем клавиатуру с кнопками для социальных сетей
     from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
@@ -4,6 +4,7 @@ from aiogram.types import Message, CallbackQuery, FSInputFile, InputFile
 from database import Database
 from config import Config
 from keyboards import get_promo_keyboard
+from services.link_mappings import get_link_mappings_service
 from logger import get_logger
 
 logger = get_logger(__name__)
@@ -33,10 +34,6 @@ async def send_promo_code(message_or_call, db: Database, user_id: int, promo_cod
     city = user.get('city', '') if user else ''
     show_datetime = user.get('show_datetime', '') if user else ''
     
-    # Форматируем дату в читаемый формат (если есть)
-    from utils.utils import format_datetime_readable
-    formatted_date = format_datetime_readable(show_datetime) if show_datetime else ''
-    
     # Используем переданный ticket_url или из config
     final_ticket_url = ticket_url or config.ticket_url
     logger.debug(f"Используется ticket_url: {final_ticket_url}")
@@ -49,11 +46,8 @@ async def send_promo_code(message_or_call, db: Database, user_id: int, promo_cod
         f"Промокод: <code>{promo_code}</code>\n"
     )
     
-    # Добавляем город и дату, если они есть
-    if city:
-        text += f"\n🏙️ Город: {city}"
-    if formatted_date:
-        text += f"\n📅 Дата и время: {formatted_date}"
+    # Добавляем город и дату, если они есть (готовые строки из кэша маппингов)
+    text += get_link_mappings_service().get_show_render(city, project_name, show_datetime).promo_details
     
     text += (
         f"\n\nПримените его при покупке билетов, чтобы получить скидку."
@@ -6,7 +6,7 @@ from aiogram.filters import StateFilter
 from database import Database
 from utils import GENRES, SCENARIOS, generate_promo_code, validate_birthday, validate_email
 from handlers.promo import send_promo_code
-from services import create_lead_in_city
+from services.crm_outbox import notify_crm_outbox, outbox_sink_names
 from config import Config
 from states import QuestionnaireStates
 from keyboards import (
@@ -277,14 +277,13 @@ async def email_confirm_yes(callback: CallbackQuery, state: FSMContext, db: Data
         # Не вызываем callback.answer() здесь, так как уже ответили в начале
         return
     
-    # Получаем общий промокод из настроек
+    # Получаем промокод из настроек (с учетом переопределений для города/проекта пользователя)
     from services.bot_settings import get_bot_settings_service
-    settings_service = get_bot_settings_service()
-    promo_code = settings_service.get_promo_code()
+    resolved_settings = get_bot_settings_service().resolve(user.get('city'), user.get('project'))
+    promo_code = resolved_settings.promo_code
     logger.info(f"Использован общий промокод {promo_code} для пользователя {user_id}")
-    await db.update_user_promo_code(user_id, promo_code)
     
-    # Отправляем в AmoCRM
+    # Данные заявки для AmoCRM
     user_data = {
         'name': user.get('name'),
         'city': user.get('city'),
@@ -306,30 +305,16 @@ async def email_confirm_yes(callback: CallbackQuery, state: FSMContext, db: Data
         'roistat_visit': user.get('roistat_visit'),
     }
     
-    logger.info(f"Отправка заявки в AmoCRM для пользователя {user_id}")
-    
-    # Получаем telegram данные
-    telegram_username = callback.from_user.username
-    
-    # Отправляем в AmoCRM асинхронно, не ждем завершения
-    # Это позволяет пользователю быстрее получить промокод
-    async def send_to_amocrm_background():
-        """Фоновая отправка в AmoCRM с обработкой ошибок"""
-        try:
-            await create_lead_in_city(
-                user_data,
-                user.get('city', ''),
-                config.amocrm_city1,
-                config.amocrm_city2,
-                telegram_id=user_id,
-                telegram_username=telegram_username
-            )
-            logger.info(f"✅ Сделка успешно создана в AmoCRM для пользователя {user_id}")
-        except Exception as e:
-            logger.error(f"❌ Ошибка при создании сделки в AmoCRM для пользователя {user_id}: {e}", exc_info=True)
-    
-    import asyncio
-    asyncio.create_task(send_to_amocrm_background())
+    # Промокод и заявка сохраняются одной транзакцией: заявку доставит очередь (в AmoCRM
+    # и другим получателям, с повторными попытками), даже если AmoCRM недоступен или бот перезапустится
+    outbox_id = await db.issue_promo_code_with_outbox(user_id, promo_code, {
+        'user_data': user_data,
+        'city': user.get('city', ''),
+        'telegram_id': user_id,
+        'telegram_username': callback.from_user.username,
+    }, sinks=outbox_sink_names())
+    notify_crm_outbox()
+    logger.info(f"Заявка пользователя {user_id} поставлена в очередь AmoCRM (#{outbox_id})")
     
     # Получаем ссылку на выбор мест из состояния (если был передан через slug)
     # Приоритет: seat_selection_url из состояния > ticket_url из состояния > из настроек
@@ -338,9 +323,7 @@ async def email_confirm_yes(callback: CallbackQuery, state: FSMContext, db: Data
     
     # Если нет в состоянии, используем из настроек
     if not seat_selection_url:
-        from services.bot_settings import get_bot_settings_service
-        settings_service = get_bot_settings_service()
-        seat_selection_url = settings_service.get_ticket_url()
+        seat_selection_url = resolved_settings.ticket_url
     
     # Отправляем промокод
     logger.info(f"Отправка промокода пользователю {user_id}")
@@ -1,3 +1,5 @@
+from typing import Optional
+
 from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery
 from aiogram.filters import CommandStart
@@ -7,7 +9,8 @@ from database import Database
 from config import Config
 from utils import decode_deep_link
 from states import QuestionnaireStates
-from keyboards import get_start_keyboard, get_consent_keyboard, get_main_menu_keyboard
+from services.link_mappings import get_link_mappings_service
+from keyboards import get_start_keyboard, get_consent_keyboard, get_main_menu_keyboard, get_slug_suggestion_keyboard
 from logger import get_logger
 
 logger = get_logger(__name__)
@@ -43,6 +46,7 @@ async def cmd_start(message: Message, state: FSMContext, db: Database, config: C
     args = message.text.split()[1:] if len(message.text.split()) > 1 else []
     deep_link_params = None
     slug = None
+    mapping = None
     ticket_url = None
     
     if args:
@@ -80,57 +84,79 @@ async def cmd_start(message: Message, state: FSMContext, db: Database, config: C
             
             # Получаем маппинг из БД (сохраняем для использования в приветственном сообщении)
             mapping = await db.get_link_mapping(slug)
+            if not mapping:
+                # Возможно, slug набран вручную с опечаткой или в другом регистре
+                similar = await db.find_similar_link_mapping(slug)
+                if similar:
+                    # Спектакль не подменяется молча: пользователь подтверждает исправление
+                    logger.info(f"Slug {slug} похож на {similar['slug']}, запрошено подтверждение у пользователя {user_id}")
+                    await state.update_data(suggested_slug=similar['slug'])
+                    readable_datetime = get_link_mappings_service().get_show_render(
+                        similar['city'], similar['project'], similar['show_datetime']
+                    ).readable_datetime
+                    await message.answer(
+                        f"Ссылка «{slug}» не найдена. Возможно, вы имели в виду спектакль "
+                        f"«{similar['project']}» ({similar['city']}, {readable_datetime})?",
+                        reply_markup=get_slug_suggestion_keyboard()
+                    )
+                    return
             
             if mapping:
-                logger.info(f"Найден маппинг для slug {slug}: {mapping['city']} - {mapping['project']}")
-                # Сохраняем данные из маппинга в БД пользователя
-                await db.create_or_update_user_from_link(
-                    user_id=user_id,
-                    username=username,
-                    city=mapping['city'],
-                    project=mapping['project'],
-                    show_datetime=mapping['show_datetime']
-                )
-                # Сохраняем ссылку на выбор мест в состояние для использования при отправке промокода
-                # Приоритет: seat_selection_url > ticket_url
-                seat_selection_url = mapping.get('seat_selection_url') or mapping.get('ticket_url')
-                if seat_selection_url:
-                    await state.update_data(seat_selection_url=seat_selection_url)
-                    logger.debug(f"Сохранена ссылка на выбор мест для пользователя {user_id}: {seat_selection_url}")
-                logger.info(f"Данные пользователя {user_id} сохранены из маппинга slug {slug}")
+                await _apply_mapping(user_id, username, mapping, state, db)
             else:
                 logger.warning(f"Маппинг для slug {slug} не найден в БД")
     else:
         logger.debug(f"Команда /start без параметров от пользователя {user_id}")
     
+    await _send_welcome(message, user_id, db, config, mapping)
+
+
+async def _apply_mapping(user_id: int, username: str, mapping: dict, state: FSMContext, db: Database):
+    """Сохранить данные спектакля из маппинга slug в профиль пользователя"""
+    logger.info(f"Найден маппинг для slug {mapping['slug']}: {mapping['city']} - {mapping['project']}")
+    # Сохраняем данные из маппинга в БД пользователя
+    await db.create_or_update_user_from_link(
+        user_id=user_id,
+        username=username,
+        city=mapping['city'],
+        project=mapping['project'],
+        show_datetime=mapping['show_datetime']
+    )
+    # Сохраняем ссылку на выбор мест в состояние для использования при отправке промокода
+    # Приоритет: seat_selection_url > ticket_url
+    seat_selection_url = mapping.get('seat_selection_url') or mapping.get('ticket_url')
+    if seat_selection_url:
+        await state.update_data(seat_selection_url=seat_selection_url)
+        logger.debug(f"Сохранена ссылка на выбор мест для пользователя {user_id}: {seat_selection_url}")
+    logger.info(f"Данные пользователя {user_id} сохранены из маппинга slug {mapping['slug']}")
+
+
+async def _send_welcome(message: Message, user_id: int, db: Database, config: Config, mapping: Optional[dict]):
+    """Отправить приветствие и основное меню
+    
+    Args:
+        message: Сообщение, в чат которого отправляется приветствие
+        user_id: ID пользователя
+        db: База данных
+        config: Конфигурация
+        mapping: Маппинг slug, по которому пришел пользователь (None - без slug)
+    """
     # Получаем информацию о проекте из БД или используем значение по умолчанию
     user = await db.get_user(user_id)
     project_name = user.get('project', 'спектакль') if user else 'спектакль'
     city = user.get('city', '') if user else ''
     show_datetime = user.get('show_datetime', '') if user else ''
     
-    # Формируем информацию о проекте, если она есть
+    # Формируем информацию о проекте, если она есть (блок берется из кэша маппингов)
     project_info = ""
-    if slug and mapping:
+    if mapping:
         # Если пользователь пришел по ссылке с slug, показываем детали проекта
-        from utils.utils import format_datetime_readable
-        formatted_datetime = format_datetime_readable(mapping['show_datetime']) if mapping.get('show_datetime') else ''
-        project_info = (
-            f"\n\n📋 Информация о вашем спектакле:\n"
-            f"🏙️ Город: {mapping['city']}\n"
-            f"🎭 Спектакль: {mapping['project']}\n"
-            f"📅 Дата и время: {formatted_datetime}\n"
-        )
+        project_info = get_link_mappings_service().get_show_render(
+            mapping['city'], mapping['project'], mapping['show_datetime']
+        ).project_info
     elif city and project_name and show_datetime:
         # Если данные есть в БД, но нет маппинга (старая ссылка)
-        from utils.utils import format_datetime_readable
-        formatted_datetime = format_datetime_readable(show_datetime)
-        project_info = (
-            f"\n\n📋 Информация о вашем спектакле:\n"
-            f"🏙️ Город: {city}\n"
-            f"🎭 Спектакль: {project_name}\n"
-            f"📅 Дата и время: {formatted_datetime}\n"
-        )
+        project_info = get_link_mappings_service().get_show_render(city, project_name, show_datetime).project_info
     
     # Приветственное сообщение согласно ТЗ
     welcome_text = (
@@ -155,6 +181,30 @@ async def cmd_start(message: Message, state: FSMContext, db: Database, config: C
     await message.answer("Используйте меню ниже для навигации:", reply_markup=get_main_menu_keyboard(user_id, config))
 
 
+@router.callback_query(F.data.in_({"slug_suggestion_yes", "slug_suggestion_no"}))
+async def slug_suggestion_callback(callback: CallbackQuery, state: FSMContext, db: Database, config: Config):
+    """Ответ на вопрос, тот ли спектакль имелся в виду при опечатке в slug"""
+    user_id = callback.from_user.id
+    data = await state.get_data()
+    suggested_slug = data.get('suggested_slug')
+    await state.update_data(suggested_slug=None)
+    
+    mapping = None
+    if callback.data == "slug_suggestion_yes" and suggested_slug:
+        mapping = await db.get_link_mapping(suggested_slug)
+        if mapping:
+            logger.info(f"Пользователь {user_id} подтвердил исправленный slug {suggested_slug}")
+            await _apply_mapping(user_id, callback.from_user.username, mapping, state, db)
+        else:
+            logger.warning(f"Маппинг для подтвержденного slug {suggested_slug} больше не существует")
+    else:
+        logger.info(f"Пользователь {user_id} отклонил исправленный slug {suggested_slug}")
+    
+    await callback.message.edit_reply_markup(reply_markup=None)
+    await callback.answer()
+    await _send_welcome(callback.message, user_id, db, config, mapping)
+
+
 @router.callback_query(F.data == "start_questionnaire")
 async def start_questionnaire_callback(callback: CallbackQuery, state: FSMContext, db: Database):
     """Обработчик кнопки 'Заполнить мой райдер'"""
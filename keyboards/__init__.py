@@ -1,5 +1,6 @@
 from keyboards.inline import (
     get_start_keyboard,
+    get_slug_suggestion_keyboard,
     get_consent_keyboard,
     get_gender_keyboard,
     get_genres_keyboard,
@@ -12,6 +13,7 @@ from keyboards.menu import get_main_menu_keyboard
 
 __all__ = [
     'get_start_keyboard',
+    'get_slug_suggestion_keyboard',
     'get_consent_keyboard',
     'get_gender_keyboard',
     'get_genres_keyboard',
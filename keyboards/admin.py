@@ -1,6 +1,8 @@
 """Клавиатуры для админ-панели"""
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 
+from utils.admin import short_hash
+
 
 def get_admin_menu_keyboard() -> InlineKeyboardMarkup:
     """Главное меню админ-панели"""
@@ -15,16 +17,32 @@ def get_admin_menu_keyboard() -> InlineKeyboardMarkup:
     ])
 
 
-def get_mapping_list_keyboard(mappings: list, page: int = 0, per_page: int = 10) -> InlineKeyboardMarkup:
-    """Клавиатура для списка маппингов с пагинацией"""
+def get_mapping_list_keyboard(
+    mappings: list,
+    page: int = 0,
+    per_page: int = 10,
+    total: int = 0,
+    list_filter: str = "all",
+    sort: str = "slug"
+) -> InlineKeyboardMarkup:
+    """Клавиатура для списка маппингов с пагинацией
+    
+    Args:
+        mappings: Маппинги текущей страницы
+        page: Номер страницы
+        per_page: Количество маппингов на странице
+        total: Общее количество маппингов по фильтру
+        list_filter: Код фильтра: all, up (ближайшие), c<хэш> (город),
+            arch (архив), archc<хэш> (город в архиве)
+        sort: Сортировка: slug или date
+    """
+    archived = list_filter.startswith("arch")
+    city_filter = list_filter.startswith("c") or list_filter.startswith("archc")
     buttons = []
-    start_idx = page * per_page
-    end_idx = start_idx + per_page
     
-    for mapping in mappings[start_idx:end_idx]:
+    for mapping in mappings:
         slug = mapping['slug']
         city = mapping['city']
-        project = mapping['project'][:30] + "..." if len(mapping['project']) > 30 else mapping['project']
         buttons.append([
             InlineKeyboardButton(
                 text=f"{slug} - {city}",
@@ -33,26 +51,87 @@ def get_mapping_list_keyboard(mappings: list, page: int = 0, per_page: int = 10)
         ])
     
     # Кнопки навигации
+    page_prefix = f"admin_list_page_{list_filter}_{sort}_"
     nav_buttons = []
     if page > 0:
-        nav_buttons.append(InlineKeyboardButton(text="◀️ Назад", callback_data=f"admin_list_page_{page-1}"))
-    if end_idx < len(mappings):
-        nav_buttons.append(InlineKeyboardButton(text="Вперед ▶️", callback_data=f"admin_list_page_{page+1}"))
+        nav_buttons.append(InlineKeyboardButton(text="◀️ Назад", callback_data=f"{page_prefix}{page-1}"))
+    if (page + 1) * per_page < total:
+        nav_buttons.append(InlineKeyboardButton(text="Вперед ▶️", callback_data=f"{page_prefix}{page+1}"))
     
     if nav_buttons:
         buttons.append(nav_buttons)
     
+    # Фильтры и сортировка
+    def mark(code: str, text: str) -> str:
+        return f"✅ {text}" if list_filter == code else text
+    
+    city_button = InlineKeyboardButton(
+        text="✅ 🏙 Город" if city_filter else "🏙 Город",
+        callback_data="admin_list_cities_arch" if archived else "admin_list_cities_all"
+    )
+    if archived:
+        buttons.append([
+            InlineKeyboardButton(text=mark("arch", "Весь архив"), callback_data=f"admin_list_page_arch_{sort}_0"),
+            city_button,
+        ])
+    else:
+        buttons.append([
+            InlineKeyboardButton(text=mark("all", "Все"), callback_data=f"admin_list_page_all_{sort}_0"),
+            InlineKeyboardButton(text=mark("up", "🗓 Ближайшие"), callback_data="admin_list_page_up_date_0"),
+            city_button,
+        ])
+    other_sort, sort_text = ("date", "по slug") if sort == "slug" else ("slug", "по дате")
+    buttons.append([
+        InlineKeyboardButton(
+            text=f"↕️ Сортировка: {sort_text}",
+            callback_data=f"admin_list_page_{list_filter}_{other_sort}_0"
+        )
+    ])
+    
+    # Inline-поиск по началу slug: открывает "@bot " в текущем чате
+    buttons.append([InlineKeyboardButton(text="🔎 Поиск по slug", switch_inline_query_current_chat="")])
+    
+    if archived:
+        buttons.append([InlineKeyboardButton(text="📋 Активные маппинги", callback_data="admin_list_mappings")])
+    else:
+        buttons.append([InlineKeyboardButton(text="🗄 Архив прошедших спектаклей", callback_data="admin_list_archive")])
+    
     buttons.append([InlineKeyboardButton(text="🔙 Назад в админ-панель", callback_data="admin_menu")])
     
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 
-def get_mapping_actions_keyboard(slug: str) -> InlineKeyboardMarkup:
+def get_mapping_city_filter_keyboard(cities: list, archived: bool = False) -> InlineKeyboardMarkup:
+    """Клавиатура выбора города для фильтра списка маппингов
+    
+    Args:
+        cities: Отсортированный список городов (в callback передается хэш названия,
+            поэтому фильтр не съезжает, если список городов изменился)
+        archived: True, если фильтр применяется к архиву
+    """
+    buttons = []
+    row = []
+    for city in cities:
+        code = f"archc{short_hash(city)}" if archived else f"c{short_hash(city)}"
+        row.append(InlineKeyboardButton(text=city, callback_data=f"admin_list_page_{code}_date_0"))
+        if len(row) == 2:
+            buttons.append(row)
+            row = []
+    if row:
+        buttons.append(row)
+    
+    back_callback = "admin_list_archive" if archived else "admin_list_mappings"
+    buttons.append([InlineKeyboardButton(text="🔙 Назад к списку", callback_data=back_callback)])
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
+
+
+def get_mapping_actions_keyboard(slug: str, archived: bool = False) -> InlineKeyboardMarkup:
     """Клавиатура действий с маппингом"""
+    back_callback = "admin_list_archive" if archived else "admin_list_mappings"
     return InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="✏️ Редактировать", callback_data=f"admin_edit_{slug}")],
         [InlineKeyboardButton(text="🗑️ Удалить", callback_data=f"admin_delete_{slug}")],
-        [InlineKeyboardButton(text="🔙 Назад к списку", callback_data="admin_list_mappings")]
+        [InlineKeyboardButton(text="🔙 Назад к списку", callback_data=back_callback)]
     ])
 
 
@@ -8,6 +8,16 @@ def get_start_keyboard() -> InlineKeyboardMarkup:
     ])
 
 
+def get_slug_suggestion_keyboard() -> InlineKeyboardMarkup:
+    """Клавиатура подтверждения исправленного slug (ссылка набрана с опечаткой)"""
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [
+            InlineKeyboardButton(text="✅ Да, это мой спектакль", callback_data="slug_suggestion_yes"),
+            InlineKeyboardButton(text="❌ Нет", callback_data="slug_suggestion_no")
+        ]
+    ])
+
+
 def get_consent_keyboard() -> InlineKeyboardMarkup:
     """Клавиатура для согласия на обработку данных"""
     return InlineKeyboardMarkup(inline_keyboard=[
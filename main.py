@@ -1,12 +1,30 @@
 import asyncio
 import logging
+import signal
+from typing import Dict, Optional
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.fsm.storage.base import BaseEventIsolation, BaseStorage
+from aiogram.fsm.storage.memory import MemoryStorage, SimpleEventIsolation
+from aiogram.methods import TelegramMethod
 
-from config import Config
-from database import Database
+from config import Config, get_config, reload_config, subscribe_config
+from database import Database, SQLiteStorage
 from middleware import DatabaseMiddleware, ConfigMiddleware
 from handlers import start, questionnaire, help, menu, admin
+from services.link_mappings import run_mappings_archiver
+from services.amocrm import init_amocrm_sessions, close_amocrm_sessions, warm_pipeline_cache
+from services.crm_outbox import start_crm_outbox, stop_crm_outbox
+from services.lead_sinks import build_lead_sinks
+from services.crm_sync import run_crm_lead_sync
+from services.city_routing import get_city_router, reload_city_router
+from services.task_supervisor import get_task_supervisor, shutdown_task_supervisor
+from services.webhook_server import WEBHOOK_UPDATE_CATEGORY, run_webhook, validate_webhook_config
+from services.sharded_workers import (
+    WORKER_UPDATE_CATEGORY, WorkerPool, serve_worker, run_front_polling, run_front_webhook,
+    install_worker_signal_handlers,
+)
 from logger import setup_logger, configure_root_logging
 
 # Настраиваем максимальное логирование для всего проекта
@@ -15,6 +33,109 @@ configure_root_logging(level=logging.DEBUG)
 logger = setup_logger(__name__)
 
 
+def create_bot(config: Config) -> Bot:
+    """Создать бота (с адресом Bot API из TELEGRAM_API_URL, если задан)"""
+    if config.telegram_api_url:
+        session = AiohttpSession(api=TelegramAPIServer.from_base(config.telegram_api_url))
+        return Bot(token=config.bot_token, session=session)
+    return Bot(token=config.bot_token)
+
+
+def create_fsm_storage(config: Config) -> BaseStorage:
+    """Хранилище состояний FSM по настройке FSM_STORAGE"""
+    if config.fsm_storage == "memory":
+        return MemoryStorage()
+    return SQLiteStorage(
+        config.fsm_storage_path,
+        cache_size=config.fsm_cache_size,
+        ttl=config.fsm_state_ttl_days * 86400,
+    )
+
+
+def create_dispatcher(db: Database, storage: Optional[BaseStorage] = None,
+                      events_isolation: Optional[BaseEventIsolation] = None) -> Dispatcher:
+    """Создать диспетчер с middleware и роутерами бота
+    
+    Args:
+        db: База данных, передаваемая в обработчики
+        storage: Хранилище состояний FSM (по умолчанию - в памяти)
+        events_isolation: Изоляция событий одного пользователя (по умолчанию - без изоляции)
+    """
+    dp = Dispatcher(storage=storage or MemoryStorage(), events_isolation=events_isolation)
+    logger.debug(f"Dispatcher initialized with {type(dp.storage).__name__}")
+    
+    # Регистрируем middleware
+    logger.debug("Регистрация middleware...")
+    dp.message.middleware(DatabaseMiddleware(db))
+    dp.callback_query.middleware(DatabaseMiddleware(db))
+    # ConfigMiddleware без аргумента передает текущий снимок get_config(),
+    # поэтому перезагрузка конфигурации подхватывается без перезапуска
+    dp.message.middleware(ConfigMiddleware())
+    dp.callback_query.middleware(ConfigMiddleware())
+    dp.inline_query.middleware(ConfigMiddleware())
+    logger.debug("Middleware зарегистрированы")
+    
+    # Регистрируем роутеры
+    logger.debug("Регистрация роутеров...")
+    dp.include_router(start.router)
+    dp.include_router(questionnaire.router)
+    dp.include_router(help.router)
+    dp.include_router(menu.router)
+    dp.include_router(admin.router)
+    logger.info("Роутеры зарегистрированы")
+    return dp
+
+
+async def worker_main(index: int, socket_path: str):
+    """Процесс-обработчик (BOT_WORKERS > 1): обрабатывает обновления, полученные от основного процесса
+    
+    Args:
+        index: Номер процесса
+        socket_path: Unix-сокет, через который основной процесс передает обновления
+    """
+    config = get_config()
+    logger.info(f"Запуск процесса-обработчика {index}")
+    install_worker_signal_handlers(reload_config)
+    get_city_router(config.city_routing_path)
+    subscribe_config(lambda _config: reload_city_router())
+    
+    bot = create_bot(config)
+    # Схему БД создал основной процесс; заявки доставляет его очередь, а к AmoCRM
+    # обращается только он (команды администратора передаются ему)
+    db = Database(config.database_path)
+    # Изоляция сохраняет порядок обработки обновлений одного пользователя
+    dp = create_dispatcher(db, create_fsm_storage(config), SimpleEventIsolation())
+    supervisor = get_task_supervisor()
+    supervisor.set_limit(WORKER_UPDATE_CATEGORY, config.max_concurrent_updates)
+    workflow_data = {"dispatcher": dp, "bots": [bot], "bot": bot, **dp.workflow_data}
+    
+    async def process_update(update: Dict):
+        result = await dp.feed_raw_update(bot, update)
+        if isinstance(result, TelegramMethod):
+            await dp.silent_call_request(bot, result)
+    
+    def handle_update(update: Dict):
+        try:
+            supervisor.spawn(process_update(update), WORKER_UPDATE_CATEGORY, name=f"update_{update.get('update_id')}")
+        except RuntimeError as e:
+            logger.warning(str(e))
+    
+    await dp.emit_startup(**workflow_data)
+    try:
+        await serve_worker(socket_path, handle_update)
+    finally:
+        await shutdown_task_supervisor(config.task_drain_timeout)
+        await dp.emit_shutdown(**workflow_data)
+        await dp.storage.close()
+        await bot.session.close()
+        logger.info(f"Процесс-обработчик {index} остановлен")
+
+
+def run_worker_process(index: int, socket_path: str):
+    """Точка входа процесса-обработчика (запускается WorkerPool)"""
+    asyncio.run(worker_main(index, socket_path))
+
+
 async def main():
     """Главная функция запуска бота"""
     logger.info("=" * 60)
@@ -23,46 +144,66 @@ async def main():
     
     # Загружаем конфигурацию
     logger.debug("Загрузка конфигурации...")
-    config = Config.load()
+    config = get_config()
     
     if not config.bot_token:
         logger.error("BOT_TOKEN не установлен в .env файле")
         return
     
+    if config.bot_mode not in ("polling", "webhook"):
+        logger.error(f"Неизвестный BOT_MODE={config.bot_mode}: допустимы polling и webhook")
+        return
+    if config.bot_mode == "webhook":
+        webhook_error = validate_webhook_config(config)
+        if webhook_error:
+            logger.error(webhook_error)
+            return
+    
     logger.info(f"✅ Config loaded successfully: DB={config.database_path} BOT_USERNAME={config.bot_username}")
-    logger.debug(f"Admin IDs: {config.admin_ids}")
+    logger.debug(f"Admin IDs: {sorted(config.admin_ids)}")
     logger.debug(f"Link mappings path: {config.link_mappings_path}")
     
+    # Маршрутизация городов по аккаунтам AmoCRM; файл перечитывается при перезагрузке конфигурации
+    get_city_router(config.city_routing_path)
+    subscribe_config(lambda _config: reload_city_router())
+    
     # Инициализируем бота и диспетчер
     logger.debug("Инициализация бота и диспетчера...")
-    bot = Bot(token=config.bot_token)
+    bot = create_bot(config)
     logger.debug(f"Bot initialized: @{config.bot_username} (ID: {bot.id if hasattr(bot, 'id') else 'N/A'})")
     
-    dp = Dispatcher(storage=MemoryStorage())
-    logger.debug("Dispatcher initialized with MemoryStorage")
-    
     # Инициализируем базу данных
     logger.info(f"Инициализация базы данных: {config.database_path}")
     db = Database(config.database_path)
     await db.init_db()
     logger.info("✅ База данных инициализирована успешно")
     
-    # Регистрируем middleware
-    logger.debug("Регистрация middleware...")
-    dp.message.middleware(DatabaseMiddleware(db))
-    dp.callback_query.middleware(DatabaseMiddleware(db))
-    dp.message.middleware(ConfigMiddleware(config))
-    dp.callback_query.middleware(ConfigMiddleware(config))
-    logger.debug("Middleware зарегистрированы")
+    # Фоновые задачи запускаются через супервизор: он хранит ссылки на них
+    # и при остановке дожидается задач в работе
+    supervisor = get_task_supervisor()
+    # Обновления webhook обрабатываются задачами: лимит не дает пику нагрузки
+    # запустить тысячи обработчиков одновременно
+    supervisor.set_limit(WEBHOOK_UPDATE_CATEGORY, config.max_concurrent_updates)
     
-    # Регистрируем роутеры
-    logger.debug("Регистрация роутеров...")
-    dp.include_router(start.router)
-    dp.include_router(questionnaire.router)
-    dp.include_router(help.router)
-    dp.include_router(menu.router)
-    dp.include_router(admin.router)
-    logger.info("Роутеры зарегистрированы")
+    # Общие HTTP-сессии AmoCRM: соединения переиспользуются между заявками
+    await init_amocrm_sessions(config.amocrm_city1, config.amocrm_city2)
+    # Статусы воронки загружаются в фоне, чтобы не задерживать запуск бота
+    supervisor.spawn(warm_pipeline_cache(config.amocrm_city2), "crm_warmup")
+    # Очередь доставки заявок в AmoCRM и другим получателям (в т.ч. оставшихся с прошлого запуска)
+    await start_crm_outbox(db, build_lead_sinks(db, config))
+    
+    dp = create_dispatcher(db, create_fsm_storage(config))
+    
+    # Многопроцессный режим: этот процесс получает обновления и раздает их обработчикам по user_id
+    pool: Optional[WorkerPool] = None
+    if config.bot_workers > 1:
+        pool = WorkerPool(config.bot_workers, run_worker_process, db)
+        await pool.start()
+        # Конфигурация, перезагруженная в основном процессе (SIGHUP или /reload_config),
+        # перезагружается и в обработчиках
+        if hasattr(signal, "SIGHUP"):
+            subscribe_config(lambda _config: pool.forward_signal(signal.SIGHUP))
+        supervisor.spawn(pool.monitor(), "worker_monitor", cancel_on_shutdown=True)
     
     logger.info("Бот запущен и готов к работе")
     
@@ -73,19 +214,63 @@ async def main():
     ])
     logger.debug("Команды бота установлены")
     
+    # Перезагрузка конфигурации по SIGHUP (kill -HUP <pid>), кроме Windows
+    if hasattr(signal, "SIGHUP"):
+        asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, reload_config)
+        logger.debug("Обработчик SIGHUP для перезагрузки конфигурации установлен")
+    
+    # Фоновая архивация маппингов прошедших спектаклей
+    if config.mappings_archive_interval > 0:
+        supervisor.spawn(
+            run_mappings_archiver(config.mappings_archive_after_days, config.mappings_archive_interval),
+            "mappings_archiver", cancel_on_shutdown=True,
+        )
+    
+    # Синхронизация статусов сделок AmoCRM для воронки в админ-панели
+    if config.crm_lead_sync_interval > 0:
+        supervisor.spawn(run_crm_lead_sync(db, config.crm_lead_sync_interval), "crm_lead_sync", cancel_on_shutdown=True)
+    
     try:
         # Запускаем бота
         logger.info("=" * 60)
-        logger.info("Start polling")
         bot_info = await bot.get_me()
-        logger.info(f"Run polling for bot @{bot_info.username} id={bot_info.id} - '{bot_info.full_name}'")
-        logger.debug("=" * 60)
-        await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
+        if pool is not None:
+            logger.info(
+                f"Run {config.bot_mode} for bot @{bot_info.username} id={bot_info.id} "
+                f"with {config.bot_workers} worker processes"
+            )
+            logger.debug("=" * 60)
+            if config.bot_mode == "webhook":
+                await run_front_webhook(bot, pool, config, dp.resolve_used_update_types())
+            else:
+                await run_front_polling(bot, pool, dp.resolve_used_update_types())
+        elif config.bot_mode == "webhook":
+            logger.info(f"Run webhook for bot @{bot_info.username} id={bot_info.id} - '{bot_info.full_name}'")
+            logger.debug("=" * 60)
+            await run_webhook(dp, bot, config)
+        else:
+            logger.info("Start polling")
+            logger.info(f"Run polling for bot @{bot_info.username} id={bot_info.id} - '{bot_info.full_name}'")
+            logger.debug("=" * 60)
+            # getUpdates не работает, пока зарегистрирован webhook (например, после BOT_MODE=webhook)
+            await bot.delete_webhook()
+            await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
     except KeyboardInterrupt:
         logger.warning("Получен сигнал прерывания (Ctrl+C)")
     except Exception as e:
         logger.error(f"Критическая ошибка при работе бота: {e}", exc_info=True)
     finally:
+        # Сначала дожидаемся заявок и фоновых задач в работе, затем закрываем HTTP-сессии
+        drain_started = asyncio.get_running_loop().time()
+        if pool is not None:
+            # Обработчики дорабатывают полученные обновления (заявки остаются в БД для очереди)
+            await pool.stop(config.task_drain_timeout)
+        await stop_crm_outbox(config.task_drain_timeout)
+        drain_left = config.task_drain_timeout - (asyncio.get_running_loop().time() - drain_started)
+        await shutdown_task_supervisor(max(drain_left, 0))
+        # Несохраненные состояния анкеты записываются после обработки обновлений в работе
+        await dp.storage.close()
+        await close_amocrm_sessions()
         logger.info("Закрытие сессии бота...")
         await bot.session.close()
         logger.info("Бот остановлен")
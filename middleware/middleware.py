@@ -1,8 +1,8 @@
-from typing import Callable, Dict, Any, Awaitable
+from typing import Callable, Dict, Any, Awaitable, Optional
 from aiogram import BaseMiddleware
 from aiogram.types import TelegramObject
 from database import Database
-from config import Config
+from config import Config, get_config
 from logger import get_logger
 
 logger = get_logger(__name__)
@@ -25,9 +25,17 @@ class DatabaseMiddleware(BaseMiddleware):
 
 
 class ConfigMiddleware(BaseMiddleware):
-    """Middleware для передачи конфигурации в обработчики"""
+    """Middleware для передачи конфигурации в обработчики
     
-    def __init__(self, config: Config):
+    По умолчанию передает текущий снимок get_config(), поэтому после
+    reload_config() новые события сразу получают новую конфигурацию.
+    """
+    
+    def __init__(self, config: Optional[Config] = None):
+        """
+        Args:
+            config: Фиксированная конфигурация (если не указана - текущий снимок)
+        """
         self.config = config
     
     async def __call__(
@@ -36,6 +44,6 @@ class ConfigMiddleware(BaseMiddleware):
         event: TelegramObject,
         data: Dict[str, Any]
     ) -> Any:
-        data["config"] = self.config
+        data["config"] = self.config or get_config()
         return await handler(event, data)
 
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Скрипт для заполнения локального индекса контактов (таблица crm_contacts)
+контактами, уже существующими в AmoCRM.
+
+После заполнения зрители, которые есть в AmoCRM (по телефону или email),
+получают новую сделку, привязанную к существующему контакту, вместо дубля.
+
+Использование:
+    python3 scripts/backfill_contact_index.py [city1|city2]
+"""
+
+import asyncio
+import sys
+from pathlib import Path
+
+# Добавляем корневую директорию проекта в путь
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from config import Config
+from database import Database
+from services.amocrm import AmoCRM, close_amocrm_sessions
+from services.contact_index import contact_keys_from_amocrm
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+PAGE_SIZE = 250
+
+
+async def backfill_account(db: Database, amocrm: AmoCRM, crm_name: str) -> int:
+    """Загрузить все контакты аккаунта постранично и записать их в индекс
+
+    Returns:
+        Количество записанных ключей
+    """
+    subdomain = amocrm.config.subdomain
+    print(f"\n🔄 Загрузка контактов AmoCRM {crm_name} ({subdomain})...")
+
+    page = 1
+    contacts_total = 0
+    keys_total = 0
+    while True:
+        contacts = await amocrm.get_contacts_page(page, PAGE_SIZE)
+        if contacts is None:
+            print(f"❌ Ошибка на странице {page}, загрузка остановлена")
+            break
+        if not contacts:
+            break
+
+        entries = [
+            (key, contact['id'])
+            for contact in contacts
+            for key in contact_keys_from_amocrm(contact)
+        ]
+        keys_total += await db.save_crm_contacts(subdomain, entries)
+        contacts_total += len(contacts)
+        print(f"   страница {page}: контактов {len(contacts)}, ключей {len(entries)}")
+
+        if len(contacts) < PAGE_SIZE:
+            break
+        page += 1
+
+    print(f"✅ {crm_name}: обработано контактов {contacts_total}, записано ключей {keys_total}")
+    return keys_total
+
+
+async def main(accounts):
+    config = Config.load()
+    db = Database(config.database_path)
+    await db.init_db()
+
+    try:
+        if "city1" in accounts:
+            await backfill_account(db, AmoCRM(config.amocrm_city1), "АТЛАНТ")
+        if "city2" in accounts:
+            await backfill_account(db, AmoCRM(config.amocrm_city2), "ЭТАЖИ")
+    finally:
+        await close_amocrm_sessions()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] not in ("city1", "city2"):
+        print("Использование: python3 scripts/backfill_contact_index.py [city1|city2]")
+        sys.exit(1)
+    asyncio.run(main(sys.argv[1:] or ["city1", "city2"]))
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Сравнение задержки создания заявки в AmoCRM: контакт + сделка двумя запросами
+против одного запроса /api/v4/leads/complex.
+
+Запросы уходят на локальный фейковый сервер AmoCRM (scripts/fake_amocrm.py) с искусственной задержкой
+ответа (имитация сетевого RTT), поэтому реальные аккаунты не затрагиваются.
+
+Использование:
+    python3 scripts/bench_amocrm_complex.py [--requests 50] [--concurrency 1] [--rtt-ms 80]
+"""
+
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from pathlib import Path
+
+# Добавляем корневую директорию проекта в путь
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from config import AmoCRMConfig
+from services.amocrm import AmoCRM, close_amocrm_sessions, _pipeline_status_cache
+from fake_amocrm import FakeAmoCRM
+
+
+async def two_step(amocrm: AmoCRM, user_data: dict):
+    contact_id = await amocrm.create_contact(user_data)
+    return await amocrm.create_lead(user_data, contact_id, is_city1=False)
+
+
+async def complex_lead(amocrm: AmoCRM, user_data: dict):
+    return await amocrm.create_complex_lead(user_data, is_city1=False)
+
+
+async def measure(name: str, func, amocrm: AmoCRM, total: int, concurrency: int, fake: FakeAmoCRM):
+    """Выполнить total заявок по concurrency одновременно и вывести задержки"""
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int):
+        user_data = {"name": f"Зритель {i}", "phone": "+79990000000", "city": "Казань",
+                     "project": "Игроки", "show_datetime": "2026-02-15 19:00"}
+        async with semaphore:
+            started = time.perf_counter()
+            result = await func(amocrm, user_data)
+            latencies.append(time.perf_counter() - started)
+            if not result:
+                raise RuntimeError(f"{name}: заявка {i} не создана")
+
+    requests_before = fake.stats["requests"]
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    p95 = latencies[max(int(len(latencies) * 0.95) - 1, 0)]
+    print(f"{name:>22}: медиана {statistics.median(latencies) * 1000:7.1f} мс, "
+          f"p95 {p95 * 1000:7.1f} мс, всего {elapsed:6.2f} с, "
+          f"HTTP-запросов {fake.stats['requests'] - requests_before}")
+
+
+async def main(total: int, concurrency: int, rtt_ms: float):
+    fake = FakeAmoCRM(latency=rtt_ms / 1000)
+    base_url = await fake.start()
+
+    config = AmoCRMConfig(subdomain="bench", client_id="", client_secret="", redirect_uri="",
+                          access_token="bench", refresh_token="", base_url=base_url)
+    amocrm = AmoCRM(config)
+
+    print(f"Фейковый AmoCRM: {amocrm.base_url}, RTT {rtt_ms:.0f} мс, "
+          f"заявок {total}, одновременно {concurrency}\n")
+    try:
+        # Прогрев: соединение и кэш статусов воронки не должны попадать в замер
+        await two_step(amocrm, {"name": "warmup"})
+        await complex_lead(amocrm, {"name": "warmup"})
+
+        await measure("контакт + сделка", two_step, amocrm, total, concurrency, fake)
+        await measure("leads/complex", complex_lead, amocrm, total, concurrency, fake)
+    finally:
+        _pipeline_status_cache.invalidate()
+        await close_amocrm_sessions()
+        await fake.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Сравнение задержки создания заявки в AmoCRM")
+    parser.add_argument("--requests", type=int, default=50, help="Количество заявок")
+    parser.add_argument("--concurrency", type=int, default=1, help="Сколько заявок отправлять одновременно")
+    parser.add_argument("--rtt-ms", type=float, default=80, help="Задержка ответа фейкового сервера, мс")
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.concurrency, args.rtt_ms))
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Сравнение хранилищ состояний FSM: MemoryStorage против SQLiteStorage
+(database/fsm_storage.py) на типичной нагрузке бота.
+
+На каждое обновление aiogram читает состояние (get_state), обработчик анкеты
+читает и дополняет данные (get_data/update_data) и переводит пользователя
+в следующее состояние (set_state). Бенчмарк прогоняет такие обновления для
+--users пользователей по кругу, затем проверяет, что после "перезапуска"
+(новый экземпляр SQLiteStorage на том же файле) состояния и данные на месте.
+
+Использование:
+    python3 scripts/bench_fsm_storage.py [--users 2000] [--updates 100000] [--cache-size 10000]
+"""
+
+import argparse
+import asyncio
+import logging
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Добавляем корневую директорию проекта в путь
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from aiogram.fsm.storage.base import BaseStorage, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from database.fsm_storage import SQLiteStorage
+from states import QuestionnaireStates
+
+BOT_ID = 1
+STATES = [QuestionnaireStates.waiting_for_name, QuestionnaireStates.waiting_for_phone,
+          QuestionnaireStates.waiting_for_email]
+
+
+def storage_key(user_id: int) -> StorageKey:
+    return StorageKey(bot_id=BOT_ID, chat_id=user_id, user_id=user_id)
+
+
+async def simulate_update(storage: BaseStorage, key: StorageKey, step: int):
+    """Одно обновление анкеты: чтение состояния, чтение и запись данных, смена состояния"""
+    await storage.get_state(key)
+    data = await storage.get_data(key)
+    await storage.update_data(key, {"step": step, "seat_selection_url": data.get("seat_selection_url") or
+                                    f"https://tickets.example.com/{key.user_id}"})
+    await storage.set_state(key, STATES[step % len(STATES)])
+
+
+async def measure(name: str, storage: BaseStorage, users: int, updates: int) -> float:
+    keys = [storage_key(1000 + i) for i in range(users)]
+    # Прогрев: первое обращение к каждому пользователю
+    for key in keys:
+        await storage.get_state(key)
+
+    started = time.perf_counter()
+    for i in range(updates):
+        await simulate_update(storage, keys[i % users], i)
+    elapsed = time.perf_counter() - started
+
+    # Чтение состояния - то, что aiogram делает на каждое обновление
+    started = time.perf_counter()
+    for i in range(updates):
+        await storage.get_state(keys[i % users])
+    read_elapsed = time.perf_counter() - started
+    print(f"{name:>28}: {updates / elapsed:9.0f} обновлений анкеты/сек ({elapsed / updates * 1e6:5.1f} мкс), "
+          f"get_state {read_elapsed / updates * 1e6:5.2f} мкс")
+    return elapsed
+
+
+async def main(users: int, updates: int, cache_size: int):
+    logging.disable(logging.INFO)
+    await measure("MemoryStorage", MemoryStorage(), users, updates)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = str(Path(tmp_dir) / "fsm_states.db")
+        storage = SQLiteStorage(db_path, cache_size=cache_size)
+        await measure(f"SQLiteStorage (кэш {cache_size})", storage, users, updates)
+        await storage.close()
+
+        # "Перезапуск": новый экземпляр читает то, что сохранил предыдущий
+        restarted = SQLiteStorage(db_path, cache_size=cache_size)
+        last_step = {1000 + i % users: i for i in range(updates)}
+        mismatches = 0
+        for user_id, step in last_step.items():
+            key = storage_key(user_id)
+            data = await restarted.get_data(key)
+            state = await restarted.get_state(key)
+            if data.get("step") != step or state != STATES[step % len(STATES)].state:
+                mismatches += 1
+        await restarted.close()
+        print(f"После перезапуска восстановлено состояний: {len(last_step) - mismatches}/{len(last_step)}")
+
+        if cache_size:
+            uncached = SQLiteStorage(db_path, cache_size=0)
+            await measure("SQLiteStorage (без кэша)", uncached, users, min(updates, 5000))
+            await uncached.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Сравнение хранилищ состояний FSM")
+    parser.add_argument("--users", type=int, default=2000, help="Количество пользователей")
+    parser.add_argument("--updates", type=int, default=100000, help="Количество обновлений")
+    parser.add_argument("--cache-size", type=int, default=10000, help="Размер кэша SQLiteStorage")
+    args = parser.parse_args()
+    asyncio.run(main(args.users, args.updates, args.cache_size))
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Пропускная способность бота при разном количестве процессов-обработчиков
+(BOT_WORKERS, services/sharded_workers.py).
+
+Для каждого значения --workers бенчмарк запускает настоящий бот (python main.py)
+в режиме webhook с временными БД и фейковым Bot API (scripts/webhook_harness.py),
+отправляет --updates команд /start от разных пользователей и измеряет, за сколько
+бот отправил все ответы. Затем бот останавливается по SIGTERM, как в systemd.
+
+Ускорение ограничено количеством ядер: на одном ядре процессы конкурируют за
+процессор, и BOT_WORKERS > 1 дает только накладные расходы на пересылку.
+
+Использование:
+    python3 scripts/bench_sharded_workers.py [--workers 1,2,4] [--updates 2000] [--concurrency 50]
+"""
+
+import argparse
+import asyncio
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import aiohttp
+
+# Добавляем корневую директорию проекта в путь
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from webhook_harness import FIRST_USER_ID, HARNESS_SECRET, HARNESS_TOKEN, FakeBotAPI, make_update
+
+# Сколько сообщений бот отправляет в ответ на /start
+MESSAGES_PER_START = 2
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def bot_env(tmp_dir: str, workers: int, port: int, api_url: str) -> dict:
+    """Окружение бота: временные файлы, фейковый Bot API, фоновые задачи отключены"""
+    tmp = Path(tmp_dir)
+    env = dict(os.environ)
+    env.update({
+        "BOT_TOKEN": HARNESS_TOKEN,
+        "BOT_MODE": "webhook",
+        "BOT_WORKERS": str(workers),
+        "TELEGRAM_API_URL": api_url,
+        "WEBHOOK_URL": "",
+        "WEBHOOK_HOST": "127.0.0.1",
+        "WEBHOOK_PORT": str(port),
+        "WEBHOOK_PATH": "/webhook",
+        "WEBHOOK_SECRET": HARNESS_SECRET,
+        "DATABASE_PATH": str(tmp / "bot_database.db"),
+        "FSM_STORAGE_PATH": str(tmp / "fsm_states.db"),
+        "AMOCRM_TOKENS_PATH": str(tmp / "amocrm_tokens.json"),
+        "CRM_LEAD_SYNC_INTERVAL": "0",
+        "MAPPINGS_ARCHIVE_INTERVAL": "0",
+    })
+    return env
+
+
+async def wait_healthy(session: aiohttp.ClientSession, base_url: str, process: subprocess.Popen,
+                       timeout: float = 60) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline and process.poll() is None:
+        try:
+            async with session.get(f"{base_url}/healthz") as response:
+                if response.status == 200:
+                    return True
+        except aiohttp.ClientError:
+            pass
+        await asyncio.sleep(0.2)
+    return False
+
+
+async def post_updates(session: aiohttp.ClientSession, url: str, total: int, concurrency: int) -> int:
+    """Отправить total команд /start от разных пользователей, вернуть количество ответов 200"""
+    semaphore = asyncio.Semaphore(concurrency)
+    headers = {"X-Telegram-Bot-Api-Secret-Token": HARNESS_SECRET}
+    accepted = 0
+
+    async def one(i: int):
+        nonlocal accepted
+        async with semaphore:
+            async with session.post(url, json=make_update(100 + i, FIRST_USER_ID + i), headers=headers) as response:
+                await response.read()
+                accepted += response.status == 200
+
+    await asyncio.gather(*(one(i) for i in range(total)))
+    return accepted
+
+
+async def wait_answers(fake_api: FakeBotAPI, expected: int, timeout: float = 120) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if fake_api.calls["sendMessage"] >= expected:
+            return True
+        await asyncio.sleep(0.02)
+    return False
+
+
+async def measure(fake_api: FakeBotAPI, api_url: str, workers: int, total: int, concurrency: int) -> float:
+    """Прогнать нагрузку на бот с workers процессами, вернуть обновлений в секунду (0 - ошибка)"""
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        log_path = Path(tmp_dir) / "bot.log"
+        with open(log_path, "wb") as log:
+            process = subprocess.Popen([sys.executable, "main.py"], cwd=project_root,
+                                       env=bot_env(tmp_dir, workers, port, api_url),
+                                       stdout=log, stderr=subprocess.STDOUT)
+        try:
+            async with aiohttp.ClientSession() as session:
+                if not await wait_healthy(session, base_url, process):
+                    print(f"❌ BOT_WORKERS={workers}: бот не запустился, лог: {log_path.read_text()[-2000:]}")
+                    return 0.0
+                fake_api.reset()
+                started = time.perf_counter()
+                accepted = await post_updates(session, f"{base_url}/webhook", total, concurrency)
+            answered = await wait_answers(fake_api, total * MESSAGES_PER_START)
+            elapsed = fake_api.last_call_at - started
+        finally:
+            process.send_signal(signal.SIGTERM)
+            try:
+                exit_code = await asyncio.to_thread(process.wait, 60)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                exit_code = "не остановился за 60 сек"
+
+    rate = total / elapsed if answered and elapsed > 0 else 0.0
+    print(f"BOT_WORKERS={workers}: принято {accepted}/{total}, "
+          f"отправлено ответов {fake_api.calls['sendMessage']}/{total * MESSAGES_PER_START} "
+          f"за {elapsed:.2f} сек -> {rate:.0f} обновлений/сек, код завершения {exit_code}")
+    return rate
+
+
+async def main(workers_list: list, total: int, concurrency: int):
+    print(f"Ядер процессора: {os.cpu_count()}")
+    fake_api = FakeBotAPI()
+    api_url = await fake_api.start()
+    try:
+        results = {}
+        for workers in workers_list:
+            results[workers] = await measure(fake_api, api_url, workers, total, concurrency)
+    finally:
+        await fake_api.stop()
+
+    baseline = results.get(workers_list[0]) or 0
+    print("\nПроцессов | обновлений/сек | ускорение")
+    for workers, rate in results.items():
+        speedup = f"{rate / baseline:.2f}x" if baseline else "-"
+        print(f"{workers:>9} | {rate:>14.0f} | {speedup:>9}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Пропускная способность бота в зависимости от BOT_WORKERS")
+    parser.add_argument("--workers", default="1,2,4", help="Значения BOT_WORKERS через запятую")
+    parser.add_argument("--updates", type=int, default=2000, help="Количество обновлений на прогон")
+    parser.add_argument("--concurrency", type=int, default=50, help="Сколько обновлений отправлять одновременно")
+    args = parser.parse_args()
+    asyncio.run(main([int(value) for value in args.workers.split(",")], args.updates, args.concurrency))
@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""
+Фейковый сервер AmoCRM для интеграционных и нагрузочных тестов.
+
+Реализует методы API, которые использует services/amocrm.py:
+    POST /api/v4/contacts, /api/v4/leads, /api/v4/leads/complex
+    GET  /api/v4/contacts, /api/v4/leads (filter[updated_at][from]), /api/v4/users,
+         /api/v4/leads/pipelines/{id}
+    POST /oauth2/access_token (обновление токена)
+
+Задержка ответа, доля ответов 5xx и лимит запросов в секунду (с ответом 429
+и Retry-After) настраиваются, поэтому на нем можно проверить повторы,
+ограничитель частоты и выключатель без реальных аккаунтов.
+
+Запуск отдельно (бот направляется на него через AMOCRM_CITY1_BASE_URL/AMOCRM_CITY2_BASE_URL):
+    python3 scripts/fake_amocrm.py --port 8900 --latency-ms 80 --error-rate 0.05 --rate-limit 7
+
+Запуск внутри теста или бенчмарка:
+    fake = FakeAmoCRM(latency=0.08)
+    base_url = await fake.start()
+    amocrm = AmoCRM(AmoCRMConfig(..., base_url=base_url))
+    ...
+    await fake.stop()
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from collections import Counter, deque
+from itertools import count
+from pathlib import Path
+from typing import Deque, Dict, List, Optional
+
+# Добавляем корневую директорию проекта в путь
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from aiohttp import web
+
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+# Статус "принято в работу" в фейковых воронках
+ACCEPTED_STATUS_ID = 142
+MAX_PAGE_LIMIT = 250
+
+
+class FakeAmoCRM:
+    """Фейковый AmoCRM на aiohttp, запускаемый в текущем event loop"""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+                 rate_limit: Optional[float] = None, retry_after: int = 1,
+                 users: Optional[List[Dict]] = None, seed: Optional[int] = None):
+        """Инициализация сервера
+
+        Args:
+            latency: Задержка ответа, сек
+            jitter: Случайная добавка к задержке (от 0 до jitter), сек
+            error_rate: Доля запросов к API, на которые сервер ответит 503
+            rate_limit: Запросов в секунду, после которых сервер отвечает 429 (None - без лимита)
+            retry_after: Значение заголовка Retry-After в ответе 429, сек
+            users: Пользователи аккаунта (по умолчанию три тестовых)
+            seed: Начальное значение генератора случайных чисел
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        self.users = users if users is not None else [
+            {"id": 7517776, "name": "Мариненкова Екатерина", "email": "manager@example.com", "is_active": True},
+            {"id": 7517777, "name": "Иванов Иван", "email": "ivanov@example.com", "is_active": True},
+            {"id": 7517778, "name": "Петрова Анна", "email": "petrova@example.com", "is_active": False},
+        ]
+        self.contacts: Dict[int, Dict] = {}
+        self.leads: Dict[int, Dict] = {}
+        # Счетчики: всего запросов ("requests"), по методам ("POST /api/v4/leads"), ответов "429" и "503"
+        self.stats: Counter = Counter()
+        self._ids = count(1000)
+        self._random = random.Random(seed)
+        self._recent: Deque[float] = deque()
+        self._runner: Optional[web.AppRunner] = None
+        self.app = self._create_app()
+
+    def _create_app(self) -> web.Application:
+        app = web.Application(middlewares=[self._middleware])
+        app.router.add_post("/api/v4/contacts", self._create_contacts)
+        app.router.add_get("/api/v4/contacts", self._list_contacts)
+        app.router.add_post("/api/v4/leads", self._create_leads)
+        app.router.add_get("/api/v4/leads", self._list_leads)
+        app.router.add_post("/api/v4/leads/complex", self._create_complex)
+        app.router.add_get("/api/v4/leads/pipelines/{pipeline_id}", self._pipeline)
+        app.router.add_get("/api/v4/users", self._list_users)
+        app.router.add_post("/oauth2/access_token", self._access_token)
+        return app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Запустить сервер
+
+        Args:
+            host: Адрес
+            port: Порт (0 - любой свободный)
+
+        Returns:
+            Базовый URL сервера для AmoCRMConfig.base_url
+        """
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        return f"http://{host}:{port}"
+
+    async def stop(self):
+        """Остановить сервер"""
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def set_lead_status(self, lead_id: int, status_id: int, price: Optional[int] = None):
+        """Изменить статус сделки, как это сделал бы менеджер в AmoCRM"""
+        lead = self.leads[lead_id]
+        lead["status_id"] = status_id
+        if price is not None:
+            lead["price"] = price
+        if status_id in (142, 143):
+            lead["closed_at"] = int(time.time())
+        lead["updated_at"] = int(time.time())
+
+    def _store_lead(self, item: Dict) -> int:
+        lead_id = next(self._ids)
+        now = int(time.time())
+        self.leads[lead_id] = dict(item, id=lead_id, created_at=now, updated_at=now)
+        return lead_id
+
+    # --- Поведение сервера: задержка, лимит, ошибки ---
+
+    def _throttled(self) -> bool:
+        """Превышен ли лимит запросов за последнюю секунду"""
+        if self.rate_limit is None:
+            return False
+        now = time.monotonic()
+        while self._recent and now - self._recent[0] >= 1:
+            self._recent.popleft()
+        if len(self._recent) >= self.rate_limit:
+            return True
+        self._recent.append(now)
+        return False
+
+    @web.middleware
+    async def _middleware(self, request: web.Request, handler):
+        resource = request.match_info.route.resource
+        self.stats["requests"] += 1
+        self.stats[f"{request.method} {resource.canonical if resource else request.path}"] += 1
+        delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay:
+            await asyncio.sleep(delay)
+
+        if request.path.startswith("/api/"):
+            if not request.headers.get("Authorization", "").startswith("Bearer "):
+                return web.json_response({"title": "Unauthorized", "status": 401}, status=401)
+            if self._throttled():
+                self.stats["429"] += 1
+                return web.json_response({"title": "Too Many Requests", "status": 429}, status=429,
+                                         headers={"Retry-After": str(self.retry_after)})
+            if self.error_rate and self._random.random() < self.error_rate:
+                self.stats["503"] += 1
+                return web.json_response({"title": "Service Unavailable", "status": 503}, status=503)
+        return await handler(request)
+
+    # --- Обработчики ---
+
+    @staticmethod
+    def _validation_errors(items: List[Dict]) -> List[Dict]:
+        """Ошибки валидации в формате AmoCRM: сущность без названия"""
+        return [
+            {"request_id": item.get("request_id", str(i)),
+             "errors": [{"code": "NotSupportedChoice", "path": "name", "detail": "Name is required"}]}
+            for i, item in enumerate(items)
+            if not isinstance(item.get("name"), str) or not item["name"]
+        ]
+
+    async def _read_items(self, request: web.Request):
+        items = await request.json()
+        if not isinstance(items, list):
+            raise web.HTTPBadRequest(text="Ожидается массив сущностей")
+        errors = self._validation_errors(items)
+        if errors:
+            raise web.HTTPBadRequest(
+                text=json.dumps({"title": "Bad Request", "status": 400, "validation-errors": errors}),
+                content_type="application/problem+json",
+            )
+        return items
+
+    async def _create_contacts(self, request: web.Request) -> web.Response:
+        items = await self._read_items(request)
+        created = []
+        for i, item in enumerate(items):
+            contact_id = next(self._ids)
+            self.contacts[contact_id] = dict(item, id=contact_id)
+            created.append({"id": contact_id, "request_id": item.get("request_id", str(i))})
+        return web.json_response({"_embedded": {"contacts": created}})
+
+    async def _create_leads(self, request: web.Request) -> web.Response:
+        items = await self._read_items(request)
+        created = []
+        for i, item in enumerate(items):
+            lead_id = self._store_lead(item)
+            created.append({"id": lead_id, "request_id": item.get("request_id", str(i))})
+        return web.json_response({"_embedded": {"leads": created}})
+
+    async def _create_complex(self, request: web.Request) -> web.Response:
+        items = await self._read_items(request)
+        created = []
+        for i, item in enumerate(items):
+            contacts = item.get("_embedded", {}).get("contacts") or [{}]
+            contact_id = next(self._ids)
+            self.contacts[contact_id] = dict(contacts[0], id=contact_id)
+            lead_id = self._store_lead(item)
+            created.append({"id": lead_id, "contact_id": contact_id, "company_id": None,
+                            "request_id": [item.get("request_id", str(i))], "merged": False})
+        return web.json_response(created)
+
+    @staticmethod
+    def _page(request: web.Request, items: List[Dict]):
+        """Страница списка по параметрам page/limit и ссылки _links (None - страниц больше нет, 204)"""
+        page = max(int(request.query.get("page", 1)), 1)
+        limit = min(max(int(request.query.get("limit", 50)), 1), MAX_PAGE_LIMIT)
+        chunk = items[(page - 1) * limit:page * limit]
+        if not chunk:
+            return None, {}
+        links = {"self": {"href": f"{request.path}?page={page}&limit={limit}"}}
+        if page * limit < len(items):
+            links["next"] = {"href": f"{request.path}?page={page + 1}&limit={limit}"}
+        return chunk, links
+
+    async def _list_contacts(self, request: web.Request) -> web.Response:
+        chunk, links = self._page(request, list(self.contacts.values()))
+        if chunk is None:
+            return web.Response(status=204)
+        return web.json_response({"_embedded": {"contacts": chunk}, "_links": links})
+
+    async def _list_leads(self, request: web.Request) -> web.Response:
+        updated_from = int(request.query.get("filter[updated_at][from]", 0))
+        leads = [lead for lead in self.leads.values() if lead["updated_at"] >= updated_from]
+        leads.sort(key=lambda lead: (lead["updated_at"], lead["id"]))
+        chunk, links = self._page(request, leads)
+        if chunk is None:
+            return web.Response(status=204)
+        return web.json_response({"_embedded": {"leads": chunk}, "_links": links})
+
+    async def _list_users(self, request: web.Request) -> web.Response:
+        chunk, links = self._page(request, self.users)
+        if chunk is None:
+            return web.Response(status=204)
+        return web.json_response({"_embedded": {"users": chunk}, "_links": links})
+
+    async def _pipeline(self, request: web.Request) -> web.Response:
+        pipeline_id = int(request.match_info["pipeline_id"])
+        return web.json_response({
+            "id": pipeline_id,
+            "_embedded": {"statuses": [
+                {"id": ACCEPTED_STATUS_ID - 1, "name": "Неразобранное"},
+                {"id": ACCEPTED_STATUS_ID, "name": "Принято в работу"},
+            ]},
+        })
+
+    async def _access_token(self, request: web.Request) -> web.Response:
+        data = await request.json()
+        if data.get("grant_type") != "refresh_token" or not data.get("refresh_token"):
+            return web.json_response({"title": "Bad Request", "status": 400}, status=400)
+        suffix = next(self._ids)
+        return web.json_response({
+            "token_type": "Bearer",
+            "expires_in": 86400,
+            "access_token": f"fake-access-{suffix}",
+            "refresh_token": f"fake-refresh-{suffix}",
+        })
+
+
+async def main(args):
+    fake = FakeAmoCRM(
+        latency=args.latency_ms / 1000,
+        jitter=args.jitter_ms / 1000,
+        error_rate=args.error_rate,
+        rate_limit=args.rate_limit,
+    )
+    base_url = await fake.start(args.host, args.port)
+    print(f"Фейковый AmoCRM запущен: {base_url}")
+    print(f"Укажите в .env: AMOCRM_CITY1_BASE_URL={base_url} и AMOCRM_CITY2_BASE_URL={base_url}")
+    try:
+        while True:
+            await asyncio.sleep(3600)
+    finally:
+        await fake.stop()
+        print(f"Запросов: {dict(fake.stats)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Фейковый сервер AmoCRM")
+    parser.add_argument("--host", default="127.0.0.1", help="Адрес")
+    parser.add_argument("--port", type=int, default=8900, help="Порт")
+    parser.add_argument("--latency-ms", type=float, default=0, help="Задержка ответа, мс")
+    parser.add_argument("--jitter-ms", type=float, default=0, help="Случайная добавка к задержке, мс")
+    parser.add_argument("--error-rate", type=float, default=0, help="Доля ответов 503 (0..1)")
+    parser.add_argument("--rate-limit", type=float, default=None, help="Запросов в секунду до ответа 429")
+    try:
+        asyncio.run(main(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
@@ -13,7 +13,7 @@ project_root = Path(__file__).parent.parent
 sys.path.insert(0, str(project_root))
 
 from config import Config
-from services.amocrm import AmoCRM
+from services.amocrm import AmoCRM, close_amocrm_sessions
 from logger import get_logger
 
 logger = get_logger(__name__)
@@ -39,12 +39,13 @@ async def find_user_id(user_name: str, is_city2: bool = True):
     
     print(f"\n🔍 Поиск пользователя '{user_name}' в AmoCRM {crm_name}...")
     
-    # Получаем список всех пользователей
-    users = await amocrm.get_users()
+    # Получаем список всех пользователей (один раз: поиск ниже идет по этому же справочнику)
+    directory = await amocrm.get_user_directory()
     
-    if not users:
+    if not directory or not directory.users:
         print("❌ Не удалось получить список пользователей")
         return None
+    users = directory.users
     
     print(f"\n📋 Найдено пользователей: {len(users)}\n")
     
@@ -97,7 +98,10 @@ async def main():
         elif sys.argv[2].lower() == 'city2':
             is_city2 = True
     
-    await find_user_id(user_name, is_city2)
+    try:
+        await find_user_id(user_name, is_city2)
+    finally:
+        await close_amocrm_sessions()
 
 
 if __name__ == "__main__":
@@ -5,6 +5,10 @@
 
 Скрипт обновит токены для обоих аккаунтов AmoCRM (City1 - АТЛАНТ и City2 - ЭТАЖИ)
 и выведет новые токены для обновления в .env файле.
+
+Бот обновляет токены сам (services/amocrm_tokens.py). Refresh token одноразовый,
+поэтому новые токены сохраняются и в файл AMOCRM_TOKENS_PATH: иначе запущенный
+бот остался бы с недействительным refresh token.
 """
 import asyncio
 import sys
@@ -17,6 +21,7 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from config import Config
 from logger import setup_logger
+from services.amocrm_tokens import get_token_store, token_expires_at
 
 logger = setup_logger(__name__)
 
@@ -80,6 +85,20 @@ async def refresh_amocrm_token(subdomain: str, client_id: str, client_secret: st
         return None
 
 
+def save_to_token_store(amocrm_config, result: dict):
+    """Сохранить новые токены в файл токенов бота (AMOCRM_TOKENS_PATH)"""
+    try:
+        get_token_store(amocrm_config.tokens_path).save(
+            amocrm_config.subdomain,
+            result['access_token'],
+            result['refresh_token'],
+            token_expires_at(result['access_token']),
+        )
+        logger.info(f"✅ Токены сохранены в {amocrm_config.tokens_path}")
+    except Exception as e:
+        logger.error(f"❌ Не удалось сохранить токены в {amocrm_config.tokens_path}: {e}")
+
+
 async def update_tokens():
     """Обновить токены для обоих аккаунтов AmoCRM"""
     logger.info("=" * 60)
@@ -107,6 +126,7 @@ async def update_tokens():
     
     if city1_result:
         results['city1'] = city1_result
+        save_to_token_store(config.amocrm_city1, city1_result)
         logger.info(f"✅ Новый access_token (первые 50 символов): {city1_result['access_token'][:50]}...")
         logger.info(f"✅ Новый refresh_token (первые 50 символов): {city1_result['refresh_token'][:50]}...")
         logger.info(f"✅ Срок действия: {city1_result.get('expires_in', 'N/A')} секунд")
@@ -130,6 +150,7 @@ async def update_tokens():
     
     if city2_result:
         results['city2'] = city2_result
+        save_to_token_store(config.amocrm_city2, city2_result)
         logger.info(f"✅ Новый access_token (первые 50 символов): {city2_result['access_token'][:50]}...")
         logger.info(f"✅ Новый refresh_token (первые 50 символов): {city2_result['refresh_token'][:50]}...")
         logger.info(f"✅ Срок действия: {city2_result.get('expires_in', 'N/A')} секунд")
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+Тестовый стенд webhook-режима (BOT_MODE=webhook): отправляет синтетические
+обновления Telegram на webhook и измеряет время ответа.
+
+Без --url стенд поднимает бота целиком в этом процессе: настоящие роутеры
+и middleware (main.create_dispatcher), временную БД и фейковый Bot API, на
+который бот отправляет ответы, поэтому Telegram и рабочая БД не затрагиваются.
+С --url обновления отправляются на уже запущенный бот (например, за reverse
+proxy); ответы такой бот отправит в настоящий Telegram от имени несуществующих
+пользователей и получит ошибки - используйте для проверки приема и нагрузки.
+
+Кроме нагрузки проверяется, что запросы без секрета или с неверным секретом
+отклоняются (401), а /healthz отвечает 200.
+
+Использование:
+    python3 scripts/webhook_harness.py [--updates 200] [--concurrency 20]
+    python3 scripts/webhook_harness.py --url http://127.0.0.1:8080/webhook --secret <WEBHOOK_SECRET>
+"""
+
+import argparse
+import asyncio
+import dataclasses
+import logging
+import statistics
+import sys
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Optional
+from urllib.parse import urlsplit
+
+import aiohttp
+from aiohttp import web
+
+# Добавляем корневую директорию проекта в путь
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+
+from config import get_config
+from database import Database
+from services.task_supervisor import get_task_supervisor, shutdown_task_supervisor
+from services.webhook_server import HEALTH_PATH, WEBHOOK_UPDATE_CATEGORY, build_webhook_app
+
+HARNESS_TOKEN = "123456:HARNESS"
+HARNESS_SECRET = "harness_secret"
+# ID синтетических пользователей (не пересекаются с настоящими)
+FIRST_USER_ID = 9_000_000_000
+
+
+class FakeBotAPI:
+    """Фейковый Bot API: на send*/edit* отвечает сообщением, на getMe - ботом, на остальные методы - True"""
+
+    def __init__(self):
+        self.calls: Counter = Counter()
+        # Время последнего вызова (time.perf_counter) - для измерения пропускной способности
+        self.last_call_at = 0.0
+        self._message_id = 0
+        self._runner: Optional[web.AppRunner] = None
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        self.calls[method] += 1
+        self.last_call_at = time.perf_counter()
+        data = await request.post()
+        if method == "getMe":
+            result = {"id": int(HARNESS_TOKEN.split(":")[0]), "is_bot": True,
+                      "first_name": "Harness", "username": "harness_bot"}
+        elif method.startswith(("send", "edit")):
+            self._message_id += 1
+            chat_id = int(data.get("chat_id") or 0)
+            result = {
+                "message_id": self._message_id,
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+            }
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    def reset(self):
+        self.calls.clear()
+        self.last_call_at = 0.0
+
+    async def start(self) -> str:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        return f"http://127.0.0.1:{port}"
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+
+def make_update(update_id: int, user_id: int, text: str = "/start") -> dict:
+    """Синтетическое обновление Telegram: текстовое сообщение пользователя в личном чате"""
+    user = {"id": user_id, "is_bot": False, "first_name": f"Harness{user_id % 10000}",
+            "username": f"harness_{user_id % 10000}", "language_code": "ru"}
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private", "first_name": user["first_name"]},
+            "from": user,
+            "text": text,
+            "entities": [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+            if text.startswith("/") else [],
+        },
+    }
+
+
+async def check_security(session: aiohttp.ClientSession, url: str, secret: str) -> bool:
+    """Запросы без секрета и с неверным секретом должны отклоняться, /healthz - отвечать"""
+    ok = True
+    update = make_update(1, FIRST_USER_ID)
+    for title, headers in (("без секрета", {}),
+                           ("с неверным секретом", {"X-Telegram-Bot-Api-Secret-Token": secret + "x"})):
+        async with session.post(url, json=update, headers=headers) as response:
+            passed = response.status == 401
+            ok &= passed
+            print(f"{'✅' if passed else '❌'} Запрос {title}: {response.status} (ожидается 401)")
+
+    parts = urlsplit(url)
+    health_url = f"{parts.scheme}://{parts.netloc}{HEALTH_PATH}"
+    async with session.get(health_url) as response:
+        body = await response.text()
+        passed = response.status == 200
+        ok &= passed
+        print(f"{'✅' if passed else '❌'} {HEALTH_PATH}: {response.status} {body}")
+    return ok
+
+
+async def send_updates(session: aiohttp.ClientSession, url: str, secret: str,
+                       total: int, concurrency: int) -> Counter:
+    """Отправить total обновлений по concurrency одновременно и вывести время ответа"""
+    latencies = []
+    statuses: Counter = Counter()
+    semaphore = asyncio.Semaphore(concurrency)
+    headers = {"X-Telegram-Bot-Api-Secret-Token": secret}
+
+    async def one(i: int):
+        update = make_update(100 + i, FIRST_USER_ID + i)
+        async with semaphore:
+            started = time.perf_counter()
+            async with session.post(url, json=update, headers=headers) as response:
+                await response.read()
+                statuses[response.status] += 1
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    p95 = latencies[max(int(len(latencies) * 0.95) - 1, 0)]
+    print(f"Отправлено {total} обновлений за {elapsed:.2f} сек ({total / elapsed:.0f} обновлений/сек), "
+          f"ответы: {dict(statuses)}")
+    print(f"Время ответа webhook: медиана {statistics.median(latencies) * 1000:.1f} мс, "
+          f"p95 {p95 * 1000:.1f} мс, макс. {latencies[-1] * 1000:.1f} мс")
+    return statuses
+
+
+async def wait_processed(total: int, timeout: float = 30) -> dict:
+    """Дождаться фоновой обработки обновлений (локальный режим)"""
+    deadline = time.monotonic() + timeout
+    stats = {}
+    while time.monotonic() < deadline:
+        stats = get_task_supervisor().stats().get(WEBHOOK_UPDATE_CATEGORY, {})
+        if stats.get("completed", 0) + stats.get("failed", 0) >= total:
+            break
+        await asyncio.sleep(0.05)
+    return stats
+
+
+async def run_local(total: int, concurrency: int) -> bool:
+    """Поднять бота с фейковым Bot API в этом процессе и прогнать нагрузку"""
+    from main import create_dispatcher
+
+    # Логи бота на каждое обновление заглушили бы результаты
+    logging.disable(logging.INFO)
+
+    fake_api = FakeBotAPI()
+    api_url = await fake_api.start()
+    bot = Bot(token=HARNESS_TOKEN, session=AiohttpSession(api=TelegramAPIServer.from_base(api_url)))
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db = Database(str(Path(tmp_dir) / "harness.db"))
+        await db.init_db()
+        config = dataclasses.replace(get_config(), webhook_secret=HARNESS_SECRET, webhook_path="/webhook")
+        app = build_webhook_app(create_dispatcher(db), bot, config)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        url = f"http://127.0.0.1:{port}{config.webhook_path}"
+        print(f"Локальный webhook: {url}, фейковый Bot API: {api_url}")
+
+        try:
+            async with aiohttp.ClientSession() as session:
+                ok = await check_security(session, url, HARNESS_SECRET)
+                statuses = await send_updates(session, url, HARNESS_SECRET, total, concurrency)
+            started = time.perf_counter()
+            stats = await wait_processed(total)
+            print(f"Обработано обновлений: {stats.get('completed', 0)}, с ошибкой: {stats.get('failed', 0)} "
+                  f"(обработка завершилась через {time.perf_counter() - started:.2f} сек после последнего ответа, "
+                  f"средняя длительность {stats.get('avg_duration', 0) * 1000:.1f} мс)")
+            if stats.get("last_error"):
+                print(f"Последняя ошибка: {stats['last_error']}")
+            print(f"Вызовы Bot API: {dict(fake_api.calls)}")
+            ok &= statuses.get(200, 0) == total and stats.get("completed", 0) == total
+        finally:
+            await runner.cleanup()
+            await shutdown_task_supervisor(5)
+            await bot.session.close()
+            await fake_api.stop()
+    return ok
+
+
+async def run_remote(url: str, secret: str, total: int, concurrency: int) -> bool:
+    """Прогнать нагрузку на уже запущенный webhook"""
+    async with aiohttp.ClientSession() as session:
+        ok = await check_security(session, url, secret)
+        statuses = await send_updates(session, url, secret, total, concurrency)
+    return ok and statuses.get(200, 0) == total
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Тестовый стенд webhook-режима бота")
+    parser.add_argument("--url", help="Адрес webhook запущенного бота (по умолчанию - бот в этом процессе)")
+    parser.add_argument("--secret", default="", help="WEBHOOK_SECRET запущенного бота (для --url)")
+    parser.add_argument("--updates", type=int, default=200, help="Количество обновлений")
+    parser.add_argument("--concurrency", type=int, default=20, help="Сколько обновлений отправлять одновременно")
+    args = parser.parse_args()
+
+    if args.url:
+        result = asyncio.run(run_remote(args.url, args.secret, args.updates, args.concurrency))
+    else:
+        result = asyncio.run(run_local(args.updates, args.concurrency))
+    print("✅ Проверка пройдена" if result else "❌ Проверка не пройдена")
+    sys.exit(0 if result else 1)
@@ -1,4 +1,3 @@
-from services.amocrm import AmoCRM, create_lead_in_city
-
-__all__ = ['AmoCRM', 'create_lead_in_city']
+from services.amocrm import AmoCRM, create_lead_in_city, init_amocrm_sessions, close_amocrm_sessions
 
+__all__ = ['AmoCRM', 'create_lead_in_city', 'init_amocrm_sessions', 'close_amocrm_sessions']
@@ -1,11 +1,172 @@
+import asyncio
 import aiohttp
-from typing import Optional, Dict
+from contextlib import asynccontextmanager
+from typing import Optional, Dict, List, Tuple, Union, TYPE_CHECKING
 from datetime import datetime
 from config import AmoCRMConfig
 from logger import get_logger
+from utils.async_cache import AsyncTTLCache
+from services.amocrm_batch import AmoBatcher, AmoBatchError
+from services.circuit_breaker import CircuitOpenError, get_circuit_breaker
+from services.contact_index import contact_keys
+from services.amocrm_tokens import clear_token_managers, get_token_manager
+from services.rate_limiter import AccountRateLimiter, clear_rate_limiters, get_rate_limiter, parse_retry_after
+from services.city_routing import get_city_router, route_city
+
+if TYPE_CHECKING:
+    from database import Database
 
 logger = get_logger(__name__)
 
+# Параметры соединений с AmoCRM (одна сессия на аккаунт)
+AMOCRM_CONNECTION_LIMIT = 20  # Максимум одновременных соединений с аккаунтом
+AMOCRM_DNS_CACHE_TTL = 300  # Время кэширования DNS, сек
+AMOCRM_KEEPALIVE_TIMEOUT = 60  # Сколько держать простаивающее соединение открытым, сек
+AMOCRM_REQUEST_TIMEOUT = 30  # Общий таймаут запроса, сек
+AMOCRM_CONNECT_TIMEOUT = 5  # Таймаут установки соединения (включая ожидание в пуле), сек
+AMOCRM_READ_TIMEOUT = 15  # Таймаут ожидания данных от сервера, сек
+AMOCRM_MAX_THROTTLE_RETRIES = 3  # Сколько раз повторять запрос после ответа 429
+
+# Статусы воронок почти не меняются: кэшируем на час (сброс - командой /crm_refresh)
+PIPELINE_CACHE_TTL = 3600
+# (поддомен, ID воронки) -> ID статуса "принято в работу"
+_pipeline_status_cache = AsyncTTLCache(ttl=PIPELINE_CACHE_TTL, name="статусов воронок")
+
+# Справочник пользователей аккаунта меняется редко: кэшируем на час
+USER_DIRECTORY_TTL = 3600
+USERS_PAGE_LIMIT = 250
+# поддомен -> UserDirectory
+_user_directory_cache = AsyncTTLCache(ttl=USER_DIRECTORY_TTL, name="пользователей AmoCRM")
+
+# Пул HTTP-сессий: поддомен аккаунта -> сессия
+_sessions: Dict[str, aiohttp.ClientSession] = {}
+
+# Пакетная отправка: (поддомен, "contacts"/"leads"/"leads/complex") -> накопитель пакетов
+_batchers: Dict[Tuple[str, str], AmoBatcher] = {}
+
+
+def _create_session() -> aiohttp.ClientSession:
+    """Создать долгоживущую сессию с настроенным пулом соединений"""
+    connector = aiohttp.TCPConnector(
+        limit=AMOCRM_CONNECTION_LIMIT,
+        ttl_dns_cache=AMOCRM_DNS_CACHE_TTL,
+        keepalive_timeout=AMOCRM_KEEPALIVE_TIMEOUT,
+    )
+    return aiohttp.ClientSession(
+        connector=connector,
+        timeout=aiohttp.ClientTimeout(
+            total=AMOCRM_REQUEST_TIMEOUT,
+            connect=AMOCRM_CONNECT_TIMEOUT,
+            sock_read=AMOCRM_READ_TIMEOUT,
+        ),
+    )
+
+
+def get_amocrm_session(subdomain: str) -> aiohttp.ClientSession:
+    """Получить общую сессию для аккаунта AmoCRM
+    
+    Сессия переиспользует TCP/TLS соединения между запросами всех экземпляров
+    AmoCRM этого аккаунта. Если сессия еще не создана (например, в скриптах
+    без init_amocrm_sessions), она создается при первом обращении.
+    
+    Args:
+        subdomain: Поддомен аккаунта AmoCRM
+    """
+    session = _sessions.get(subdomain)
+    if session is None or session.closed:
+        session = _sessions[subdomain] = _create_session()
+        logger.debug(f"Создана HTTP-сессия для AmoCRM {subdomain}")
+    return session
+
+
+async def init_amocrm_sessions(*configs: AmoCRMConfig):
+    """Создать сессии для аккаунтов AmoCRM при запуске бота
+    
+    Args:
+        configs: Конфигурации аккаунтов (аккаунты без поддомена пропускаются)
+    """
+    for config in configs:
+        if config.subdomain:
+            get_amocrm_session(config.subdomain)
+    logger.info(f"HTTP-сессии AmoCRM созданы: {', '.join(_sessions) or 'нет аккаунтов'}")
+
+
+def _find_accepted_status_id(pipeline_data: Dict) -> Optional[int]:
+    """Найти в воронке статус "принято в работу" (или первый статус воронки)"""
+    statuses = pipeline_data.get('_embedded', {}).get('statuses', [])
+    for status in statuses:
+        status_name = status.get('name', '').lower()
+        if 'принято' in status_name and 'работ' in status_name:
+            return status.get('id')
+    if statuses:
+        # Если не нашли, используем первый статус воронки
+        return statuses[0].get('id')
+    return None
+
+
+async def warm_pipeline_cache(city2_config: AmoCRMConfig) -> Optional[int]:
+    """Загрузить в кэш статус воронки ЭТАЖИ (при запуске бота и по /crm_refresh)
+    
+    Returns:
+        ID статуса "принято в работу" или None, если загрузить не удалось
+    """
+    if not city2_config.subdomain:
+        return None
+    try:
+        status_id = await AmoCRM(city2_config).get_accepted_status_id(get_city_router().account("city2").pipeline_id)
+    except Exception as e:
+        logger.warning(f"Не удалось прогреть кэш статусов воронки ЭТАЖИ: {e}")
+        return None
+    logger.info(f"Кэш статусов воронки ЭТАЖИ прогрет: status_id={status_id}")
+    return status_id
+
+
+def invalidate_pipeline_cache():
+    """Сбросить кэш статусов воронок всех аккаунтов"""
+    _pipeline_status_cache.invalidate()
+
+
+def invalidate_user_directory_cache():
+    """Сбросить кэш справочника пользователей всех аккаунтов"""
+    _user_directory_cache.invalidate()
+
+
+class UserDirectory:
+    """Справочник пользователей аккаунта AmoCRM с индексами по ID и имени"""
+    
+    def __init__(self, users: List[Dict]):
+        self.users = users
+        self.by_id: Dict[int, Dict] = {user['id']: user for user in users if user.get('id')}
+        # Имя без учета регистра -> пользователь (первый при совпадении имен)
+        self.by_name: Dict[str, Dict] = {}
+        for user in users:
+            self.by_name.setdefault(user.get('name', '').casefold(), user)
+    
+    def find(self, name: str) -> Optional[Dict]:
+        """Найти пользователя по имени: точное совпадение без учета регистра,
+        иначе частичное (одно имя содержит другое)"""
+        name_folded = name.casefold()
+        user = self.by_name.get(name_folded)
+        if user is not None:
+            return user
+        for user_name, user in self.by_name.items():
+            if user_name and (name_folded in user_name or user_name in name_folded):
+                return user
+        return None
+
+
+async def close_amocrm_sessions():
+    """Закрыть все сессии AmoCRM (при остановке бота)"""
+    sessions = list(_sessions.values())
+    _sessions.clear()
+    _batchers.clear()
+    clear_rate_limiters()
+    clear_token_managers()
+    for session in sessions:
+        if not session.closed:
+            await session.close()
+    logger.debug(f"Закрыто HTTP-сессий AmoCRM: {len(sessions)}")
+
 try:
     import jwt
     JWT_AVAILABLE = True
@@ -18,10 +179,119 @@ class AmoCRM:
         self.config = config
         # Определяем базовый URL для API
         # Для этого аккаунта работает subdomain.amocrm.ru
-        # (api-b.amocrm.ru из токена не работает для этого аккаунта)
-        self.base_url = f"https://{config.subdomain}.amocrm.ru"
+        # (api-b.amocrm.ru из токена не работает для этого аккаунта).
+        # base_url в конфигурации позволяет направить запросы на фейковый сервер (scripts/fake_amocrm.py)
+        self.base_url = (config.base_url or f"https://{config.subdomain}.amocrm.ru").rstrip('/')
         logger.debug(f"Инициализирован AmoCRM клиент для {config.subdomain}, API: {self.base_url}")
     
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Общая сессия аккаунта (соединения переиспользуются между запросами)"""
+        return get_amocrm_session(self.config.subdomain)
+    
+    def _get_rate_limiter(self) -> AccountRateLimiter:
+        """Общий ограничитель частоты запросов аккаунта"""
+        return get_rate_limiter(self.config.subdomain, self.config.rate_limit, self.config.max_concurrency)
+    
+    @asynccontextmanager
+    async def _request(self, method: str, url: str, **kwargs):
+        """HTTP-запрос к AmoCRM с авторизацией, учетом лимитов и выключателя аккаунта
+        
+        Если выключатель аккаунта разомкнут, сразу выбрасывается CircuitOpenError;
+        сетевые ошибки, таймауты и ответы 5xx учитываются выключателем.
+        Заголовок Authorization подставляется здесь. Запрос ждет место и токен
+        в ограничителе аккаунта. На ответ 429 запросы аккаунта приостанавливаются
+        на Retry-After секунд, и запрос повторяется (не больше
+        AMOCRM_MAX_THROTTLE_RETRIES раз). На ответ 401 access token обновляется,
+        и запрос повторяется один раз.
+        
+        Использование: async with self._request("GET", url, headers=headers) as response: ...
+        """
+        limiter = self._get_rate_limiter()
+        breaker = get_circuit_breaker(self.config.subdomain)
+        session = self._get_session()
+        headers = dict(kwargs.pop("headers", None) or {})
+        access_token = await self._get_access_token()
+        throttled = 0
+        reauthorized = False
+        while True:
+            headers["Authorization"] = f"Bearer {access_token}"
+            # Разомкнутый выключатель отклоняет запрос сразу, не занимая очередь ограничителя
+            breaker.ensure_available()
+            async with limiter.slot():
+                if not breaker.allow_request():
+                    raise CircuitOpenError(self.config.subdomain, breaker.retry_in())
+                try:
+                    response = await session.request(method, url, headers=headers, **kwargs)
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    breaker.record_failure(str(e) or type(e).__name__)
+                    raise
+                except BaseException:
+                    breaker.release()
+                    raise
+                if response.status >= 500:
+                    breaker.record_failure(f"HTTP {response.status}")
+                else:
+                    breaker.record_success()
+                
+                if response.status == 429 and throttled < AMOCRM_MAX_THROTTLE_RETRIES:
+                    throttled += 1
+                    limiter.retry_after(parse_retry_after(response.headers.get("Retry-After")))
+                    response.release()
+                    continue
+                if response.status == 401 and not reauthorized:
+                    reauthorized = True
+                    new_token = await get_token_manager(self.config).refresh_after_unauthorized(
+                        self.config, session, self.base_url, access_token
+                    )
+                    if new_token and new_token != access_token:
+                        logger.info(f"AmoCRM {self.config.subdomain}: повтор запроса с обновленным токеном")
+                        response.release()
+                        access_token = new_token
+                        continue
+                    # Обновить токен не удалось: вызывающий получит ответ 401
+                try:
+                    yield response
+                finally:
+                    response.release()
+                return
+    
+    def _get_batcher(self, entity: str) -> AmoBatcher:
+        """Общий накопитель пакетов аккаунта для контактов или сделок
+        
+        Args:
+            entity: "contacts", "leads" или "leads/complex"
+        """
+        key = (self.config.subdomain, entity)
+        batcher = _batchers.get(key)
+        if batcher is None:
+            batcher = _batchers[key] = AmoBatcher(self.config.subdomain, entity, self._post_entities)
+        else:
+            # Пакет отправляется с токеном самого свежего клиента (после перезагрузки конфигурации)
+            batcher.send = self._post_entities
+        return batcher
+    
+    async def _post_entities(self, entity: str, items: List[Dict]) -> Tuple[int, Optional[Union[Dict, List]], str]:
+        """Создать несколько сущностей одним запросом
+        
+        Args:
+            entity: "contacts", "leads" или "leads/complex"
+            items: Сущности в формате API AmoCRM
+            
+        Returns:
+            (HTTP статус, JSON ответа или None, текст ответа)
+        """
+        headers = {"Content-Type": "application/json"}
+        url = f"{self.base_url}/api/v4/{entity}"
+        logger.debug(f"Отправка пакета {entity} в AmoCRM ({len(items)} шт.): {url}")
+        
+        async with self._request("POST", url, headers=headers, json=items) as response:
+            response_text = await response.text()
+            try:
+                data = await response.json(content_type=None)
+            except ValueError:
+                data = None
+            return response.status, data if isinstance(data, (dict, list)) else None, response_text
+    
     def _get_api_domain_from_token(self) -> Optional[str]:
         """Получить API домен из токена, если указан"""
         if not JWT_AVAILABLE:
@@ -39,8 +309,8 @@ class AmoCRM:
         return None
 
     async def _get_access_token(self) -> str:
-        """Получить актуальный access token (можно расширить логику обновления)"""
-        return self.config.access_token
+        """Получить актуальный access token (обновляется заранее, до истечения)"""
+        return await get_token_manager(self.config).get_access_token(self.config, self._get_session(), self.base_url)
 
     async def get_pipeline_statuses(self, pipeline_id: int) -> Optional[Dict]:
         """Получить статусы воронки
@@ -51,59 +321,153 @@ class AmoCRM:
         Returns:
             Словарь со статусами или None при ошибке
         """
-        access_token = await self._get_access_token()
-        headers = {
-            "Authorization": f"Bearer {access_token}",
-            "Content-Type": "application/json"
-        }
+        headers = {"Content-Type": "application/json"}
         
         url = f"{self.base_url}/api/v4/leads/pipelines/{pipeline_id}"
         logger.debug(f"Запрос статусов воронки {pipeline_id}: {url}")
         
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, headers=headers) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        logger.debug(f"Получены статусы воронки {pipeline_id}")
-                        return data
-                    else:
-                        error_text = await response.text()
-                        logger.error(f"Ошибка получения статусов воронки: статус {response.status}, ответ: {error_text}")
-                        return None
+            async with self._request("GET", url, headers=headers) as response:
+                if response.status == 200:
+                    data = await response.json()
+                    logger.debug(f"Получены статусы воронки {pipeline_id}")
+                    return data
+                else:
+                    error_text = await response.text()
+                    logger.error(f"Ошибка получения статусов воронки: статус {response.status}, ответ: {error_text}")
+                    return None
         except Exception as e:
             logger.error(f"Исключение при получении статусов воронки: {e}", exc_info=True)
             return None
 
+    async def get_accepted_status_id(self, pipeline_id: int) -> Optional[int]:
+        """Получить ID статуса "принято в работу" воронки (с кэшем)
+        
+        Статусы загружаются из API не чаще раза в PIPELINE_CACHE_TTL секунд;
+        одновременные заявки ждут одну общую загрузку.
+        
+        Args:
+            pipeline_id: ID воронки
+            
+        Returns:
+            ID статуса или None, если статусы получить не удалось
+        """
+        async def load() -> Optional[int]:
+            pipeline_data = await self.get_pipeline_statuses(pipeline_id)
+            return _find_accepted_status_id(pipeline_data) if pipeline_data else None
+        
+        return await _pipeline_status_cache.get_or_load((self.config.subdomain, pipeline_id), load)
+    
     async def get_users(self) -> Optional[list]:
-        """Получить список пользователей AmoCRM
+        """Получить список всех пользователей AmoCRM (постранично)
         
         Returns:
             Список пользователей или None при ошибке
         """
-        access_token = await self._get_access_token()
-        headers = {
-            "Authorization": f"Bearer {access_token}",
-            "Content-Type": "application/json"
-        }
-        
+        headers = {"Content-Type": "application/json"}
         url = f"{self.base_url}/api/v4/users"
-        logger.debug(f"Запрос списка пользователей: {url}")
+        users: list = []
+        page = 1
         
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, headers=headers) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        logger.debug(f"Получен список пользователей: {len(data.get('_embedded', {}).get('users', []))} пользователей")
-                        return data.get('_embedded', {}).get('users', [])
-                    else:
+            while True:
+                params = {"page": page, "limit": USERS_PAGE_LIMIT}
+                logger.debug(f"Запрос списка пользователей, страница {page}: {url}")
+                async with self._request("GET", url, headers=headers, params=params) as response:
+                    if response.status == 204:
+                        break
+                    if response.status != 200:
                         error_text = await response.text()
                         logger.error(f"Ошибка получения списка пользователей: статус {response.status}, ответ: {error_text}")
                         return None
+                    data = await response.json()
+                page_users = data.get('_embedded', {}).get('users', [])
+                users.extend(page_users)
+                if len(page_users) < USERS_PAGE_LIMIT or not data.get('_links', {}).get('next'):
+                    break
+                page += 1
         except Exception as e:
             logger.error(f"Исключение при получении списка пользователей: {e}", exc_info=True)
             return None
+        
+        logger.debug(f"Получен список пользователей: {len(users)} пользователей")
+        return users
+
+    async def get_user_directory(self) -> Optional[UserDirectory]:
+        """Справочник пользователей аккаунта (с кэшем на USER_DIRECTORY_TTL секунд)
+        
+        Returns:
+            Справочник или None, если список пользователей получить не удалось
+        """
+        async def load() -> Optional[UserDirectory]:
+            users = await self.get_users()
+            return UserDirectory(users) if users is not None else None
+        
+        return await _user_directory_cache.get_or_load(self.config.subdomain, load)
+
+    async def get_contacts_page(self, page: int, limit: int = 250) -> Optional[list]:
+        """Получить страницу контактов
+        
+        Args:
+            page: Номер страницы (с 1)
+            limit: Контактов на странице (не больше 250)
+            
+        Returns:
+            Список контактов (пустой, если страниц больше нет) или None при ошибке
+        """
+        headers = {"Content-Type": "application/json"}
+        url = f"{self.base_url}/api/v4/contacts"
+        params = {"page": page, "limit": limit}
+        logger.debug(f"Запрос страницы контактов {page}: {url}")
+        
+        try:
+            async with self._request("GET", url, headers=headers, params=params) as response:
+                if response.status == 204:
+                    return []
+                if response.status == 200:
+                    data = await response.json()
+                    return data.get('_embedded', {}).get('contacts', [])
+                error_text = await response.text()
+                logger.error(f"Ошибка получения контактов: статус {response.status}, ответ: {error_text}")
+                return None
+        except Exception as e:
+            logger.error(f"Исключение при получении контактов: {e}", exc_info=True)
+            return None
+
+    async def get_leads_page(self, updated_from: int, page: int, limit: int = 250) -> Optional[list]:
+        """Получить страницу сделок, измененных начиная с updated_from (по возрастанию updated_at)
+        
+        Args:
+            updated_from: Unix time, с которого брать изменения (включительно)
+            page: Номер страницы (с 1)
+            limit: Сделок на странице (не больше 250)
+            
+        Returns:
+            Список сделок (пустой, если страниц больше нет) или None при ошибке
+        """
+        headers = {"Content-Type": "application/json"}
+        url = f"{self.base_url}/api/v4/leads"
+        params = {
+            "filter[updated_at][from]": updated_from,
+            "order[updated_at]": "asc",
+            "page": page,
+            "limit": limit,
+        }
+        logger.debug(f"Запрос страницы сделок {page} (изменены с {updated_from}): {url}")
+        
+        try:
+            async with self._request("GET", url, headers=headers, params=params) as response:
+                if response.status == 204:
+                    return []
+                if response.status == 200:
+                    data = await response.json()
+                    return data.get('_embedded', {}).get('leads', [])
+                error_text = await response.text()
+                logger.error(f"Ошибка получения сделок: статус {response.status}, ответ: {error_text}")
+                return None
+        except Exception as e:
+            logger.error(f"Исключение при получении сделок: {e}", exc_info=True)
+            return None
 
     async def find_user_by_name(self, name: str) -> Optional[int]:
         """Найти пользователя по имени (частичное совпадение)
@@ -114,34 +478,21 @@ class AmoCRM:
         Returns:
             ID пользователя или None если не найден
         """
-        users = await self.get_users()
-        if not users:
+        directory = await self.get_user_directory()
+        if not directory:
             return None
         
-        name_lower = name.lower()
-        for user in users:
-            user_name = user.get('name', '')
-            if name_lower in user_name.lower() or user_name.lower() in name_lower:
-                user_id = user.get('id')
-                logger.info(f"Найден пользователь '{user_name}' с ID: {user_id}")
-                return user_id
+        user = directory.find(name)
+        if user:
+            user_id = user.get('id')
+            logger.info(f"Найден пользователь '{user.get('name', '')}' с ID: {user_id}")
+            return user_id
         
         logger.warning(f"Пользователь с именем '{name}' не найден")
         return None
 
-    async def create_contact(self, user_data: Dict) -> Optional[int]:
-        """Создать контакт в AmoCRM
-        
-        Возвращает ID созданного контакта или None при ошибке
-        """
-        logger.info(f"Создание контакта в AmoCRM для пользователя: {user_data.get('name', 'Неизвестно')}")
-        access_token = await self._get_access_token()
-        
-        headers = {
-            "Authorization": f"Bearer {access_token}",
-            "Content-Type": "application/json"
-        }
-
+    def _build_contact_data(self, user_data: Dict) -> Dict:
+        """Сформировать данные контакта в формате API AmoCRM"""
         # Формируем данные контакта
         contact_data = {
             "name": user_data.get('name', 'Неизвестно'),
@@ -209,61 +560,41 @@ class AmoCRM:
         contact_data["_embedded"] = {
             "tags": [{"name": tag} for tag in tags]
         }
+        return contact_data
 
-        url = f"{self.base_url}/api/v4/contacts"
-        logger.debug(f"Отправка запроса на создание контакта в AmoCRM: {url}")
+    async def create_contact(self, user_data: Dict) -> Optional[int]:
+        """Создать контакт в AmoCRM
+        
+        Возвращает ID созданного контакта или None при ошибке
+        """
+        logger.info(f"Создание контакта в AmoCRM для пользователя: {user_data.get('name', 'Неизвестно')}")
+        contact_data = self._build_contact_data(user_data)
         logger.debug(f"Данные контакта: {contact_data}")
         
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(url, headers=headers, json=[contact_data]) as response:
-                    response_text = await response.text()
-                    
-                    # AmoCRM может возвращать как 200, так и 201 при успешном создании
-                    if response.status in (200, 201):
-                        try:
-                            data = await response.json()
-                            # Проверяем структуру ответа
-                            if '_embedded' in data and 'contacts' in data['_embedded']:
-                                contact_id = data['_embedded']['contacts'][0].get('id')
-                                if contact_id:
-                                    logger.info(f"✅ Контакт успешно создан в AmoCRM с ID: {contact_id}")
-                                    return contact_id
-                                else:
-                                    logger.error(f"❌ ID контакта не найден в ответе: {data}")
-                                    return None
-                            else:
-                                logger.error(f"❌ Неожиданная структура ответа при создании контакта: {data}")
-                                return None
-                        except Exception as e:
-                            logger.error(f"❌ Ошибка парсинга ответа при создании контакта: {e}, ответ: {response_text}")
-                            return None
-                    else:
-                        logger.error(f"❌ Ошибка создания контакта в AmoCRM: статус {response.status}, ответ: {response_text}")
-                        return None
-        except aiohttp.ClientError as e:
-            logger.error(f"Ошибка HTTP при создании контакта в AmoCRM: {e}")
+            # Контакт уходит в AmoCRM одним пакетом с контактами других заявок
+            contact = await self._get_batcher("contacts").submit(contact_data)
+        except AmoBatchError as e:
+            logger.error(f"❌ Ошибка создания контакта в AmoCRM: {e} {e.details or ''}")
             return None
         except Exception as e:
             logger.error(f"Исключение при создании контакта в AmoCRM: {e}", exc_info=True)
             return None
+        
+        contact_id = contact.get('id')
+        if not contact_id:
+            logger.error(f"❌ ID контакта не найден в ответе: {contact}")
+            return None
+        logger.info(f"✅ Контакт успешно создан в AmoCRM с ID: {contact_id}")
+        return contact_id
 
-    async def create_lead(self, user_data: Dict, contact_id: Optional[int] = None, is_city1: bool = False) -> Optional[Dict]:
-        """Создать сделку в AmoCRM и привязать к контакту
+    async def _build_lead_data(self, user_data: Dict, is_city1: bool) -> Dict:
+        """Сформировать данные сделки в формате API AmoCRM (без контакта)
         
         Args:
             user_data: Данные пользователя
-            contact_id: ID контакта для привязки
             is_city1: True если это АТЛАНТ (city1), False если ЭТАЖИ (city2)
         """
-        logger.info(f"Создание сделки в AmoCRM для пользователя: {user_data.get('name', 'Неизвестно')}, CRM: {'АТЛАНТ' if is_city1 else 'ЭТАЖИ'}")
-        access_token = await self._get_access_token()
-        
-        headers = {
-            "Authorization": f"Bearer {access_token}",
-            "Content-Type": "application/json"
-        }
-
         # Формируем название сделки в формате: 
         # АТЛАНТ: "Город, Проект, ДД.ММ.ГГГГ. Квиз 3 - скидка 300 рублей"
         # ЭТАЖИ: "Город, Проект, ДД.ММ.ГГГГ. Квиз 1 - скидка 300"
@@ -307,54 +638,21 @@ class AmoCRM:
         
         logger.debug(f"Сформировано название сделки: {lead_name}")
         
-        # Для АТЛАНТ используем воронку 5283247
+        # Воронки аккаунтов задаются в файле маршрутизации городов (city_routing.json)
         if is_city1:
-            pipeline_id = 5283247
+            pipeline_id = get_city_router().account("city1").pipeline_id
             # Статус "принято в работу" - используем None, AmoCRM установит статус по умолчанию
-            # Получение статусов через API занимает время, поэтому пропускаем
-            # Если нужен конкретный статус, можно указать его ID напрямую
+            # Если нужен конкретный статус, его можно взять из кэша статусов воронки:
+            # status_id = await self.get_accepted_status_id(pipeline_id)
             status_id = None
             
-            # Опционально: можно получить статус, но это замедляет создание сделки
-            # Раскомментируйте, если нужен конкретный статус:
-            # try:
-            #     pipeline_data = await self.get_pipeline_statuses(pipeline_id)
-            #     if pipeline_data:
-            #         statuses = pipeline_data.get('_embedded', {}).get('statuses', [])
-            #         for status in statuses:
-            #             status_name = status.get('name', '').lower()
-            #             if 'принято' in status_name and 'работ' in status_name:
-            #                 status_id = status.get('id')
-            #                 logger.info(f"Найден статус 'принято в работу' с ID: {status_id}")
-            #                 break
-            #         if not status_id and statuses:
-            #             first_status = statuses[0]
-            #             status_id = first_status.get('id')
-            #             logger.info(f"Используется первый статус воронки с ID: {status_id}")
-            # except Exception as e:
-            #     logger.warning(f"Не удалось получить статус воронки: {e}. Сделка будет создана со статусом по умолчанию")
-            
             logger.debug(f"Создание сделки для АТЛАНТ: Pipeline ID: {pipeline_id}, Status ID: {status_id or 'по умолчанию'}")
         else:
-            # Для ЭТАЖИ используем воронку 6497210
-            pipeline_id = 6497210
-            # Получаем статус "принято в работу" для ЭТАЖИ
+            pipeline_id = get_city_router().account("city2").pipeline_id
+            # Статус "принято в работу" для ЭТАЖИ берется из кэша статусов воронки
             status_id = None
             try:
-                pipeline_data = await self.get_pipeline_statuses(pipeline_id)
-                if pipeline_data:
-                    statuses = pipeline_data.get('_embedded', {}).get('statuses', [])
-                    for status in statuses:
-                        status_name = status.get('name', '').lower()
-                        if 'принято' in status_name and 'работ' in status_name:
-                            status_id = status.get('id')
-                            logger.info(f"Найден статус 'принято в работу' для ЭТАЖИ с ID: {status_id}")
-                            break
-                    if not status_id and statuses:
-                        # Если не нашли, используем первый статус воронки
-                        first_status = statuses[0]
-                        status_id = first_status.get('id')
-                        logger.info(f"Используется первый статус воронки ЭТАЖИ с ID: {status_id}")
+                status_id = await self.get_accepted_status_id(pipeline_id)
             except Exception as e:
                 logger.warning(f"Не удалось получить статус воронки ЭТАЖИ: {e}. Сделка будет создана со статусом по умолчанию")
             
@@ -466,6 +764,21 @@ class AmoCRM:
         if not is_city1 and self.config.responsible_user_id:
             lead_data["responsible_user_id"] = self.config.responsible_user_id
             logger.info(f"Назначен ответственный за сделку (ЭТАЖИ): user_id={self.config.responsible_user_id}")
+        return lead_data
+
+    async def create_lead(self, user_data: Dict, contact_id: Optional[int] = None, is_city1: bool = False,
+                          raise_errors: bool = False) -> Optional[Dict]:
+        """Создать сделку в AmoCRM и привязать к контакту
+        
+        Args:
+            user_data: Данные пользователя
+            contact_id: ID контакта для привязки
+            is_city1: True если это АТЛАНТ (city1), False если ЭТАЖИ (city2)
+            raise_errors: Пробрасывать AmoBatchError вместо возврата None, чтобы
+                вызывающий мог отличить отказ AmoCRM от временной ошибки
+        """
+        logger.info(f"Создание сделки в AmoCRM для пользователя: {user_data.get('name', 'Неизвестно')}, CRM: {'АТЛАНТ' if is_city1 else 'ЭТАЖИ'}")
+        lead_data = await self._build_lead_data(user_data, is_city1)
 
         # Привязываем контакт к сделке
         if contact_id:
@@ -473,46 +786,110 @@ class AmoCRM:
                 lead_data["_embedded"] = {}
             lead_data["_embedded"]["contacts"] = [{"id": contact_id}]
 
-        url = f"{self.base_url}/api/v4/leads"
-        logger.debug(f"Отправка запроса на создание сделки в AmoCRM: {url}")
         logger.debug(f"Данные сделки: {lead_data}")
         
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(url, headers=headers, json=[lead_data]) as response:
-                    response_text = await response.text()
-                    
-                    # AmoCRM может возвращать как 200, так и 201 при успешном создании
-                    if response.status in (200, 201):
-                        try:
-                            data = await response.json()
-                            # Проверяем структуру ответа
-                            if '_embedded' in data and 'leads' in data['_embedded']:
-                                lead_id = data['_embedded']['leads'][0].get('id')
-                                if lead_id:
-                                    logger.info(f"✅ Сделка успешно создана в AmoCRM с ID: {lead_id}")
-                                    return data
-                                else:
-                                    logger.error(f"❌ ID сделки не найден в ответе: {data}")
-                                    return None
-                            else:
-                                logger.error(f"❌ Неожиданная структура ответа при создании сделки: {data}")
-                                return None
-                        except Exception as e:
-                            logger.error(f"❌ Ошибка парсинга ответа при создании сделки: {e}, ответ: {response_text}")
-                            return None
-                    else:
-                        logger.error(f"❌ Ошибка создания сделки в AmoCRM: статус {response.status}, ответ: {response_text}")
-                        return None
-        except aiohttp.ClientError as e:
-            logger.error(f"Ошибка HTTP при создании сделки в AmoCRM: {e}")
+            # Сделка уходит в AmoCRM одним пакетом со сделками других заявок
+            lead = await self._get_batcher("leads").submit(lead_data)
+        except AmoBatchError as e:
+            logger.error(f"❌ Ошибка создания сделки в AmoCRM: {e} {e.details or ''}")
+            if raise_errors:
+                raise
             return None
         except Exception as e:
             logger.error(f"Исключение при создании сделки в AmoCRM: {e}", exc_info=True)
             return None
+        
+        lead_id = lead.get('id')
+        if not lead_id:
+            logger.error(f"❌ ID сделки не найден в ответе: {lead}")
+            return None
+        logger.info(f"✅ Сделка успешно создана в AmoCRM с ID: {lead_id}")
+        # Формат ответа как у POST /api/v4/leads для одной сделки
+        return {"_embedded": {"leads": [lead]}}
+
+    async def create_complex_lead(self, user_data: Dict, is_city1: bool = False,
+                                  raise_errors: bool = False) -> Optional[Dict]:
+        """Создать сделку вместе с новым контактом одним запросом (POST /api/v4/leads/complex)
+        
+        Args:
+            user_data: Данные пользователя
+            is_city1: True если это АТЛАНТ (city1), False если ЭТАЖИ (city2)
+            raise_errors: Пробрасывать AmoBatchError вместо возврата None, чтобы
+                вызывающий мог отличить отказ AmoCRM от временной ошибки
+            
+        Returns:
+            Ответ в том же формате, что и create_lead, или None при ошибке
+        """
+        logger.info(f"Создание сделки с контактом в AmoCRM одним запросом: {user_data.get('name', 'Неизвестно')}, CRM: {'АТЛАНТ' if is_city1 else 'ЭТАЖИ'}")
+        lead_data = await self._build_lead_data(user_data, is_city1)
+        lead_data.setdefault("_embedded", {})["contacts"] = [self._build_contact_data(user_data)]
+        logger.debug(f"Данные сделки с контактом: {lead_data}")
+        
+        try:
+            lead = await self._get_batcher("leads/complex").submit(lead_data)
+        except AmoBatchError as e:
+            logger.error(f"❌ Ошибка создания сделки с контактом в AmoCRM: {e} {e.details or ''}")
+            if raise_errors:
+                raise
+            return None
+        except Exception as e:
+            logger.error(f"Исключение при создании сделки с контактом в AmoCRM: {e}", exc_info=True)
+            return None
+        
+        lead_id = lead.get('id')
+        if not lead_id:
+            logger.error(f"❌ ID сделки не найден в ответе: {lead}")
+            return None
+        logger.info(f"✅ Сделка с контактом успешно создана в AmoCRM: сделка {lead_id}, контакт {lead.get('contact_id')}")
+        return {"_embedded": {"leads": [lead]}}
+
 
+async def _remember_contact(db: Optional['Database'], subdomain: str, keys: List[str], contact_id: Optional[int]):
+    """Записать созданный контакт в локальный индекс (ошибка индекса не мешает заявке)"""
+    if db is None or not keys or not contact_id:
+        return
+    try:
+        await db.save_crm_contacts(subdomain, [(key, contact_id) for key in keys])
+    except Exception as e:
+        logger.error(f"Не удалось записать контакт {contact_id} в индекс контактов: {e}", exc_info=True)
 
-async def create_lead_in_city(user_data: Dict, city: str, city1_config: AmoCRMConfig, city2_config: AmoCRMConfig, telegram_id: Optional[int] = None, telegram_username: Optional[str] = None):
+
+async def _remember_lead(db: Optional['Database'], subdomain: str, user_id: Optional[int],
+                         lead_result: Optional[Dict], pipeline_id: Optional[int]):
+    """Записать созданную сделку для синхронизации статусов (ошибка записи не мешает заявке)"""
+    if db is None or not lead_result:
+        return
+    leads = lead_result.get('_embedded', {}).get('leads') or [{}]
+    lead_id = leads[0].get('id')
+    if not lead_id:
+        return
+    try:
+        await db.save_crm_lead(subdomain, lead_id, user_id, pipeline_id, leads[0].get('status_id'))
+    except Exception as e:
+        logger.error(f"Не удалось записать сделку {lead_id} в crm_leads: {e}", exc_info=True)
+
+
+def _rejects_payload(error: AmoBatchError) -> bool:
+    """AmoCRM точно отклонил данные запроса (4xx), а не ответил временной ошибкой
+    
+    Таймаут, обрыв соединения, 5xx, 401 (токен не обновился), 408 и 429 - временные
+    ошибки: сущность могла быть создана, или ее примут при повторе того же запроса.
+    """
+    return error.status is not None and 400 <= error.status < 500 and error.status not in (401, 408, 429)
+
+
+def _rejects_contact(error: AmoBatchError) -> bool:
+    """AmoCRM отклонил сделку из-за привязанного контакта (контакт удален или объединен)"""
+    if error.status is None or not 400 <= error.status < 500:
+        return False
+    for detail in error.details:
+        if isinstance(detail, dict) and "contact" in f"{detail.get('path', '')} {detail.get('detail', '')}".lower():
+            return True
+    return False
+
+
+async def create_lead_in_city(user_data: Dict, city: str, city1_config: AmoCRMConfig, city2_config: AmoCRMConfig, telegram_id: Optional[int] = None, telegram_username: Optional[str] = None, use_complex: bool = True, db: Optional['Database'] = None):
     """Создать контакт и сделку в соответствующем AmoCRM по городу
     
     Args:
@@ -522,53 +899,26 @@ async def create_lead_in_city(user_data: Dict, city: str, city1_config: AmoCRMCo
         city2_config: Конфигурация второго AmoCRM
         telegram_id: Telegram ID пользователя
         telegram_username: Telegram username пользователя
-    """
-    city_lower = city.lower() if city else ""
-    
-    # Города для первой CRM (АТЛАНТ) - все эти города используют номер 8 (800) 555-48-52
-    city1_cities = [
-        "волгоград", "volgograd",
-        "краснодар", "krasnodar",
-        "ростов-на-дону", "ростов", "rostov", "rostov-on-don",
-        "самара", "samara",
-        "сочи", "sochi",
-        "ставрополь", "stavropol",
-        "уфа", "ufa",
-    ]
-    
-    # Города для второй CRM (ЭТАЖИ)
-    city2_cities = [
-        "воронеж", "voronezh",
-        "екатеринбург", "ekaterinburg", "yekaterinburg",
-        "ижевск", "izhevsk",
-        "казань", "kazan",
-        "красноярск", "krasnoyarsk",
-        "липецк", "lipetsk",
-        "минск", "minsk",
-        "набережные челны", "naberezhnye chelny",
-        "нижний новгород", "nizhny novgorod", "nizhny-novgorod",
-        "новосибирск", "novosibirsk",
-        "омск", "omsk",
-        "тамбов", "tambov",
-        "тюмень", "tyumen",
-        "челябинск", "chelyabinsk",
-    ]
+        use_complex: Сначала пробовать создать сделку с контактом одним запросом
+        db: База данных с индексом контактов; если указана, повторный зритель
+            получает только новую сделку, привязанную к его контакту, а созданная
+            сделка записывается в crm_leads для синхронизации статусов
     
-    # Определяем, какой CRM использовать
-    is_city1 = False
-    if any(city_keyword in city_lower for city_keyword in city1_cities):
-        logger.info(f"Выбран AmoCRM City1 (АТЛАНТ) для города {city}")
-        amocrm = AmoCRM(city1_config)
-        is_city1 = True
-    elif any(city_keyword in city_lower for city_keyword in city2_cities):
-        logger.info(f"Выбран AmoCRM City2 (ЭТАЖИ) для города {city}")
-        amocrm = AmoCRM(city2_config)
-        is_city1 = False
+    Raises:
+        CircuitOpenError: AmoCRM аккаунта недоступен (выключатель разомкнут)
+        AmoBatchError: Временная ошибка запроса сделки с контактом (таймаут,
+            5xx, обрыв соединения): очередь повторит тот же запрос
+    """
+    route = route_city(city)
+    if route.city is None:
+        logger.warning(f"Город {city} не найден в маршрутизации, используется {route.crm_type} ({route.account_name}) по умолчанию")
     else:
-        # Если город не определен, используем City2 по умолчанию
-        logger.warning(f"Город {city} не найден в списках, используется City2 (ЭТАЖИ) по умолчанию")
-        amocrm = AmoCRM(city2_config)
-        is_city1 = False
+        logger.info(f"Выбран AmoCRM {route.crm_type} ({route.account_name}) для города {city}")
+    is_city1 = route.crm_type == "city1"
+    amocrm = AmoCRM(city1_config if is_city1 else city2_config)
+    
+    # Пока AmoCRM аккаунта недоступен, не занимаем соединения: заявка останется в очереди
+    get_circuit_breaker(amocrm.config.subdomain).ensure_available()
     
     # Добавляем telegram данные в user_data
     user_data_with_telegram = user_data.copy()
@@ -577,6 +927,49 @@ async def create_lead_in_city(user_data: Dict, city: str, city1_config: AmoCRMCo
     if telegram_username:
         user_data_with_telegram['telegram_username'] = telegram_username
     
+    subdomain = amocrm.config.subdomain
+    keys = contact_keys(user_data.get('phone'), user_data.get('email')) if db is not None else []
+    if keys:
+        try:
+            contact_id = await db.find_crm_contact(subdomain, keys)
+        except Exception as e:
+            logger.error(f"Ошибка поиска в индексе контактов: {e}", exc_info=True)
+            contact_id = None
+        if contact_id:
+            logger.info(f"Найден существующий контакт AmoCRM {contact_id}, создаем только сделку")
+            try:
+                lead_result = await amocrm.create_lead(user_data_with_telegram, contact_id, is_city1=is_city1,
+                                                       raise_errors=True)
+            except AmoBatchError as e:
+                lead_result = None
+                if _rejects_contact(e):
+                    # Контакт удалили или объединили в AmoCRM: при повторной отправке
+                    # заявки контакт будет создан заново
+                    logger.warning(f"AmoCRM отклонил контакт {contact_id}, контакт удален из индекса")
+                    await db.forget_crm_contact(subdomain, contact_id)
+                # Временные ошибки (таймаут, 5xx, выключатель) индекс не меняют:
+                # повторная отправка привяжет сделку к тому же контакту
+            await _remember_lead(db, subdomain, telegram_id, lead_result, route.pipeline_id)
+            return lead_result
+    
+    if use_complex:
+        try:
+            lead_result = await amocrm.create_complex_lead(user_data_with_telegram, is_city1=is_city1,
+                                                           raise_errors=True)
+        except AmoBatchError as e:
+            if not _rejects_payload(e):
+                # AmoCRM мог создать сделку и контакт, но ответ не дошел: контакт и сделка
+                # по отдельности дали бы дубли, поэтому очередь повторит этот же запрос
+                raise
+            logger.warning(f"AmoCRM отклонил сделку с контактом (статус {e.status}), "
+                           f"создаем контакт и сделку по отдельности")
+        else:
+            if lead_result:
+                await _remember_contact(db, subdomain, keys, lead_result['_embedded']['leads'][0].get('contact_id'))
+                await _remember_lead(db, subdomain, telegram_id, lead_result, route.pipeline_id)
+            # Ответ без ID сделки не означает отказ: повтор выполнит очередь
+            return lead_result
+    
     # Создаем контакт
     contact_id = await amocrm.create_contact(user_data_with_telegram)
     
@@ -584,7 +977,10 @@ async def create_lead_in_city(user_data: Dict, city: str, city1_config: AmoCRMCo
         logger.error("Не удалось создать контакт в AmoCRM")
         return None
     
+    await _remember_contact(db, subdomain, keys, contact_id)
+    
     # Передаем is_city1 для правильной настройки сделки
     lead_result = await amocrm.create_lead(user_data_with_telegram, contact_id, is_city1=is_city1)
+    await _remember_lead(db, subdomain, telegram_id, lead_result, route.pipeline_id)
     
     return lead_result
@@ -0,0 +1,171 @@
+"""Пакетная отправка контактов и сделок в AmoCRM
+
+Методы POST /api/v4/contacts, /api/v4/leads и /api/v4/leads/complex
+принимают массив сущностей.
+AmoBatcher копит сущности, поставленные разными корутинами, в течение
+короткого окна (или до AMOCRM_BATCH_MAX_SIZE штук) и отправляет их одним
+запросом. Каждой сущности проставляется request_id, по которому ответ
+AmoCRM (ID созданной сущности или ошибка валидации) возвращается тому,
+кто ее поставил.
+"""
+import asyncio
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple, Union
+
+from logger import get_logger
+from services.task_supervisor import get_task_supervisor
+
+logger = get_logger(__name__)
+
+# Сколько ждать другие сущности перед отправкой пакета, сек
+AMOCRM_BATCH_WINDOW = 0.05
+# AmoCRM рекомендует передавать не более 50 сущностей за запрос
+AMOCRM_BATCH_MAX_SIZE = 50
+
+# Функция отправки пакета: (тип сущностей, список сущностей) -> (HTTP статус, JSON ответа или None, текст ответа)
+BatchSender = Callable[[str, List[Dict]], Awaitable[Tuple[int, Optional[Union[Dict, List]], str]]]
+
+
+class AmoBatchError(Exception):
+    """Сущность не создана: ошибка запроса или валидации в AmoCRM"""
+
+    def __init__(self, message: str, status: Optional[int] = None, details: Optional[list] = None):
+        super().__init__(message)
+        self.status = status
+        # Ошибки валидации этой сущности из ответа AmoCRM (validation-errors)
+        self.details = details or []
+
+
+class AmoBatcher:
+    """Объединение создаваемых сущностей одного типа одного аккаунта в пакеты"""
+
+    def __init__(self, name: str, entity: str, send: BatchSender,
+                 window: float = AMOCRM_BATCH_WINDOW, max_size: int = AMOCRM_BATCH_MAX_SIZE):
+        """Инициализация
+
+        Args:
+            name: Название для логов (например, поддомен аккаунта)
+            entity: Путь метода API после /api/v4/ ("contacts", "leads" или "leads/complex")
+            send: Корутина-функция, отправляющая пакет
+            window: Время накопления пакета, сек
+            max_size: Максимальный размер пакета
+        """
+        self.name = name
+        self.entity = entity
+        self.send = send
+        self.window = window
+        self.max_size = max(max_size, 1)
+        self._pending: List[Tuple[Dict, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    async def submit(self, item: Dict) -> Dict:
+        """Поставить сущность в пакет и дождаться результата
+
+        Args:
+            item: Данные сущности в формате API AmoCRM
+
+        Returns:
+            Созданная сущность из ответа AmoCRM (с полем id)
+
+        Raises:
+            AmoBatchError: Сущность не создана
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+        if len(self._pending) >= self.max_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        """Отправить накопленный пакет в фоне"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        # Вызывающие, которых уже отменили, в пакет не попадают
+        batch = [(item, future) for item, future in batch if not future.done()]
+        if not batch:
+            return
+        try:
+            # Отправка в супервизоре: при остановке бота пакет в работе успеет дойти до AmoCRM
+            get_task_supervisor().spawn(self._send_batch(batch), "amocrm_batch",
+                                        name=f"amocrm_batch_{self.name}_{self.entity}")
+        except RuntimeError as e:
+            self._fail(dict(enumerate(batch)), AmoBatchError(str(e)))
+
+    async def _send_batch(self, batch: List[Tuple[Dict, asyncio.Future]]):
+        """Отправить пакет и раздать результаты по request_id"""
+        waiting: Dict[str, Tuple[Dict, asyncio.Future]] = {
+            str(i): (item, future) for i, (item, future) in enumerate(batch)
+        }
+        # AmoCRM отклоняет весь запрос, если хотя бы одна сущность не прошла валидацию.
+        # Такие сущности получают свою ошибку, остальные отправляются повторно
+        while waiting:
+            items = [dict(item, request_id=request_id) for request_id, (item, _) in waiting.items()]
+            try:
+                status, data, text = await self.send(self.entity, items)
+            except asyncio.CancelledError:
+                self._fail(waiting, AmoBatchError("Отправка пакета прервана"))
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка отправки пакета {self.entity} ({len(items)} шт.) в AmoCRM {self.name}: {e}")
+                self._fail(waiting, AmoBatchError(str(e) or type(e).__name__))
+                return
+
+            if status in (200, 201) and data is not None:
+                self._resolve(waiting, data)
+                return
+
+            invalid = self._validation_errors(data) if status == 400 else {}
+            invalid = {request_id: errors for request_id, errors in invalid.items() if request_id in waiting}
+            if not invalid:
+                logger.error(f"❌ AmoCRM {self.name} отклонил пакет {self.entity} ({len(items)} шт.): статус {status}, ответ: {text}")
+                self._fail(waiting, AmoBatchError(f"Статус {status}: {text[:500]}", status=status))
+                return
+
+            for request_id, errors in invalid.items():
+                _, future = waiting.pop(request_id)
+                logger.debug(f"AmoCRM {self.name}: ошибка валидации в пакете {self.entity}: {errors}")
+                if not future.done():
+                    future.set_exception(AmoBatchError("Ошибка валидации", status=status, details=errors))
+            if waiting:
+                logger.info(f"Повторная отправка пакета {self.entity} без невалидных сущностей: {len(waiting)} шт.")
+
+    def _resolve(self, waiting: Dict[str, Tuple[Dict, asyncio.Future]], data: Union[Dict, List]):
+        """Раздать созданные сущности ожидающим"""
+        if isinstance(data, list):
+            # leads/complex отвечает списком: [{"id", "contact_id", "request_id": [...]}]
+            created = data
+        else:
+            created = data.get('_embedded', {}).get(self.entity, [])
+        for position, entity in enumerate(created):
+            request_id = entity.get('request_id', position)
+            if isinstance(request_id, list):
+                request_id = request_id[0] if request_id else position
+            request_id = str(request_id)
+            pending = waiting.pop(request_id, None)
+            if pending and not pending[1].done():
+                pending[1].set_result(entity)
+        # Сущности, которых нет в ответе
+        self._fail(waiting, AmoBatchError(f"Сущность отсутствует в ответе AmoCRM: {data}"))
+        logger.debug(f"Пакет {self.entity} AmoCRM {self.name}: создано {len(created)} шт.")
+
+    @staticmethod
+    def _validation_errors(data: Optional[Union[Dict, List]]) -> Dict[str, list]:
+        """request_id -> ошибки валидации из ответа 400"""
+        if not isinstance(data, dict):
+            return {}
+        return {
+            str(error.get('request_id')): error.get('errors', [])
+            for error in data.get('validation-errors', [])
+            if error.get('request_id') is not None
+        }
+
+    @staticmethod
+    def _fail(waiting: Dict[str, Tuple[Dict, asyncio.Future]], error: AmoBatchError):
+        for _, future in waiting.values():
+            if not future.done():
+                future.set_exception(error)
+        waiting.clear()
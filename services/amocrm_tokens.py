@@ -0,0 +1,255 @@
+"""Обновление OAuth-токенов AmoCRM внутри бота
+
+Access token AmoCRM живет сутки, refresh token одноразовый: после обновления
+старый перестает работать. Менеджер токенов аккаунта:
+- заранее (за TOKEN_REFRESH_AHEAD секунд до истечения по полю exp в JWT)
+  обновляет access token; одновременные запросы ждут одно общее обновление;
+- сохраняет новую пару токенов в JSON-файл (AMOCRM_TOKENS_PATH) через
+  временный файл и os.replace, чтобы после перезапуска бот продолжил с ней;
+- по ответу 401 обновляет токен вне очереди (см. AmoCRM._request).
+
+Из пары токенов в .env и в файле используется та, что истекает позже:
+после повторной авторизации достаточно прописать новые токены в .env.
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Optional
+
+import aiohttp
+
+from config import AmoCRMConfig
+from logger import get_logger
+
+try:
+    import jwt
+    JWT_AVAILABLE = True
+except ImportError:
+    JWT_AVAILABLE = False
+
+logger = get_logger(__name__)
+
+# За сколько секунд до истечения обновлять access token
+TOKEN_REFRESH_AHEAD = 600
+# Пауза перед следующей попыткой планового обновления после ошибки, сек
+TOKEN_REFRESH_RETRY_DELAY = 60
+
+
+def token_expires_at(token: str) -> Optional[float]:
+    """Время истечения токена (unix time) из поля exp JWT или None"""
+    if not token or not JWT_AVAILABLE:
+        return None
+    try:
+        decoded = jwt.decode(token, options={"verify_signature": False})
+        exp = decoded.get('exp')
+        return float(exp) if exp else None
+    except Exception:
+        return None
+
+
+class TokenStore:
+    """JSON-файл с актуальными токенами аккаунтов: поддомен -> пара токенов"""
+
+    def __init__(self, file_path: str):
+        self.file_path = Path(file_path)
+        self._lock = threading.Lock()
+
+    def _read(self) -> Dict[str, Dict]:
+        try:
+            with open(self.file_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except json.JSONDecodeError as e:
+            logger.error(f"Ошибка парсинга файла токенов {self.file_path}: {e}")
+            return {}
+
+    def load(self, subdomain: str) -> Optional[Dict]:
+        """Сохраненная пара токенов аккаунта или None"""
+        return self._read().get(subdomain)
+
+    def save(self, subdomain: str, access_token: str, refresh_token: str, expires_at: Optional[float]):
+        """Сохранить пару токенов аккаунта (через временный файл и os.replace)"""
+        with self._lock:
+            data = self._read()
+            data[subdomain] = {
+                'access_token': access_token,
+                'refresh_token': refresh_token,
+                'expires_at': expires_at,
+                'updated_at': datetime.now().isoformat(),
+            }
+            tmp_path = self.file_path.with_name(f".{self.file_path.name}.tmp")
+            # Файл с токенами доступен только владельцу
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.file_path)
+        logger.debug(f"Токены AmoCRM {subdomain} сохранены в {self.file_path}")
+
+
+class AmoTokenManager:
+    """Актуальный access token одного аккаунта AmoCRM"""
+
+    def __init__(self, subdomain: str, store: TokenStore):
+        self.subdomain = subdomain
+        self.store = store
+        self._access_token = ''
+        self._refresh_token = ''
+        self._expires_at: Optional[float] = None
+        # Пара токенов из .env, которую менеджер уже видел
+        self._config_tokens: Optional[tuple] = None
+        self._refresh_not_before = 0.0
+        self._lock = asyncio.Lock()
+
+        stored = store.load(subdomain)
+        if stored:
+            self._adopt(stored.get('access_token', ''), stored.get('refresh_token', ''), stored.get('expires_at'))
+
+    def _adopt(self, access_token: str, refresh_token: str, expires_at: Optional[float]) -> bool:
+        """Взять пару токенов, если она истекает позже текущей"""
+        if not access_token:
+            return False
+        if self._access_token and (expires_at or 0) <= (self._expires_at or 0):
+            return False
+        self._access_token = access_token
+        self._refresh_token = refresh_token
+        self._expires_at = expires_at
+        return True
+
+    def _sync_config(self, config: AmoCRMConfig):
+        """Учесть токены из .env (при первом обращении и после перезагрузки конфигурации)"""
+        tokens = (config.access_token, config.refresh_token)
+        if tokens == self._config_tokens:
+            return
+        self._config_tokens = tokens
+        if self._adopt(config.access_token, config.refresh_token, token_expires_at(config.access_token)):
+            logger.debug(f"AmoCRM {self.subdomain}: используются токены из конфигурации")
+
+    def _needs_refresh(self) -> bool:
+        if not self._refresh_token or self._expires_at is None:
+            # Срок неизвестен: обновляем только по ответу 401
+            return False
+        return (self._expires_at - time.time() < TOKEN_REFRESH_AHEAD
+                and time.monotonic() >= self._refresh_not_before)
+
+    async def get_access_token(self, config: AmoCRMConfig, session: aiohttp.ClientSession, base_url: str) -> str:
+        """Актуальный access token (обновляется заранее, до истечения)
+
+        Args:
+            config: Конфигурация аккаунта (client_id, client_secret, redirect_uri)
+            session: HTTP-сессия аккаунта
+            base_url: Базовый URL аккаунта
+        """
+        self._sync_config(config)
+        if self._needs_refresh():
+            async with self._lock:
+                # Пока ждали блокировку, токен мог обновить другой запрос
+                if self._needs_refresh():
+                    if not await self._refresh(config, session, base_url):
+                        self._refresh_not_before = time.monotonic() + TOKEN_REFRESH_RETRY_DELAY
+        return self._access_token
+
+    async def refresh_after_unauthorized(self, config: AmoCRMConfig, session: aiohttp.ClientSession,
+                                         base_url: str, rejected_token: str) -> Optional[str]:
+        """Обновить токен после ответа 401
+
+        Args:
+            rejected_token: Токен, с которым запрос получил 401
+
+        Returns:
+            Новый access token или None, если обновить не удалось
+        """
+        async with self._lock:
+            if self._access_token != rejected_token:
+                # Токен уже обновил другой запрос
+                return self._access_token
+            if await self._refresh(config, session, base_url):
+                return self._access_token
+            return None
+
+    async def _refresh(self, config: AmoCRMConfig, session: aiohttp.ClientSession, base_url: str) -> bool:
+        """Обменять refresh token на новую пару токенов и сохранить ее"""
+        # Пару мог обновить скрипт scripts/update_amocrm_tokens.py
+        stored = self.store.load(self.subdomain)
+        if stored and stored.get('access_token') != self._access_token and self._adopt(
+            stored.get('access_token', ''), stored.get('refresh_token', ''), stored.get('expires_at')
+        ):
+            logger.info(f"AmoCRM {self.subdomain}: взяты обновленные токены из {self.store.file_path}")
+            return True
+
+        if not self._refresh_token:
+            logger.error(f"AmoCRM {self.subdomain}: нет refresh token, обновить access token невозможно")
+            return False
+
+        url = f"{base_url}/oauth2/access_token"
+        data = {
+            "client_id": config.client_id,
+            "client_secret": config.client_secret,
+            "grant_type": "refresh_token",
+            "refresh_token": self._refresh_token,
+            "redirect_uri": config.redirect_uri,
+        }
+        logger.info(f"Обновление токена AmoCRM {self.subdomain}...")
+        try:
+            async with session.post(url, json=data) as response:
+                if response.status != 200:
+                    error_text = await response.text()
+                    logger.error(f"❌ Ошибка обновления токена AmoCRM {self.subdomain}: статус {response.status}, ответ: {error_text}")
+                    return False
+                result = await response.json()
+        except Exception as e:
+            logger.error(f"❌ Исключение при обновлении токена AmoCRM {self.subdomain}: {e}", exc_info=True)
+            return False
+
+        access_token = result.get("access_token")
+        refresh_token = result.get("refresh_token")
+        if not access_token or not refresh_token:
+            logger.error(f"❌ В ответе на обновление токена AmoCRM {self.subdomain} нет токенов: {result}")
+            return False
+
+        expires_at = token_expires_at(access_token)
+        if expires_at is None and result.get("expires_in"):
+            expires_at = time.time() + float(result["expires_in"])
+        self._access_token = access_token
+        self._refresh_token = refresh_token
+        self._expires_at = expires_at
+        self._refresh_not_before = 0.0
+
+        try:
+            self.store.save(self.subdomain, access_token, refresh_token, expires_at)
+        except Exception as e:
+            # Старый refresh token уже недействителен: без сохранения после перезапуска нужна повторная авторизация
+            logger.error(f"❌ Не удалось сохранить токены AmoCRM {self.subdomain}: {e}", exc_info=True)
+        logger.info(f"✅ Токен AmoCRM {self.subdomain} обновлен")
+        return True
+
+
+# Поддомен -> менеджер токенов
+_managers: Dict[str, AmoTokenManager] = {}
+# Путь к файлу токенов -> хранилище
+_stores: Dict[str, TokenStore] = {}
+
+
+def get_token_store(file_path: str) -> TokenStore:
+    """Общее хранилище токенов для файла"""
+    store = _stores.get(file_path)
+    if store is None:
+        store = _stores[file_path] = TokenStore(file_path)
+    return store
+
+
+def get_token_manager(config: AmoCRMConfig) -> AmoTokenManager:
+    """Менеджер токенов аккаунта (один на поддомен)"""
+    manager = _managers.get(config.subdomain)
+    if manager is None or manager.store.file_path != Path(config.tokens_path):
+        manager = _managers[config.subdomain] = AmoTokenManager(config.subdomain, get_token_store(config.tokens_path))
+    return manager
+
+
+def clear_token_managers():
+    """Удалить менеджеры токенов (при остановке бота; токены остаются в файле)"""
+    _managers.clear()
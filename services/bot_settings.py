@@ -1,33 +1,250 @@
 """Сервис для работы с настройками бота (хранится в JSON файле)"""
 import json
 import os
-from typing import Optional, Dict
+import re
+import threading
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import Optional, Dict, Callable, List, Mapping, Any, Tuple
 from pathlib import Path
 from logger import get_logger
+from services.city_routing import get_city_router
 
 logger = get_logger(__name__)
 
+DEFAULT_TICKET_URL = "https://your-ticket-url.com"
+DEFAULT_PROMO_CODE = "FHHD438H"
+
+# Варианты записи телефонов, которые в текстах заменяются на телефон города пользователя
+DEFAULT_PHONE_PLACEHOLDERS = ("8-800-505-51-49", "8 (800) 505-51-49", "8 (800) 555-48-52")
+# Настройки, которые можно переопределять для CRM, города и проекта
+OVERRIDABLE_KEYS = ("promo_code", "ticket_url", "faq_text", "contacts_text", "hotline_phone")
+
+
+def _strip_email_lines(text: str) -> str:
+    """Убрать из текста строки с email и лишние пустые строки"""
+    # Удаляем строки с Email (различные варианты написания)
+    text = re.sub(r'.*[Ee]mail[:\s]*[^\n]*\n?', '', text)
+    text = re.sub(r'.*[Ээ]лектронная почта[:\s]*[^\n]*\n?', '', text)
+    text = re.sub(r'.*[Пп]очта[:\s]*[^\n]*\n?', '', text)
+    # Убираем лишние пустые строки
+    return re.sub(r'\n{3,}', '\n\n', text)
+
+
+@dataclass(frozen=True)
+class ResolvedSettings:
+    """Итоговые настройки для города/проекта с уже подставленным телефоном
+    
+    Attributes:
+        crm_type: CRM города ("city1" или "city2")
+        hotline_phone: Телефон горячей линии
+        promo_code: Общий промокод
+        ticket_url: Ссылка на покупку билетов
+        faq_text: Текст частых вопросов ("(указать промокод)" заменяется
+            промокодом пользователя в обработчике)
+        contacts_text: Текст контактов
+        hotline_text: Текст контактов без строк с email (для "Горячей линии")
+    """
+    crm_type: str
+    hotline_phone: str
+    promo_code: str
+    ticket_url: str
+    faq_text: str
+    contacts_text: str
+    hotline_text: str
+
+
+class SettingsResolver:
+    """Таблица итоговых настроек: глобальные -> CRM -> город -> проект
+    
+    Все уровни сливаются один раз при загрузке настроек, после чего
+    обработчик получает готовые тексты одним поиском в словаре по
+    (город, проект) пользователя.
+    
+    Переопределения задаются в bot_settings.json в ключе "overrides":
+        {
+            "crm": {"city1": {"hotline_phone": "..."}},
+            "cities": {
+                "Казань": {"ticket_url": "...", "projects": {"Салон красоты": {"promo_code": "..."}}}
+            }
+        }
+    """
+    
+    def __init__(self, settings: Dict, phone_placeholders: Tuple[str, ...] = ()):
+        overrides = settings.get('overrides') or {}
+        crm_overrides = overrides.get('crm') or {}
+        self._placeholders = tuple(p for p in (*DEFAULT_PHONE_PLACEHOLDERS, *phone_placeholders) if p)
+        # CRM городов и телефоны горячей линии аккаунтов по умолчанию - из маршрутизации городов
+        self._router = get_city_router()
+        default_crm = self._router.default_crm_type
+        crm_defaults = {
+            crm_type: {'hotline_phone': account.hotline_phone}
+            for crm_type, account in self._router.accounts.items() if account.hotline_phone
+        }
+        self._default_phone = self._router.account().hotline_phone
+        
+        global_values = {key: settings[key] for key in OVERRIDABLE_KEYS if key in settings}
+        self._crm_values: Dict[str, Dict] = {}
+        for crm_type in set(self._router.accounts) | set(crm_overrides):
+            values = dict(global_values)
+            values.update(crm_defaults.get(crm_type, {}))
+            values.update(self._pick(crm_overrides.get(crm_type)))
+            self._crm_values[crm_type] = values
+            # Телефоны всех CRM тоже считаются "чужими" и заменяются в текстах
+            if values.get('hotline_phone') and values['hotline_phone'] not in self._placeholders:
+                self._placeholders += (values['hotline_phone'],)
+        
+        # Ключ таблицы: (город, проект) в нижнем регистре; проект "" - настройки города,
+        # город "" с проектом "#<crm>" - настройки CRM
+        self._table: Dict[Tuple[str, str], ResolvedSettings] = {}
+        for crm_type, values in self._crm_values.items():
+            self._table[('', f'#{crm_type}')] = self._resolve(crm_type, values)
+        self._table[('', '')] = self._table[('', f'#{default_crm}')]
+        
+        for city, city_overrides in (overrides.get('cities') or {}).items():
+            crm_type = city_overrides.get('crm_type') or self._detect_crm_type(city)
+            city_values = dict(self._crm_values.get(crm_type, self._crm_values[default_crm]))
+            city_values.update(self._pick(city_overrides))
+            city_key = city.strip().lower()
+            self._table[(city_key, '')] = self._resolve(crm_type, city_values)
+            for project, project_overrides in (city_overrides.get('projects') or {}).items():
+                project_values = dict(city_values)
+                project_values.update(self._pick(project_overrides))
+                self._table[(city_key, project.strip().lower())] = self._resolve(crm_type, project_values)
+    
+    def __len__(self) -> int:
+        return len(self._table)
+    
+    @staticmethod
+    def _pick(overrides: Optional[Dict]) -> Dict:
+        """Оставить только переопределяемые настройки"""
+        return {key: value for key, value in (overrides or {}).items() if key in OVERRIDABLE_KEYS}
+    
+    def _detect_crm_type(self, city: str) -> str:
+        return self._router.route(city).crm_type
+    
+    def _substitute_phone(self, text: str, phone: str) -> str:
+        """Заменить в тексте все известные телефоны горячей линии на phone"""
+        for placeholder in self._placeholders:
+            if placeholder != phone:
+                text = text.replace(placeholder, phone)
+        return text
+    
+    def _resolve(self, crm_type: str, values: Dict) -> ResolvedSettings:
+        """Собрать итоговые настройки с подставленным телефоном"""
+        phone = values.get('hotline_phone') or self._default_phone
+        contacts_text = self._substitute_phone(values.get('contacts_text', ''), phone)
+        return ResolvedSettings(
+            crm_type=crm_type,
+            hotline_phone=phone,
+            promo_code=values.get('promo_code', DEFAULT_PROMO_CODE),
+            ticket_url=values.get('ticket_url', DEFAULT_TICKET_URL),
+            faq_text=self._substitute_phone(values.get('faq_text', ''), phone),
+            contacts_text=contacts_text,
+            hotline_text=_strip_email_lines(contacts_text) if contacts_text else '',
+        )
+    
+    def resolve(self, city: Optional[str] = None, project: Optional[str] = None) -> ResolvedSettings:
+        """Получить итоговые настройки для города и проекта пользователя
+        
+        Таблица содержит только города и проекты из переопределений. Остальные
+        в таблицу не добавляются: город и проект приходят из ссылок пользователей,
+        и таблица росла бы без ограничения. Для них берутся настройки CRM города
+        (маршрут города кэширует CityRouter).
+        """
+        key = ((city or '').strip().lower(), (project or '').strip().lower())
+        resolved = self._table.get(key)
+        if resolved is not None:
+            return resolved
+        
+        city_key = key[0]
+        if key[1]:
+            # Проект без переопределений: настройки города, если они есть
+            resolved = self._table.get((city_key, ''))
+            if resolved is not None:
+                return resolved
+        if not city_key:
+            return self._table[('', '')]
+        return self._table[('', f'#{self._detect_crm_type(city_key)}')]
+
+
+@dataclass(frozen=True)
+class BotSettings:
+    """Неизменяемый снимок настроек бота
+    
+    Снимок целиком заменяется при изменении настроек, поэтому обработчики
+    могут читать поля без блокировок и без повторного чтения файла.
+    
+    Attributes:
+        ticket_url: Ссылка на покупку билетов
+        promo_code: Общий промокод
+        faq_text: Текст частых вопросов
+        contacts_text: Текст контактов
+        data: Все настройки из файла (только для чтения)
+        resolver: Таблица настроек с учетом переопределений по CRM/городу/проекту
+    """
+    ticket_url: str = DEFAULT_TICKET_URL
+    promo_code: str = DEFAULT_PROMO_CODE
+    faq_text: str = ''
+    contacts_text: str = ''
+    data: Mapping[str, Any] = field(default_factory=lambda: MappingProxyType({}))
+    resolver: SettingsResolver = field(default_factory=lambda: SettingsResolver({}), compare=False, repr=False)
+    
+    @classmethod
+    def from_dict(cls, settings: Dict, phone_placeholders: Tuple[str, ...] = ()) -> "BotSettings":
+        """Собрать снимок из словаря настроек
+        
+        Args:
+            settings: Настройки из файла
+            phone_placeholders: Дополнительные телефоны, заменяемые в текстах
+                на телефон города пользователя
+        """
+        return cls(
+            ticket_url=settings.get('ticket_url', DEFAULT_TICKET_URL),
+            promo_code=settings.get('promo_code', DEFAULT_PROMO_CODE),
+            faq_text=settings.get('faq_text', ''),
+            contacts_text=settings.get('contacts_text', ''),
+            data=MappingProxyType(dict(settings)),
+            resolver=SettingsResolver(settings, phone_placeholders),
+        )
+    
+    def resolve(self, city: Optional[str] = None, project: Optional[str] = None) -> ResolvedSettings:
+        """Итоговые настройки для города и проекта пользователя"""
+        return self.resolver.resolve(city, project)
+
+
+# Подписчик получает новый снимок после каждого изменения настроек
+SettingsSubscriber = Callable[[BotSettings], None]
+
 
 class BotSettingsService:
     """Сервис для работы с настройками бота"""
     
-    def __init__(self, file_path: str = "./bot_settings.json"):
+    def __init__(self, file_path: str = "./bot_settings.json", phone_placeholders: Tuple[str, ...] = ()):
         """Инициализация сервиса
         
         Args:
             file_path: Путь к JSON файлу с настройками
+            phone_placeholders: Дополнительные телефоны в текстах, которые заменяются
+                на телефон горячей линии города пользователя (например, HOTLINE_PHONE)
         """
         self.file_path = Path(file_path)
+        self.phone_placeholders = tuple(phone_placeholders)
         logger.debug(f"Инициализация BotSettingsService с файлом: {self.file_path}")
+        self._lock = threading.Lock()
+        self._subscribers: List[SettingsSubscriber] = []
+        self._signature: Optional[Tuple[int, int]] = None
+        self._snapshot = BotSettings()
         self._ensure_file_exists()
+        self.snapshot()
     
     def _ensure_file_exists(self):
         """Создать файл с настройками по умолчанию, если его нет"""
         if not self.file_path.exists():
             logger.info(f"Создание файла настроек: {self.file_path}")
             default_settings = {
-                "ticket_url": "https://your-ticket-url.com",
-                "promo_code": "FHHD438H",  # Общий промокод для всех пользователей
+                "ticket_url": DEFAULT_TICKET_URL,
+                "promo_code": DEFAULT_PROMO_CODE,  # Общий промокод для всех пользователей
                 "faq_text": (
                     "❓ <b>Часто задаваемые вопросы от зрителей</b>\n\n"
                     "💸 <b>Почему на вашем сайте дешевле?</b>\n"
@@ -74,8 +291,12 @@ class BotSettingsService:
             }
             self._write_settings(default_settings)
     
-    def _read_settings(self) -> Dict:
-        """Прочитать настройки из файла"""
+    def _read_settings(self, strict: bool = False) -> Dict:
+        """Прочитать настройки из файла
+        
+        Args:
+            strict: Пробрасывать ошибку парсинга JSON вместо возврата пустых настроек
+        """
         try:
             with open(self.file_path, 'r', encoding='utf-8') as f:
                 data = json.load(f)
@@ -87,73 +308,170 @@ class BotSettingsService:
             return self._read_settings()
         except json.JSONDecodeError as e:
             logger.error(f"Ошибка парсинга JSON файла: {e}")
+            if strict:
+                raise
             return {}
     
     def _write_settings(self, settings: Dict):
-        """Записать настройки в файл"""
+        """Записать настройки в файл (через временный файл и os.replace)"""
+        tmp_path = self.file_path.with_name(f".{self.file_path.name}.tmp")
         try:
-            with open(self.file_path, 'w', encoding='utf-8') as f:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
                 json.dump(settings, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.file_path)
             logger.debug(f"Настройки записаны в файл")
         except Exception as e:
             logger.error(f"Ошибка записи в файл: {e}")
             raise
     
+    def _file_signature(self) -> Optional[Tuple[int, int]]:
+        """Сигнатура файла настроек для проверки изменений на диске (mtime, размер)"""
+        try:
+            stat = self.file_path.stat()
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+    
+    def snapshot(self) -> BotSettings:
+        """Получить текущий снимок настроек
+        
+        Файл перечитывается только если он изменился на диске (например,
+        его отредактировали вручную), иначе возвращается снимок из памяти.
+        Если настройки в файле изменились, подписчики получают новый снимок.
+        """
+        signature = self._file_signature()
+        if signature is not None and signature == self._signature:
+            return self._snapshot
+        
+        changed = False
+        with self._lock:
+            signature = self._file_signature()
+            if signature is None or signature != self._signature:
+                try:
+                    settings = self._read_settings(strict=True)
+                except json.JSONDecodeError:
+                    # Файл испорчен (например, сохранен наполовину при ручной правке):
+                    # оставляем прежний снимок до следующего изменения файла
+                    self._signature = signature
+                    return self._snapshot
+                changed = self._replace_snapshot(settings, self._file_signature())
+            snapshot = self._snapshot
+        if changed:
+            self._notify(snapshot)
+        return snapshot
+    
+    def _replace_snapshot(self, settings: Dict, signature: Optional[Tuple[int, int]]) -> bool:
+        """Атомарно заменить снимок настроек
+        
+        Returns:
+            True, если настройки изменились (подписчиков уведомляет вызывающий,
+            уже отпустив блокировку)
+        """
+        previous = self._snapshot
+        self._snapshot = BotSettings.from_dict(settings, self.phone_placeholders)
+        self._signature = signature
+        if self._snapshot == previous:
+            return False
+        logger.debug("Снимок настроек бота обновлен")
+        return True
+    
+    def _update(self, **changes):
+        """Изменить настройки: записать файл, сразу заменить снимок и уведомить подписчиков"""
+        with self._lock:
+            settings = self._read_settings()
+            settings.update(changes)
+            self._write_settings(settings)
+            changed = self._replace_snapshot(settings, self._file_signature())
+            snapshot = self._snapshot
+        if changed:
+            self._notify(snapshot)
+    
+    def subscribe(self, callback: SettingsSubscriber) -> SettingsSubscriber:
+        """Подписаться на изменения настроек
+        
+        Колбэк сразу вызывается с текущим снимком, а затем после каждого
+        изменения (через set_* или правкой файла). Подходит для кэшей,
+        которые строятся из настроек (отрендеренные тексты, клавиатуры).
+        Можно использовать как декоратор.
+        
+        Args:
+            callback: Функция, принимающая новый снимок BotSettings
+            
+        Returns:
+            Тот же callback
+        """
+        self._subscribers.append(callback)
+        callback(self.snapshot())
+        return callback
+    
+    def unsubscribe(self, callback: SettingsSubscriber):
+        """Отписаться от изменений настроек"""
+        if callback in self._subscribers:
+            self._subscribers.remove(callback)
+    
+    def _notify(self, settings: BotSettings):
+        """Вызвать подписчиков; ошибка одного подписчика не мешает остальным
+        
+        Вызывается без блокировки: подписчик может сам читать настройки.
+        """
+        for callback in list(self._subscribers):
+            try:
+                callback(settings)
+            except Exception as e:
+                logger.error(f"Ошибка в подписчике на настройки {callback!r}: {e}", exc_info=True)
+    
     def get_ticket_url(self) -> str:
         """Получить ссылку на покупку билетов"""
-        settings = self._read_settings()
-        return settings.get('ticket_url', 'https://your-ticket-url.com')
+        return self.snapshot().ticket_url
     
     def set_ticket_url(self, url: str):
         """Установить ссылку на покупку билетов"""
         logger.info(f"Обновление ссылки на билеты: {url}")
-        settings = self._read_settings()
-        settings['ticket_url'] = url
-        self._write_settings(settings)
+        self._update(ticket_url=url)
         logger.debug(f"Ссылка на билеты обновлена")
     
     def get_faq_text(self) -> str:
         """Получить текст частых вопросов"""
-        settings = self._read_settings()
-        return settings.get('faq_text', '')
+        return self.snapshot().faq_text
     
     def set_faq_text(self, text: str):
         """Установить текст частых вопросов"""
         logger.info(f"Обновление текста FAQ")
-        settings = self._read_settings()
-        settings['faq_text'] = text
-        self._write_settings(settings)
+        self._update(faq_text=text)
         logger.debug(f"Текст FAQ обновлен")
     
     def get_contacts_text(self) -> str:
         """Получить текст контактов"""
-        settings = self._read_settings()
-        return settings.get('contacts_text', '')
+        return self.snapshot().contacts_text
     
     def set_contacts_text(self, text: str):
         """Установить текст контактов"""
         logger.info(f"Обновление текста контактов")
-        settings = self._read_settings()
-        settings['contacts_text'] = text
-        self._write_settings(settings)
+        self._update(contacts_text=text)
         logger.debug(f"Текст контактов обновлен")
     
     def get_promo_code(self) -> str:
         """Получить общий промокод"""
-        settings = self._read_settings()
-        return settings.get('promo_code', 'FHHD438H')
+        return self.snapshot().promo_code
     
     def set_promo_code(self, promo_code: str):
         """Установить общий промокод"""
         logger.info(f"Обновление общего промокода: {promo_code}")
-        settings = self._read_settings()
-        settings['promo_code'] = promo_code.strip().upper()
-        self._write_settings(settings)
+        self._update(promo_code=promo_code.strip().upper())
         logger.debug(f"Общий промокод обновлен")
     
+    def resolve(self, city: Optional[str] = None, project: Optional[str] = None) -> ResolvedSettings:
+        """Получить итоговые настройки для города и проекта пользователя
+        
+        Args:
+            city: Город пользователя
+            project: Спектакль пользователя
+        """
+        return self.snapshot().resolve(city, project)
+    
     def get_all_settings(self) -> Dict:
-        """Получить все настройки"""
-        return self._read_settings()
+        """Получить все настройки (копия)"""
+        return dict(self.snapshot().data)
 
 
 # Глобальный экземпляр сервиса
@@ -168,15 +486,21 @@ def get_bot_settings_service(file_path: str = None) -> BotSettingsService:
     """
     global _bot_settings_service
     
+    phone_placeholders = ()
     if file_path is None:
         try:
-            from config import Config
-            config = Config.load()
+            from config import get_config
+            config = get_config()
             file_path = getattr(config, 'bot_settings_path', './bot_settings.json')
+            phone_placeholders = (config.hotline_phone,) if config.hotline_phone else ()
         except:
             file_path = "./bot_settings.json"
     
-    if _bot_settings_service is None or _bot_settings_service.file_path != Path(file_path):
-        _bot_settings_service = BotSettingsService(file_path)
+    if (
+        _bot_settings_service is None
+        or _bot_settings_service.file_path != Path(file_path)
+        or (phone_placeholders and _bot_settings_service.phone_placeholders != phone_placeholders)
+    ):
+        _bot_settings_service = BotSettingsService(file_path, phone_placeholders)
     return _bot_settings_service
 
@@ -0,0 +1,155 @@
+"""Автоматический выключатель (circuit breaker) для аккаунтов AmoCRM
+
+Если AmoCRM перестал отвечать, каждая заявка ждала бы таймаут и занимала
+соединение. Выключатель аккаунта считает подряд идущие сбои (сетевые ошибки,
+таймауты, ответы 5xx) и после failure_threshold сбоев размыкается (open):
+запросы к аккаунту сразу отклоняются с CircuitOpenError, а заявки остаются
+в очереди crm_outbox до восстановления. Через recovery_timeout секунд
+выключатель пропускает один пробный запрос (half-open): при успехе он
+замыкается (closed), при сбое снова размыкается.
+"""
+import time
+from typing import Dict, Optional
+
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+# Сбоев подряд до размыкания
+BREAKER_FAILURE_THRESHOLD = 5
+# Через сколько секунд после размыкания пропустить пробный запрос
+BREAKER_RECOVERY_TIMEOUT = 30.0
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Запрос не выполнен: выключатель аккаунта разомкнут"""
+
+    def __init__(self, name: str, retry_in: float):
+        super().__init__(f"AmoCRM {name} недоступен, повтор через {retry_in:.0f} сек")
+        self.name = name
+        # Через сколько секунд выключатель пропустит пробный запрос
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """Выключатель одного аккаунта"""
+
+    def __init__(self, name: str, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 recovery_timeout: float = BREAKER_RECOVERY_TIMEOUT):
+        """Инициализация выключателя
+
+        Args:
+            name: Название аккаунта для логов (поддомен)
+            failure_threshold: Сбоев подряд до размыкания
+            recovery_timeout: Время до пробного запроса, сек
+        """
+        self.name = name
+        self.failure_threshold = max(failure_threshold, 1)
+        self.recovery_timeout = recovery_timeout
+        self.state = STATE_CLOSED
+        self.consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        # Метрики
+        self.total_failures = 0
+        self.rejected = 0
+        self.last_error: Optional[str] = None
+        self.last_state_change: Optional[float] = None
+
+    def _set_state(self, state: str):
+        if state != self.state:
+            self.state = state
+            self.last_state_change = time.time()
+
+    def retry_in(self) -> float:
+        """Сколько секунд осталось до пробного запроса (0 - можно отправлять)"""
+        if self.state != STATE_OPEN:
+            return 0.0
+        return max(self._opened_at + self.recovery_timeout - time.monotonic(), 0.0)
+
+    def available(self) -> bool:
+        """Можно ли сейчас отправлять запросы (без занятия пробного запроса)"""
+        if self.state == STATE_CLOSED:
+            return True
+        if self.state == STATE_OPEN:
+            return self.retry_in() == 0
+        return not self._probe_in_flight
+
+    def ensure_available(self):
+        """Выбросить CircuitOpenError, если запросы к аккаунту сейчас не пропускаются"""
+        if not self.available():
+            self.rejected += 1
+            raise CircuitOpenError(self.name, self.retry_in())
+
+    def allow_request(self) -> bool:
+        """Разрешить запрос; в half-open пропускается только один пробный запрос"""
+        if self.state == STATE_CLOSED:
+            return True
+        if self.state == STATE_OPEN:
+            if self.retry_in() > 0:
+                self.rejected += 1
+                return False
+            self._set_state(STATE_HALF_OPEN)
+            logger.info(f"AmoCRM {self.name}: пробный запрос после сбоев")
+        if self._probe_in_flight:
+            self.rejected += 1
+            return False
+        self._probe_in_flight = True
+        return True
+
+    def record_success(self):
+        """Запрос выполнен (AmoCRM ответил, пусть и ошибкой 4xx)"""
+        self._probe_in_flight = False
+        self.consecutive_failures = 0
+        if self.state != STATE_CLOSED:
+            self._set_state(STATE_CLOSED)
+            logger.info(f"✅ AmoCRM {self.name} снова доступен")
+
+    def record_failure(self, error: str):
+        """Сбой запроса: сетевая ошибка, таймаут или ответ 5xx"""
+        self._probe_in_flight = False
+        self.consecutive_failures += 1
+        self.total_failures += 1
+        self.last_error = error
+        if self.state == STATE_HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != STATE_OPEN:
+                logger.error(f"❌ AmoCRM {self.name} недоступен ({error}), запросы приостановлены на {self.recovery_timeout:.0f} сек")
+            self._set_state(STATE_OPEN)
+            self._opened_at = time.monotonic()
+
+    def release(self):
+        """Запрос прерван без результата (например, отменен): освободить пробный запрос"""
+        self._probe_in_flight = False
+
+    def stats(self) -> Dict:
+        """Состояние выключателя для админ-панели"""
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "total_failures": self.total_failures,
+            "rejected": self.rejected,
+            "retry_in": self.retry_in(),
+            "last_error": self.last_error,
+            "last_state_change": self.last_state_change,
+        }
+
+
+# Поддомен аккаунта -> выключатель
+_breakers: Dict[str, CircuitBreaker] = {}
+
+
+def get_circuit_breaker(subdomain: str) -> CircuitBreaker:
+    """Получить выключатель аккаунта"""
+    breaker = _breakers.get(subdomain)
+    if breaker is None:
+        breaker = _breakers[subdomain] = CircuitBreaker(subdomain)
+    return breaker
+
+
+def get_circuit_breaker_stats() -> Dict[str, Dict]:
+    """Состояние выключателей всех аккаунтов: поддомен -> stats()"""
+    return {subdomain: breaker.stats() for subdomain, breaker in _breakers.items()}
@@ -0,0 +1,229 @@
+"""Маршрутизация городов по аккаунтам AmoCRM
+
+Города аккаунтов, их воронки и телефоны горячей линии задаются в JSON-файле
+(CITY_ROUTING_PATH, по умолчанию city_routing.json):
+    {
+        "default_crm": "city2",
+        "accounts": {
+            "city1": {"name": "АТЛАНТ", "pipeline_id": 5283247, "hotline_phone": "...",
+                      "cities": {"Ростов-на-Дону": ["Ростов", "Rostov-on-Don"], ...}},
+            ...
+        }
+    }
+
+Названия городов и их варианты нормализуются (регистр, ё/е, дефисы и знаки
+препинания, транслитерация латиницей), поэтому "Ростов-на-Дону", "ростов на дону"
+и "Rostov na Donu" - один ключ. Таблица ключей строится один раз при загрузке
+файла; город пользователя ищется целиком, а если не найден - по словам
+("г. Казань", "Казань, ТЦ Мега") и по началу слов, чтобы регион находил свой
+город ("Волгоградская обл" -> Волгоград). Город, которого нет в файле,
+относится к аккаунту default_crm.
+"""
+import json
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+# CRM для городов, которых нет в таблице, и для пользователей без города
+DEFAULT_CRM_TYPE = "city2"
+
+# Параметры аккаунтов, если их нет в файле маршрутизации
+DEFAULT_ACCOUNTS = {
+    "city1": {"name": "АТЛАНТ", "pipeline_id": 5283247, "hotline_phone": "8 (800) 555-48-52"},
+    "city2": {"name": "ЭТАЖИ", "pipeline_id": 6497210, "hotline_phone": "8 (800) 505-51-49"},
+}
+
+_TRANSLIT = str.maketrans({
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'e', 'ж': 'zh',
+    'з': 'z', 'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o',
+    'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u', 'ф': 'f', 'х': 'kh', 'ц': 'ts',
+    'ч': 'ch', 'ш': 'sh', 'щ': 'shch', 'ъ': '', 'ы': 'y', 'ь': '', 'э': 'e', 'ю': 'yu',
+    'я': 'ya',
+})
+_NON_WORD = re.compile(r'[^a-z0-9]+')
+# Окончания, которые по-разному пишут латиницей: "Нижний" -> "nizhniy" / "nizhny"
+_ENDINGS = re.compile(r'(?:iy|yy|ij)\b')
+# Минимальная длина названия из одного слова, которое ищется в начале слов
+# ("volgogradskaya" -> "volgograd"): самое короткое название в таблице - "ufa"
+MIN_STEM_LENGTH = 3
+# Конечные гласные, которые отбрасываются у названий для поиска прилагательных
+# ("samara" -> "samar" для "samarskaya", "sochi" -> "soch" для "sochinsky")
+_STEM_VOWELS = 'aeiouy'
+
+
+def normalize_city(city: Optional[str]) -> str:
+    """Ключ города: латиница в нижнем регистре, слова через один пробел
+
+    "Ростов-на-Дону" -> "rostov na donu", "Нижний Новгород" -> "nizhny novgorod"
+    """
+    key = (city or '').lower().translate(_TRANSLIT)
+    key = _NON_WORD.sub(' ', key)
+    return _ENDINGS.sub('y', key).strip()
+
+
+@dataclass(frozen=True)
+class CityRoute:
+    """Куда отправлять заявки и какой телефон показывать для города
+
+    Attributes:
+        crm_type: Аккаунт AmoCRM ("city1" или "city2")
+        account_name: Название аккаунта для логов ("АТЛАНТ")
+        pipeline_id: Воронка для сделок
+        hotline_phone: Телефон горячей линии аккаунта
+        city: Название города из таблицы или None, если город не найден
+            (тогда используется аккаунт по умолчанию)
+    """
+    crm_type: str
+    account_name: str
+    pipeline_id: Optional[int]
+    hotline_phone: str
+    city: Optional[str] = None
+
+
+class CityRouter:
+    """Таблица маршрутизации: ключ города -> CityRoute"""
+
+    def __init__(self, routing: Optional[Dict] = None):
+        """Построить таблицу
+
+        Args:
+            routing: Содержимое файла маршрутизации (None - только аккаунты по умолчанию)
+        """
+        routing = routing or {}
+        accounts = dict(DEFAULT_ACCOUNTS)
+        for crm_type, account in (routing.get('accounts') or {}).items():
+            accounts[crm_type] = {**DEFAULT_ACCOUNTS.get(crm_type, {}), **account}
+
+        self.default_crm_type = routing.get('default_crm') or DEFAULT_CRM_TYPE
+        if self.default_crm_type not in accounts:
+            logger.error(f"Аккаунт по умолчанию {self.default_crm_type} не описан, используется {DEFAULT_CRM_TYPE}")
+            self.default_crm_type = DEFAULT_CRM_TYPE
+
+        # Маршрут аккаунта без города - для неизвестных городов
+        self.accounts: Dict[str, CityRoute] = {
+            crm_type: CityRoute(
+                crm_type=crm_type,
+                account_name=account.get('name') or crm_type,
+                pipeline_id=account.get('pipeline_id'),
+                hotline_phone=account.get('hotline_phone', ''),
+            )
+            for crm_type, account in accounts.items()
+        }
+
+        self._table: Dict[str, CityRoute] = {}
+        for crm_type, account in accounts.items():
+            base = self.accounts[crm_type]
+            for city, aliases in (account.get('cities') or {}).items():
+                route = CityRoute(base.crm_type, base.account_name, base.pipeline_id, base.hotline_phone, city)
+                for name in (city, *(aliases or ())):
+                    key = normalize_city(name)
+                    if not key:
+                        continue
+                    existing = self._table.get(key)
+                    if existing is not None and existing.crm_type != crm_type:
+                        logger.warning(f"Город '{name}' указан в аккаунтах {existing.crm_type} и {crm_type}, используется {existing.crm_type}")
+                        continue
+                    self._table.setdefault(key, route)
+        # Самое длинное название в словах: столько слов проверяется при поиске по словам
+        self._max_words = max((key.count(' ') + 1 for key in self._table), default=1)
+        # Основы названий из одного слова без конечных гласных: для поиска по началу слов
+        self._stems: Dict[str, CityRoute] = {}
+        for key, route in self._table.items():
+            stem = key.rstrip(_STEM_VOWELS)
+            if ' ' not in key and stem != key and len(stem) > MIN_STEM_LENGTH and stem not in self._table:
+                self._stems.setdefault(stem, route)
+        self.route = lru_cache(maxsize=1024)(self._route)
+
+    def __len__(self) -> int:
+        return len(self._table)
+
+    def account(self, crm_type: Optional[str] = None) -> CityRoute:
+        """Маршрут аккаунта (по умолчанию - аккаунта для неизвестных городов)"""
+        return self.accounts.get(crm_type or self.default_crm_type) or self.accounts[self.default_crm_type]
+
+    def _route(self, city: Optional[str]) -> CityRoute:
+        """Маршрут для города пользователя (результат кэшируется в self.route)"""
+        key = normalize_city(city)
+        route = self._table.get(key)
+        if route is not None or not key:
+            return route or self.account()
+
+        # Город с уточнениями: ищем самое раннее и самое длинное известное название среди слов
+        words = key.split(' ')
+        for start in range(len(words)):
+            for length in range(min(self._max_words, len(words) - start), 0, -1):
+                route = self._table.get(' '.join(words[start:start + length]))
+                if route is not None:
+                    return route
+
+        # Производные слова ("Ростовская область", "омский", "Самарская"): самое
+        # длинное название или основа названия, с которых начинается слово
+        for word in words:
+            for length in range(len(word), MIN_STEM_LENGTH - 1, -1):
+                route = self._table.get(word[:length]) or self._stems.get(word[:length])
+                if route is not None:
+                    return route
+        return self.account()
+
+    def cities(self, crm_type: str) -> List[str]:
+        """Названия городов аккаунта"""
+        return sorted({route.city for route in self._table.values() if route.crm_type == crm_type})
+
+
+def load_city_router(file_path: str) -> CityRouter:
+    """Загрузить таблицу из файла; при ошибке все города уходят в аккаунт по умолчанию"""
+    try:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            routing = json.load(f)
+    except FileNotFoundError:
+        logger.error(f"Файл маршрутизации городов {file_path} не найден, все заявки уходят в {DEFAULT_CRM_TYPE}")
+        routing = None
+    except json.JSONDecodeError as e:
+        logger.error(f"Ошибка парсинга файла маршрутизации городов {file_path}: {e}")
+        routing = None
+    router = CityRouter(routing)
+    logger.debug(f"Загружена маршрутизация городов из {file_path}: {len(router)} названий")
+    return router
+
+
+# Глобальная таблица: (путь к файлу, таблица)
+_city_router: Optional[Tuple[str, CityRouter]] = None
+
+
+def _routing_path() -> str:
+    try:
+        from config import get_config
+        return get_config().city_routing_path
+    except Exception:
+        return "./city_routing.json"
+
+
+def get_city_router(file_path: Optional[str] = None) -> CityRouter:
+    """Получить таблицу маршрутизации (singleton)
+
+    Args:
+        file_path: Путь к JSON файлу. Если не указан, берется из конфигурации
+    """
+    global _city_router
+    file_path = file_path or _routing_path()
+    if _city_router is None or _city_router[0] != file_path:
+        _city_router = (file_path, load_city_router(file_path))
+    return _city_router[1]
+
+
+def reload_city_router() -> CityRouter:
+    """Перечитать файл маршрутизации (после его правки и при перезагрузке конфигурации)"""
+    global _city_router
+    file_path = _routing_path()
+    _city_router = (file_path, load_city_router(file_path))
+    return _city_router[1]
+
+
+def route_city(city: Optional[str]) -> CityRoute:
+    """Маршрут для города пользователя"""
+    return get_city_router().route(city)
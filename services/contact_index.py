@@ -0,0 +1,58 @@
+"""Ключи локального индекса контактов AmoCRM (таблица crm_contacts)
+
+Контакт ищется по нормализованному телефону и email: "phone:79991234567",
+"email:viewer@example.com". Индекс заполняется при создании контактов ботом
+и может быть дозаполнен из AmoCRM скриптом scripts/backfill_contact_index.py.
+"""
+import re
+from typing import Dict, List, Optional
+
+_NON_DIGITS = re.compile(r'\D')
+
+
+def normalize_phone(phone: Optional[str]) -> Optional[str]:
+    """Телефон в виде цифр с кодом страны: "8 (999) 123-45-67" -> "79991234567" """
+    if not phone:
+        return None
+    digits = _NON_DIGITS.sub('', str(phone))
+    if len(digits) == 11 and digits.startswith('8'):
+        digits = '7' + digits[1:]
+    elif len(digits) == 10:
+        digits = '7' + digits
+    # Слишком короткие номера не считаем надежным ключом
+    return digits if len(digits) >= 10 else None
+
+
+def normalize_email(email: Optional[str]) -> Optional[str]:
+    """Email в нижнем регистре без пробелов"""
+    if not email:
+        return None
+    email = str(email).strip().lower()
+    return email if '@' in email else None
+
+
+def contact_keys(phone: Optional[str] = None, email: Optional[str] = None) -> List[str]:
+    """Ключи индекса для телефона и email пользователя"""
+    keys = []
+    phone = normalize_phone(phone)
+    if phone:
+        keys.append(f"phone:{phone}")
+    email = normalize_email(email)
+    if email:
+        keys.append(f"email:{email}")
+    return keys
+
+
+def contact_keys_from_amocrm(contact: Dict) -> List[str]:
+    """Ключи индекса для контакта из ответа API AmoCRM (поля PHONE и EMAIL)"""
+    keys = []
+    for field in contact.get('custom_fields_values') or []:
+        code = field.get('field_code')
+        if code not in ('PHONE', 'EMAIL'):
+            continue
+        for value in field.get('values') or []:
+            if code == 'PHONE':
+                keys.extend(contact_keys(phone=value.get('value')))
+            else:
+                keys.extend(contact_keys(email=value.get('value')))
+    return keys
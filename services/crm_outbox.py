@@ -0,0 +1,259 @@
+"""Очередь доставки заявок (outbox) с повторными попытками
+
+Заявка записывается в таблицу crm_outbox в той же транзакции, что и выдача
+промокода (Database.issue_promo_code_with_outbox), - отдельной записью для
+каждого получателя (AmoCRM, вебхук, CSV-журнал, см. services/lead_sinks.py),
+а доставляют ее фоновые обработчики. У каждого получателя своя линия: свой
+диспетчер, обработчики, таймаут и попытки, поэтому получатели отправляются
+параллельно и медленный или недоступный вебхук не задерживает AmoCRM.
+Если получатель недоступен или бот перезапустился, заявка не теряется:
+она отправляется повторно с экспоненциальной задержкой, а после исчерпания
+попыток переходит в статус dead, откуда ее можно вернуть командой /crm_replay.
+Пока AmoCRM аккаунта недоступен (выключатель разомкнут), заявки откладываются
+без расхода попыток.
+"""
+import asyncio
+import json
+import random
+import time
+from typing import Dict, List, Optional, Sequence, Set
+
+from database import Database
+from logger import get_logger
+from services.circuit_breaker import CircuitOpenError
+from services.lead_sinks import SINK_AMOCRM, AmoCRMSink, LeadSink, lead_sink_names
+from services.sharded_workers import main_process_command, notify_main_process
+
+logger = get_logger(__name__)
+
+# Задержка перед повторной попыткой по умолчанию: BASE * 2^(попытка - 1), но не больше MAX
+# (получатель может задать свои, см. LeadSink.retry_base_delay)
+OUTBOX_RETRY_BASE_DELAY = 10  # сек
+OUTBOX_RETRY_MAX_DELAY = 3600  # сек
+# Как часто проверять очередь, если новых заявок не поступало
+OUTBOX_POLL_INTERVAL = 5  # сек
+# Команда, которой процесс-обработчик будит очередь основного процесса
+NOTIFY_CRM_OUTBOX_COMMAND = "notify_crm_outbox"
+
+
+def retry_delay(attempt: int, base_delay: float = OUTBOX_RETRY_BASE_DELAY,
+                max_delay: float = OUTBOX_RETRY_MAX_DELAY) -> float:
+    """Задержка перед повторной попыткой с экспоненциальным ростом и jitter
+
+    Случайная составляющая (от половины до полной задержки) разводит во времени
+    повторы заявок, упавших одновременно, чтобы они не ударили по API разом.
+
+    Args:
+        attempt: Номер неудачной попытки (с 1)
+        base_delay: Задержка после первой неудачной попытки, сек
+        max_delay: Максимальная задержка, сек
+    """
+    delay = min(base_delay * 2 ** (attempt - 1), max_delay)
+    return random.uniform(delay / 2, delay)
+
+
+class _SinkLane:
+    """Линия доставки одного получателя: диспетчер и обработчики"""
+
+    def __init__(self, sink: LeadSink):
+        self.sink = sink
+        self.workers = max(sink.workers, 1)
+        self.wakeup = asyncio.Event()
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=self.workers)
+
+
+class CrmOutbox:
+    """Фоновая доставка заявок из таблицы crm_outbox получателям"""
+
+    def __init__(self, db: Database, sinks: Dict[str, LeadSink]):
+        """Инициализация очереди
+
+        Args:
+            db: База данных с таблицей crm_outbox
+            sinks: Получатели заявок: имя (столбец sink) -> получатель
+        """
+        self.db = db
+        self.sinks = sinks
+        self._lanes = [_SinkLane(sink) for sink in sinks.values()]
+        self._tasks: List[asyncio.Task] = []
+        # Обработчики, которые сейчас отправляют заявку
+        self._busy: Set[asyncio.Task] = set()
+        self._stopping = False
+
+    def notify(self):
+        """Сообщить, что в очереди появилась новая заявка (не ждать опроса)"""
+        for lane in self._lanes:
+            lane.wakeup.set()
+
+    async def start(self):
+        """Запустить обработчики очереди"""
+        restored = await self.db.reset_stale_outbox_items()
+        if restored:
+            logger.warning(f"Возвращено в очередь {restored} заявок, прерванных при остановке бота")
+        for lane in self._lanes:
+            name = lane.sink.name
+            self._tasks.append(asyncio.create_task(self._dispatch_loop(lane), name=f"crm_outbox_{name}_dispatcher"))
+            for i in range(lane.workers):
+                self._tasks.append(asyncio.create_task(self._worker_loop(lane), name=f"crm_outbox_{name}_worker_{i}"))
+            logger.info(
+                f"Очередь заявок {name} запущена: обработчиков {lane.workers}, попыток {lane.sink.max_attempts}"
+                + (f", таймаут {lane.sink.timeout:g} сек" if lane.sink.timeout else "")
+            )
+
+    async def stop(self, timeout: float = 0):
+        """Остановить обработчики
+
+        Новые заявки не забираются, а отправляемые сейчас дожидаются ответа
+        получателя (не дольше timeout секунд). Прерванные и забранные из БД, но
+        не начатые заявки вернутся в очередь при следующем запуске.
+
+        Args:
+            timeout: Сколько ждать заявок в работе, сек
+        """
+        self._stopping = True
+        busy = set(self._busy)
+        for task in self._tasks:
+            if task not in busy:
+                task.cancel()
+        if busy and timeout > 0:
+            logger.info(f"Ожидание отправки заявок: {len(busy)} (не дольше {timeout:.0f} сек)")
+            _, busy = await asyncio.wait(busy, timeout=timeout)
+        for task in busy:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for sink in self.sinks.values():
+            try:
+                await sink.close()
+            except Exception as e:
+                logger.warning(f"Ошибка закрытия получателя заявок {sink.name}: {e}")
+
+    async def _dispatch_loop(self, lane: _SinkLane):
+        """Забирает из БД заявки получателя, которые пора отправлять, и передает обработчикам"""
+        while True:
+            # Сбрасываем флаг до чтения БД, чтобы не пропустить notify() во время чтения
+            lane.wakeup.clear()
+            try:
+                items = await self.db.claim_outbox_items(lane.workers, lane.sink.name)
+            except Exception as e:
+                logger.error(f"Ошибка чтения очереди {lane.sink.name}: {e}", exc_info=True)
+                items = []
+
+            for item in items:
+                await lane.queue.put(item)
+
+            if len(items) < lane.workers:
+                # Очередь пуста: ждем новую заявку или следующий опрос
+                try:
+                    await asyncio.wait_for(lane.wakeup.wait(), timeout=OUTBOX_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def _worker_loop(self, lane: _SinkLane):
+        """Отправляет заявки получателя по одной"""
+        task = asyncio.current_task()
+        while not self._stopping:
+            item = await lane.queue.get()
+            self._busy.add(task)
+            try:
+                await self._process(lane.sink, item)
+            finally:
+                self._busy.discard(task)
+                lane.queue.task_done()
+
+    async def _process(self, sink: LeadSink, item: Dict):
+        """Отправить одну заявку получателю и записать результат"""
+        item_id = item['id']
+        attempt = item['attempts'] + 1
+        try:
+            payload = json.loads(item['payload'])
+            if sink.timeout:
+                error = await asyncio.wait_for(sink.deliver(item_id, payload), timeout=sink.timeout)
+            else:
+                error = await sink.deliver(item_id, payload)
+        except CircuitOpenError as e:
+            # Получатель недоступен: ждем восстановления, попытка не расходуется
+            await self.db.defer_outbox_item(item_id, str(e), time.time() + max(e.retry_in, 1))
+            logger.info(f"Заявка #{item_id} ({sink.name}) отложена: {e}")
+            return
+        except asyncio.TimeoutError:
+            error = f"Таймаут {sink.timeout:g} сек"
+        except Exception as e:
+            logger.error(f"Исключение при отправке заявки #{item_id} ({sink.name}): {e}", exc_info=True)
+            error = str(e) or type(e).__name__
+
+        if error is None:
+            await self.db.complete_outbox_item(item_id)
+            logger.info(f"✅ Заявка #{item_id} пользователя {item['user_id']} доставлена: {sink.name} (попытка {attempt})")
+            return
+
+        if attempt >= sink.max_attempts:
+            await self.db.fail_outbox_item(item_id, error, None)
+            logger.error(
+                f"❌ Заявка #{item_id} пользователя {item['user_id']} не доставлена ({sink.name}) "
+                f"за {attempt} попыток: {error}"
+            )
+            return
+
+        delay = retry_delay(attempt, sink.retry_base_delay, sink.retry_max_delay)
+        await self.db.fail_outbox_item(item_id, error, time.time() + delay)
+        logger.warning(
+            f"Заявка #{item_id} не доставлена ({sink.name}, попытка {attempt}): {error}. "
+            f"Повтор через {delay:.0f} сек."
+        )
+
+
+# Глобальный экземпляр очереди (создается при запуске бота)
+_crm_outbox: Optional[CrmOutbox] = None
+
+
+async def start_crm_outbox(db: Database, sinks: Optional[Dict[str, LeadSink]] = None) -> CrmOutbox:
+    """Создать и запустить очередь заявок (вызывается из main.py)
+
+    Args:
+        db: База данных
+        sinks: Получатели заявок (см. build_lead_sinks); по умолчанию - только AmoCRM
+    """
+    global _crm_outbox
+    _crm_outbox = CrmOutbox(db, sinks or {SINK_AMOCRM: AmoCRMSink(db)})
+    await _crm_outbox.start()
+    return _crm_outbox
+
+
+async def stop_crm_outbox(timeout: float = 0):
+    """Остановить очередь заявок, дождавшись заявок в работе (см. CrmOutbox.stop)"""
+    global _crm_outbox
+    if _crm_outbox is not None:
+        outbox, _crm_outbox = _crm_outbox, None
+        await outbox.stop(timeout)
+
+
+def notify_crm_outbox():
+    """Разбудить очередь после добавления заявки
+
+    В процессе-обработчике (BOT_WORKERS > 1) очередь работает в основном
+    процессе: ему отправляется команда, иначе заявка ждала бы до
+    OUTBOX_POLL_INTERVAL.
+    """
+    if _crm_outbox is not None:
+        _crm_outbox.notify()
+    else:
+        notify_main_process(NOTIFY_CRM_OUTBOX_COMMAND)
+
+
+@main_process_command(NOTIFY_CRM_OUTBOX_COMMAND)
+async def _notify_crm_outbox_from_worker(db: Database):
+    """Команда процесса-обработчика: в очередь добавлена заявка"""
+    notify_crm_outbox()
+
+
+def outbox_sink_names() -> Sequence[str]:
+    """Получатели, для которых ставить заявку в очередь
+
+    В процессе-обработчике (BOT_WORKERS > 1) очередь не запущена - ее доставляет
+    основной процесс, поэтому получатели берутся из конфигурации.
+    """
+    if _crm_outbox is None:
+        from config import get_config
+        return lead_sink_names(get_config())
+    return tuple(_crm_outbox.sinks)
@@ -0,0 +1,117 @@
+"""Синхронизация статусов сделок из AmoCRM в локальную БД
+
+Бот записывает созданные сделки в таблицу crm_leads (см. create_lead_in_city).
+Фоновая задача периодически запрашивает у каждого аккаунта только сделки,
+измененные после сохраненного курсора (filter[updated_at][from], по возрастанию
+updated_at), постранично, и обновляет их воронку, статус и сумму. Курсор
+хранится в crm_sync_state, поэтому после перезапуска бот продолжает с того же
+места, а не загружает все сделки заново.
+"""
+import asyncio
+from typing import Dict, List
+
+from config import AmoCRMConfig
+from database import Database
+from logger import get_logger
+from services.circuit_breaker import CircuitOpenError
+
+logger = get_logger(__name__)
+
+# Системные статусы AmoCRM
+LEAD_STATUS_WON = 142  # Успешно реализовано
+LEAD_STATUS_LOST = 143  # Закрыто и не реализовано
+
+LEADS_PAGE_LIMIT = 250
+# Сколько страниц загружать за один проход (остальные - в следующий)
+LEAD_SYNC_MAX_PAGES = 40
+SYNC_ENTITY_LEADS = "leads"
+
+
+async def sync_account_leads(db: Database, amocrm_config: AmoCRMConfig) -> Dict:
+    """Загрузить изменения сделок одного аккаунта с последнего курсора
+
+    Args:
+        db: База данных с таблицами crm_leads и crm_sync_state
+        amocrm_config: Конфигурация аккаунта
+
+    Returns:
+        {"fetched", "updated", "cursor", "complete"}: загружено сделок, обновлено
+        сделок бота, новый курсор и загружены ли все изменения
+
+    Raises:
+        CircuitOpenError: AmoCRM аккаунта недоступен
+    """
+    from services.amocrm import AmoCRM
+
+    subdomain = amocrm_config.subdomain
+    cursor = await db.get_crm_sync_cursor(subdomain, SYNC_ENTITY_LEADS)
+    result = {"fetched": 0, "updated": 0, "cursor": cursor, "complete": True}
+    if not cursor:
+        # Бот еще не создавал сделок в этом аккаунте
+        return result
+
+    amocrm = AmoCRM(amocrm_config)
+    new_cursor = cursor
+    for page in range(1, LEAD_SYNC_MAX_PAGES + 1):
+        leads = await amocrm.get_leads_page(cursor, page, LEADS_PAGE_LIMIT)
+        if leads is None:
+            result["complete"] = False
+            break
+        if leads:
+            result["fetched"] += len(leads)
+            result["updated"] += await db.update_crm_leads(subdomain, leads)
+            # Сделки идут по возрастанию updated_at; курсор включительный, поэтому
+            # сделки с тем же updated_at на следующей странице не потеряются
+            new_cursor = max(new_cursor, *(lead.get('updated_at') or 0 for lead in leads))
+        if len(leads) < LEADS_PAGE_LIMIT:
+            break
+    else:
+        result["complete"] = False
+
+    if new_cursor > cursor:
+        await db.set_crm_sync_cursor(subdomain, SYNC_ENTITY_LEADS, new_cursor)
+    result["cursor"] = new_cursor
+    logger.info(
+        f"Синхронизация сделок AmoCRM {subdomain}: загружено {result['fetched']}, "
+        f"обновлено сделок бота {result['updated']}"
+        + ("" if result["complete"] else ", остальное - в следующий проход")
+    )
+    return result
+
+
+async def sync_all_leads(db: Database) -> Dict[str, Dict]:
+    """Синхронизировать сделки всех настроенных аккаунтов
+
+    Returns:
+        Поддомен -> результат sync_account_leads (или {"error": ...})
+    """
+    from config import get_config
+
+    config = get_config()
+    results: Dict[str, Dict] = {}
+    accounts: List[AmoCRMConfig] = [config.amocrm_city1, config.amocrm_city2]
+    for account in accounts:
+        if not account.subdomain or account.subdomain in results:
+            continue
+        try:
+            results[account.subdomain] = await sync_account_leads(db, account)
+        except CircuitOpenError as e:
+            logger.info(f"Синхронизация сделок пропущена: {e}")
+            results[account.subdomain] = {"error": str(e)}
+        except Exception as e:
+            logger.error(f"Ошибка синхронизации сделок AmoCRM {account.subdomain}: {e}", exc_info=True)
+            results[account.subdomain] = {"error": str(e) or type(e).__name__}
+    return results
+
+
+async def run_crm_lead_sync(db: Database, interval_seconds: int):
+    """Фоновая задача: периодически синхронизирует статусы сделок
+
+    Args:
+        db: База данных
+        interval_seconds: Интервал между синхронизациями в секундах
+    """
+    logger.info(f"Запущена синхронизация статусов сделок AmoCRM: каждые {interval_seconds} сек.")
+    while True:
+        await sync_all_leads(db)
+        await asyncio.sleep(interval_seconds)
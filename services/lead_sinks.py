@@ -0,0 +1,193 @@
+"""Получатели заявок (lead sinks): AmoCRM, HTTP-вебхук и CSV-журнал
+
+Заявка из анкеты ставится в очередь crm_outbox отдельной записью для каждого
+включенного получателя, поэтому у каждого получателя свои попытки, задержки
+и таймаут, а медленный вебхук не задерживает AmoCRM (у каждого получателя своя
+линия обработчиков в CrmOutbox) и тем более промокод пользователю.
+
+Получатель наследует LeadSink и реализует deliver(item_id, payload): None при
+успехе, текст ошибки для повторной попытки. CircuitOpenError откладывает заявку
+без расхода попытки.
+"""
+import asyncio
+import csv
+import os
+from abc import ABC, abstractmethod
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import aiohttp
+
+from config import Config
+from database import Database
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+SINK_AMOCRM = "amocrm"
+SINK_WEBHOOK = "webhook"
+SINK_LEDGER = "ledger"
+
+# Столбцы CSV-журнала заявок
+LEDGER_FIELDS = (
+    "outbox_id", "created_at", "telegram_id", "telegram_username", "name", "phone", "email",
+    "city", "project", "show_datetime", "promo_code", "utm_source", "utm_medium", "utm_campaign",
+)
+
+
+class LeadSink(ABC):
+    """Получатель заявок (абстрактный: без deliver экземпляр не создается)
+
+    Attributes:
+        name: Имя получателя (значение столбца sink в crm_outbox)
+        timeout: Таймаут одной попытки доставки, сек (None - без таймаута)
+        max_attempts: Попыток до перевода заявки в dead-letter
+        retry_base_delay: Задержка перед первой повторной попыткой, сек
+        retry_max_delay: Максимальная задержка между попытками, сек
+        workers: Сколько заявок этого получателя отправлять одновременно
+    """
+    name = ""
+    timeout: Optional[float] = None
+    max_attempts = 8
+    retry_base_delay = 10.0
+    retry_max_delay = 3600.0
+    workers = 1
+
+    @abstractmethod
+    async def deliver(self, item_id: int, payload: Dict) -> Optional[str]:
+        """Доставить заявку
+
+        Args:
+            item_id: ID записи в crm_outbox (для идемпотентности на стороне получателя)
+            payload: Данные заявки (user_data, city, telegram_id, telegram_username)
+
+        Returns:
+            None при успехе, иначе текст ошибки
+        """
+
+    async def close(self):
+        """Освободить ресурсы (при остановке очереди)"""
+
+
+class AmoCRMSink(LeadSink):
+    """Основной получатель: контакт и сделка в AmoCRM аккаунта города"""
+    name = SINK_AMOCRM
+
+    def __init__(self, db: Database, workers: int = 2, max_attempts: int = 8):
+        self.db = db
+        self.workers = max(workers, 1)
+        self.max_attempts = max(max_attempts, 1)
+        # Таймауты запросов задает AmoCRM._request, ожидание лимитов не ограничиваем
+        self.timeout = None
+
+    async def deliver(self, item_id: int, payload: Dict) -> Optional[str]:
+        from config import get_config
+        from services.amocrm import create_lead_in_city
+
+        config = get_config()
+        result = await create_lead_in_city(
+            payload['user_data'],
+            payload.get('city') or '',
+            config.amocrm_city1,
+            config.amocrm_city2,
+            telegram_id=payload.get('telegram_id'),
+            telegram_username=payload.get('telegram_username'),
+            use_complex=config.amocrm_complex_leads,
+            db=self.db,
+        )
+        return None if result else "AmoCRM не создал контакт или сделку (подробности в логе выше)"
+
+
+class WebhookSink(LeadSink):
+    """HTTP-вебхук (например, Google Apps Script таблицы маркетинга): POST JSON заявки"""
+    name = SINK_WEBHOOK
+    retry_base_delay = 30.0
+
+    def __init__(self, url: str, timeout: float = 5.0, max_attempts: int = 5):
+        self.url = url
+        self.timeout = timeout
+        self.max_attempts = max(max_attempts, 1)
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def deliver(self, item_id: int, payload: Dict) -> Optional[str]:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout))
+        body = {"id": item_id, **payload}
+        # Получатель может отбрасывать повторы по заголовку (повтор после таймаута)
+        headers = {"Idempotency-Key": f"lead-{item_id}"}
+        try:
+            async with self._session.post(self.url, json=body, headers=headers) as response:
+                if 200 <= response.status < 300:
+                    return None
+                text = await response.text()
+                return f"Вебхук ответил {response.status}: {text[:300]}"
+        except aiohttp.ClientError as e:
+            return f"Ошибка соединения с вебхуком: {e}"
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+class LedgerSink(LeadSink):
+    """Локальный CSV-журнал заявок (дописывается построчно)"""
+    name = SINK_LEDGER
+    timeout = 5.0
+    max_attempts = 3
+    retry_base_delay = 5.0
+
+    def __init__(self, file_path: str):
+        self.file_path = Path(file_path)
+        self._lock = asyncio.Lock()
+
+    def _append(self, row: Dict):
+        is_new = not self.file_path.exists() or self.file_path.stat().st_size == 0
+        with open(self.file_path, 'a', encoding='utf-8', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=LEDGER_FIELDS, extrasaction='ignore')
+            if is_new:
+                writer.writeheader()
+            writer.writerow(row)
+            f.flush()
+            os.fsync(f.fileno())
+
+    async def deliver(self, item_id: int, payload: Dict) -> Optional[str]:
+        user_data = payload.get('user_data') or {}
+        row = {
+            **user_data,
+            "outbox_id": item_id,
+            "created_at": datetime.now().isoformat(timespec='seconds'),
+            "telegram_id": payload.get('telegram_id'),
+            "telegram_username": payload.get('telegram_username') or '',
+            "city": payload.get('city') or user_data.get('city', ''),
+        }
+        # Запись в файл не блокирует event loop
+        async with self._lock:
+            await asyncio.to_thread(self._append, row)
+        return None
+
+
+def lead_sink_names(config: Config) -> Tuple[str, ...]:
+    """Имена получателей заявок, включенных в конфигурации (см. build_lead_sinks)"""
+    names = [SINK_AMOCRM]
+    if config.lead_webhook_url:
+        names.append(SINK_WEBHOOK)
+    if config.lead_ledger_path:
+        names.append(SINK_LEDGER)
+    return tuple(names)
+
+
+def build_lead_sinks(db: Database, config: Config) -> Dict[str, LeadSink]:
+    """Получатели заявок, включенные в конфигурации (AmoCRM - всегда)"""
+    sinks: Dict[str, LeadSink] = {
+        SINK_AMOCRM: AmoCRMSink(db, config.crm_outbox_workers, config.crm_outbox_max_attempts),
+    }
+    if config.lead_webhook_url:
+        sinks[SINK_WEBHOOK] = WebhookSink(config.lead_webhook_url, config.lead_webhook_timeout,
+                                          config.lead_webhook_max_attempts)
+    if config.lead_ledger_path:
+        sinks[SINK_LEDGER] = LedgerSink(config.lead_ledger_path)
+    logger.debug(f"Получатели заявок: {', '.join(sinks)}")
+    return sinks
+
@@ -1,24 +1,183 @@
 """Сервис для работы с маппингом ссылок (хранится в JSON файле)"""
+import asyncio
+import bisect
 import json
 import os
-from typing import Optional, List, Dict
+from dataclasses import dataclass
+from functools import lru_cache
+from datetime import datetime, timedelta
+from typing import Optional, List, Dict, Tuple
 from pathlib import Path
 from logger import get_logger
+from services.city_routing import route_city
+from utils.slug_index import SlugIndex
+from utils.utils import format_datetime_readable
 
 logger = get_logger(__name__)
 
+# Поддерживаемые варианты сортировки в list_mappings()
+SORT_BY_SLUG = "slug"
+SORT_BY_DATE = "date"
+
+
+@dataclass(frozen=True)
+class MappingFilter:
+    """Фильтр для постраничного списка маппингов
+    
+    Attributes:
+        city: Показывать только маппинги этого города (без учета регистра)
+        upcoming: Показывать только спектакли, которые еще не прошли
+        archived: Искать в архиве прошедших спектаклей вместо активных маппингов
+    """
+    city: Optional[str] = None
+    upcoming: bool = False
+    archived: bool = False
+
+
+@dataclass(frozen=True)
+class ShowRender:
+    """Готовые фрагменты сообщений о спектакле (не зависят от пользователя)
+    
+    Attributes:
+        readable_datetime: Дата в читаемом виде ("13 февраля 2026 19:00")
+        project_info: Блок "Информация о вашем спектакле" для приветствия /start
+        promo_details: Строки с городом и датой для подписи к промокоду
+    """
+    readable_datetime: str
+    project_info: str
+    promo_details: str
+
+
+def render_show(city: str, project: str, show_datetime: str) -> ShowRender:
+    """Отрендерить фрагменты сообщений для спектакля"""
+    readable_datetime = format_datetime_readable(show_datetime) if show_datetime else ''
+    project_info = (
+        f"\n\n📋 Информация о вашем спектакле:\n"
+        f"🏙️ Город: {city}\n"
+        f"🎭 Спектакль: {project}\n"
+        f"📅 Дата и время: {readable_datetime}\n"
+    )
+    promo_details = ''
+    if city:
+        promo_details += f"\n🏙️ Город: {city}"
+    if readable_datetime:
+        promo_details += f"\n📅 Дата и время: {readable_datetime}"
+    return ShowRender(readable_datetime, project_info, promo_details)
+
+
+@lru_cache(maxsize=1024)
+def _render_show_cached(city: str, project: str, show_datetime: str) -> ShowRender:
+    """render_show с кэшем для спектаклей, которых нет в маппингах (старые ссылки)"""
+    return render_show(city, project, show_datetime)
+
+
+def detect_crm_type(city: Optional[str]) -> str:
+    """Определить CRM по городу: "city1" (АТЛАНТ) или "city2" (ЭТАЖИ, по умолчанию)"""
+    return route_city(city).crm_type
+
+
+def _parse_show_datetime(show_datetime: Optional[str]) -> Optional[datetime]:
+    """Распарсить дату спектакля ("2026-02-13 19:00" или "2026-02-13")"""
+    if not show_datetime:
+        return None
+    for fmt in ("%Y-%m-%d %H:%M", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(show_datetime, fmt)
+        except ValueError:
+            continue
+    logger.warning(f"Не удалось распарсить дату спектакля '{show_datetime}'")
+    return None
+
+
+class _MappingsIndex:
+    """Снимок маппингов из одного файла с предсортированными индексами
+    
+    Строится один раз при (пере)чтении файла, после чего все запросы списка
+    работают по готовым спискам slug без копирования и сортировки всего файла.
+    """
+    
+    def __init__(self, mappings: Dict[str, Dict]):
+        self.mappings = mappings
+        self.show_dt: Dict[str, Optional[datetime]] = {
+            slug: _parse_show_datetime(data.get('show_datetime')) for slug, data in mappings.items()
+        }
+        
+        by_slug = sorted(mappings)
+        # Маппинги без даты уходят в конец списка по дате
+        by_date = sorted(by_slug, key=lambda s: (self.show_dt[s] is None, self.show_dt[s] or datetime.min, s))
+        
+        # Индексы: ключ города (None - все города) -> сортировка -> список slug
+        self.orders: Dict[Optional[str], Dict[str, List[str]]] = {
+            None: {SORT_BY_SLUG: by_slug, SORT_BY_DATE: by_date}
+        }
+        city_names: Dict[str, str] = {}
+        for sort_key, order in ((SORT_BY_SLUG, by_slug), (SORT_BY_DATE, by_date)):
+            for slug in order:
+                city = mappings[slug].get('city') or ''
+                city_key = city.lower()
+                city_names.setdefault(city_key, city)
+                self.orders.setdefault(city_key, {SORT_BY_SLUG: [], SORT_BY_DATE: []})[sort_key].append(slug)
+        
+        self.cities: List[str] = sorted(name for name in city_names.values() if name)
+        
+        # Даты спектаклей в порядке SORT_BY_DATE (без маппингов без даты) для
+        # бинарного поиска ближайших спектаклей: ключ города -> список дат
+        self.dated: Dict[Optional[str], List[datetime]] = {
+            city_key: [self.show_dt[s] for s in orders[SORT_BY_DATE] if self.show_dt[s] is not None]
+            for city_key, orders in self.orders.items()
+        }
+        
+        # Фрагменты сообщений рендерятся один раз при построении индекса, т.е. после
+        # сохранения маппинга, а не на каждый /start или выдачу промокода
+        self.renders: Dict[str, ShowRender] = {}
+        self.renders_by_show: Dict[Tuple[str, str, str], ShowRender] = {}
+        for slug, data in mappings.items():
+            show_key = (data.get('city') or '', data.get('project') or '', data.get('show_datetime') or '')
+            render = self.renders_by_show.get(show_key)
+            if render is None:
+                render = self.renders_by_show[show_key] = render_show(*show_key)
+            self.renders[slug] = render
+        
+        # Индекс для поиска slug по префиксу и с опечатками
+        self.slug_index = SlugIndex(mappings)
+    
+    def query(self, sort: str, mapping_filter: MappingFilter, now: datetime) -> List[str]:
+        """Вернуть отсортированный и отфильтрованный список slug"""
+        city_key = mapping_filter.city.lower() if mapping_filter.city else None
+        orders = self.orders.get(city_key)
+        if orders is None:
+            return []
+        order = orders.get(sort) or orders[SORT_BY_SLUG]
+        if not mapping_filter.upcoming:
+            return order
+        
+        if order is orders[SORT_BY_DATE]:
+            # Список отсортирован по дате: ближайшие спектакли - это хвост списка
+            dated = self.dated[city_key]
+            start = bisect.bisect_left(dated, now)
+            return order[start:len(dated)]
+        return [s for s in order if self.show_dt[s] is not None and self.show_dt[s] >= now]
+
 
 class LinkMappingsService:
     """Сервис для работы с маппингами ссылок"""
     
-    def __init__(self, file_path: str = "./link_mappings.json"):
+    def __init__(self, file_path: str = "./link_mappings.json", archive_path: Optional[str] = None):
         """Инициализация сервиса
         
         Args:
             file_path: Путь к JSON файлу с маппингами
+            archive_path: Путь к JSON файлу с архивом прошедших спектаклей.
+                Если не указан, рядом с file_path создается <имя>_archive.json
         """
         self.file_path = Path(file_path)
-        logger.debug(f"Инициализация LinkMappingsService с файлом: {self.file_path}")
+        if archive_path:
+            self.archive_path = Path(archive_path)
+        else:
+            self.archive_path = self.file_path.with_name(f"{self.file_path.stem}_archive{self.file_path.suffix}")
+        logger.debug(f"Инициализация LinkMappingsService с файлом: {self.file_path}, архив: {self.archive_path}")
+        # Кэш индексов по пути к файлу: path -> ((mtime_ns, size), индекс)
+        self._index_cache: Dict[Path, Tuple[Optional[Tuple[int, int]], _MappingsIndex]] = {}
         self._ensure_file_exists()
     
     def _ensure_file_exists(self):
@@ -27,52 +186,201 @@ class LinkMappingsService:
             logger.info(f"Создание файла маппингов: {self.file_path}")
             self._write_mappings({})
     
-    def _read_mappings(self) -> Dict[str, Dict]:
-        """Прочитать маппинги из файла"""
+    def _read_mappings(self, path: Optional[Path] = None) -> Dict[str, Dict]:
+        """Прочитать маппинги из файла (по умолчанию - активные маппинги)"""
+        path = path or self.file_path
         try:
-            with open(self.file_path, 'r', encoding='utf-8') as f:
+            with open(path, 'r', encoding='utf-8') as f:
                 data = json.load(f)
-                logger.debug(f"Прочитано {len(data)} маппингов из файла")
+                logger.debug(f"Прочитано {len(data)} маппингов из файла {path.name}")
                 return data
         except FileNotFoundError:
-            logger.warning(f"Файл {self.file_path} не найден, создаю новый")
+            if path == self.file_path:
+                logger.warning(f"Файл {path} не найден, создаю новый")
             return {}
         except json.JSONDecodeError as e:
-            logger.error(f"Ошибка парсинга JSON файла: {e}")
+            logger.error(f"Ошибка парсинга JSON файла {path}: {e}")
             return {}
     
-    def _write_mappings(self, mappings: Dict[str, Dict]):
-        """Записать маппинги в файл"""
+    def _write_mappings(self, mappings: Dict[str, Dict], path: Optional[Path] = None):
+        """Записать маппинги в файл (по умолчанию - активные маппинги)
+        
+        Запись идет через временный файл и os.replace, чтобы при падении
+        процесса не остался обрезанный JSON.
+        """
+        path = path or self.file_path
+        tmp_path = path.with_name(f".{path.name}.tmp")
         try:
-            with open(self.file_path, 'w', encoding='utf-8') as f:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
                 json.dump(mappings, f, ensure_ascii=False, indent=2)
-            logger.debug(f"Записано {len(mappings)} маппингов в файл")
+            os.replace(tmp_path, path)
+            logger.debug(f"Записано {len(mappings)} маппингов в файл {path.name}")
         except Exception as e:
-            logger.error(f"Ошибка записи в файл: {e}")
+            logger.error(f"Ошибка записи в файл {path}: {e}")
             raise
+        finally:
+            # Индекс будет перестроен при следующем чтении
+            self._index_cache.pop(path, None)
+    
+    @staticmethod
+    def _file_signature(path: Path) -> Optional[Tuple[int, int]]:
+        """Сигнатура файла для проверки изменений на диске (mtime, размер)"""
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+    
+    def _get_index(self, path: Optional[Path] = None) -> _MappingsIndex:
+        """Получить индекс маппингов файла, перечитывая файл только при его изменении
+        
+        Изменения, сделанные в обход сервиса (например, скриптами из scripts/),
+        подхватываются по изменению mtime/размера файла.
+        """
+        path = path or self.file_path
+        signature = self._file_signature(path)
+        cached = self._index_cache.get(path)
+        if cached and cached[0] == signature:
+            return cached[1]
+        
+        index = _MappingsIndex(self._read_mappings(path) if signature else {})
+        self._index_cache[path] = (signature, index)
+        logger.debug(f"Перестроен индекс маппингов {path.name}: {len(index.mappings)} записей")
+        return index
+    
+    @staticmethod
+    def _to_result(slug: str, data: Dict, archived: bool = False) -> Dict:
+        """Копия маппинга со slug (кэш не должен изменяться вызывающим кодом)"""
+        mapping = data.copy()
+        mapping['slug'] = slug
+        if archived:
+            mapping['archived'] = True
+        return mapping
+    
+    def _read_archive(self) -> Dict[str, Dict]:
+        """Прочитать архив маппингов прошедших спектаклей"""
+        return self._read_mappings(self.archive_path)
+    
+    def _write_archive(self, mappings: Dict[str, Dict]):
+        """Записать архив маппингов прошедших спектаклей"""
+        self._write_mappings(mappings, self.archive_path)
     
     def get_link_mapping(self, slug: str) -> Optional[Dict]:
-        """Получить маппинг ссылки по slug"""
+        """Получить маппинг ссылки по slug
+        
+        Сначала ищет среди активных маппингов, затем в архиве, чтобы
+        поздние переходы по ссылкам прошедших спектаклей тоже работали.
+        Архивный маппинг помечается полем archived=True.
+        """
         logger.debug(f"Получение маппинга для slug: {slug}")
-        mappings = self._read_mappings()
-        mapping = mappings.get(slug)
+        mapping = self._get_index().mappings.get(slug)
         if mapping:
             # Добавляем slug в результат для совместимости
-            mapping['slug'] = slug
-        return mapping
+            return self._to_result(slug, mapping)
+        
+        mapping = self._get_index(self.archive_path).mappings.get(slug)
+        if mapping:
+            logger.debug(f"Маппинг для slug {slug} найден в архиве")
+            return self._to_result(slug, mapping, archived=True)
+        return None
     
     def get_all_link_mappings(self) -> List[Dict]:
-        """Получить все маппинги ссылок"""
+        """Получить все маппинги ссылок (отсортированы по slug)"""
         logger.debug("Получение всех маппингов ссылок")
-        mappings = self._read_mappings()
-        result = []
-        for slug, data in mappings.items():
-            mapping = data.copy()
-            mapping['slug'] = slug
-            result.append(mapping)
-        # Сортируем по slug
-        result.sort(key=lambda x: x.get('slug', ''))
-        return result
+        index = self._get_index()
+        return [self._to_result(slug, index.mappings[slug]) for slug in index.orders[None][SORT_BY_SLUG]]
+    
+    def get_archived_link_mappings(self) -> List[Dict]:
+        """Получить все архивные маппинги ссылок (отсортированы по slug)"""
+        logger.debug("Получение архивных маппингов ссылок")
+        index = self._get_index(self.archive_path)
+        return [self._to_result(slug, index.mappings[slug], archived=True) for slug in index.orders[None][SORT_BY_SLUG]]
+    
+    def list_mappings(
+        self,
+        page: int = 0,
+        per_page: int = 10,
+        sort: str = SORT_BY_SLUG,
+        mapping_filter: Optional[MappingFilter] = None
+    ) -> Tuple[List[Dict], int]:
+        """Получить одну страницу маппингов по предсортированному индексу
+        
+        Args:
+            page: Номер страницы (с нуля)
+            per_page: Количество маппингов на странице
+            sort: Сортировка: SORT_BY_SLUG или SORT_BY_DATE (по дате спектакля)
+            mapping_filter: Фильтр по городу / ближайшим спектаклям / архиву
+            
+        Returns:
+            Кортеж (маппинги текущей страницы, общее количество по фильтру)
+        """
+        mapping_filter = mapping_filter or MappingFilter()
+        index = self._get_index(self.archive_path if mapping_filter.archived else None)
+        slugs = index.query(sort, mapping_filter, datetime.now())
+        start = max(page, 0) * per_page
+        page_items = [
+            self._to_result(slug, index.mappings[slug], archived=mapping_filter.archived)
+            for slug in slugs[start:start + per_page]
+        ]
+        return page_items, len(slugs)
+    
+    def get_show_render(self, city: str, project: str, show_datetime: str) -> ShowRender:
+        """Получить готовые фрагменты сообщений для спектакля
+        
+        Для спектаклей из маппингов (активных и архивных) фрагменты берутся из
+        индекса, для остальных (например, данные пользователя по старой ссылке)
+        рендерятся и кэшируются отдельно.
+        
+        Args:
+            city: Город
+            project: Название спектакля
+            show_datetime: Дата и время спектакля ("2026-02-13 19:00")
+        """
+        show_key = (city or '', project or '', show_datetime or '')
+        for path in (None, self.archive_path):
+            render = self._get_index(path).renders_by_show.get(show_key)
+            if render is not None:
+                return render
+        return _render_show_cached(*show_key)
+    
+    def search_slugs(self, prefix: str, limit: int = 50, include_archived: bool = True) -> List[Dict]:
+        """Найти маппинги, slug которых начинается с prefix (без учета регистра)
+        
+        Args:
+            prefix: Начало slug (пустая строка - все маппинги)
+            limit: Максимальное количество результатов
+            include_archived: Дополнять результат архивными маппингами
+            
+        Returns:
+            Список маппингов: сначала активные, затем архивные (по slug)
+        """
+        index = self._get_index()
+        results = [self._to_result(slug, index.mappings[slug]) for slug in index.slug_index.search_prefix(prefix, limit)]
+        if include_archived and len(results) < limit:
+            archive_index = self._get_index(self.archive_path)
+            for slug in archive_index.slug_index.search_prefix(prefix, limit - len(results)):
+                if slug not in index.mappings:
+                    results.append(self._to_result(slug, archive_index.mappings[slug], archived=True))
+        return results
+    
+    def find_similar_link_mapping(self, slug: str) -> Optional[Dict]:
+        """Найти маппинг по slug с опечаткой или в другом регистре
+        
+        Используется, когда точного совпадения нет. Возвращает маппинг только
+        если ближайший slug определяется однозначно; сначала ищет среди
+        активных маппингов, затем в архиве.
+        """
+        for path, archived in ((None, False), (self.archive_path, True)):
+            index = self._get_index(path)
+            similar = index.slug_index.find_closest(slug)
+            if similar:
+                logger.info(f"Slug '{slug}' не найден, используется похожий '{similar}'")
+                return self._to_result(similar, index.mappings[similar], archived=archived)
+        return None
+    
+    def get_cities(self, archived: bool = False) -> List[str]:
+        """Получить отсортированный список городов из маппингов"""
+        return list(self._get_index(self.archive_path if archived else None).cities)
     
     def create_or_update_link_mapping(
         self,
@@ -89,15 +397,15 @@ class LinkMappingsService:
         
         # Определяем CRM тип автоматически по городу, если не указан
         if not crm_type:
-            city_lower = city.lower()
-            city1_cities = [
-                "волгоград", "краснодар", "ростов-на-дону", "ростов",
-                "самара", "сочи", "ставрополь", "уфа"
-            ]
-            crm_type = "city1" if any(c in city_lower for c in city1_cities) else "city2"
+            crm_type = detect_crm_type(city)
         
         mappings = self._read_mappings()
         
+        # Если slug был в архиве (например, спектакль перенесли), возвращаем его в активные
+        archive = self._read_archive()
+        archived = archive.pop(slug, None)
+        previous = mappings.get(slug) or archived or {}
+        
         # Формируем данные маппинга
         mapping_data = {
             "city": city,
@@ -106,12 +414,15 @@ class LinkMappingsService:
             "ticket_url": ticket_url,
             "seat_selection_url": seat_selection_url,
             "crm_type": crm_type,
-            "created_at": mappings.get(slug, {}).get("created_at") or self._get_current_timestamp(),
+            "created_at": previous.get("created_at") or self._get_current_timestamp(),
             "updated_at": self._get_current_timestamp()
         }
         
         mappings[slug] = mapping_data
         self._write_mappings(mappings)
+        if archived is not None:
+            self._write_archive(archive)
+            logger.info(f"Маппинг {slug} возвращен из архива в активные")
         logger.debug(f"Маппинг для slug {slug} сохранен/обновлен в JSON файле")
     
     def delete_link_mapping(self, slug: str):
@@ -122,12 +433,51 @@ class LinkMappingsService:
             del mappings[slug]
             self._write_mappings(mappings)
             logger.debug(f"Маппинг для slug {slug} удален из JSON файла")
+            return
+        
+        archive = self._read_archive()
+        if slug in archive:
+            del archive[slug]
+            self._write_archive(archive)
+            logger.debug(f"Маппинг для slug {slug} удален из архива")
         else:
             logger.warning(f"Маппинг для slug {slug} не найден")
     
+    def archive_past_mappings(self, after_days: int, now: Optional[datetime] = None) -> List[str]:
+        """Перенести в архив маппинги, спектакль которых прошел более after_days дней назад
+        
+        Args:
+            after_days: Сколько дней после спектакля маппинг остается активным
+            now: Текущее время (для тестов), по умолчанию datetime.now()
+            
+        Returns:
+            Список slug, перенесенных в архив
+        """
+        threshold = (now or datetime.now()) - timedelta(days=after_days)
+        
+        # Проверяем по индексу, чтобы не перечитывать файл, когда архивировать нечего
+        index = self._get_index()
+        expired = [slug for slug, show_dt in index.show_dt.items() if show_dt and show_dt < threshold]
+        if not expired:
+            logger.debug("Нет маппингов для архивации")
+            return []
+        
+        mappings = self._read_mappings()
+        expired = [slug for slug in expired if slug in mappings]
+        archive = self._read_archive()
+        archived_at = self._get_current_timestamp()
+        for slug in expired:
+            archive[slug] = dict(mappings.pop(slug), archived_at=archived_at)
+        
+        # Сначала пишем архив, затем активные маппинги: при падении между записями
+        # slug окажется в обоих файлах, но не потеряется
+        self._write_archive(archive)
+        self._write_mappings(mappings)
+        logger.info(f"Перенесено в архив {len(expired)} маппингов: {', '.join(expired)}")
+        return expired
+    
     def _get_current_timestamp(self) -> str:
         """Получить текущую временную метку"""
-        from datetime import datetime
         return datetime.now().isoformat()
 
 
@@ -143,15 +493,33 @@ def get_link_mappings_service(file_path: str = None) -> LinkMappingsService:
     """
     global _link_mappings_service
     
+    archive_path = None
     if file_path is None:
         try:
-            from config import Config
-            config = Config.load()
+            from config import get_config
+            config = get_config()
             file_path = config.link_mappings_path
+            archive_path = config.link_mappings_archive_path or None
         except:
             file_path = "./link_mappings.json"
     
     if _link_mappings_service is None or _link_mappings_service.file_path != Path(file_path):
-        _link_mappings_service = LinkMappingsService(file_path)
+        _link_mappings_service = LinkMappingsService(file_path, archive_path)
     return _link_mappings_service
 
+
+async def run_mappings_archiver(after_days: int, interval_seconds: int):
+    """Фоновая задача: периодически переносит прошедшие спектакли в архив
+    
+    Args:
+        after_days: Через сколько дней после спектакля маппинг уходит в архив
+        interval_seconds: Интервал между проверками в секундах
+    """
+    logger.info(f"Запущена архивация маппингов: через {after_days} дн. после спектакля, проверка каждые {interval_seconds} сек.")
+    while True:
+        try:
+            get_link_mappings_service().archive_past_mappings(after_days)
+        except Exception as e:
+            logger.error(f"Ошибка при архивации маппингов: {e}", exc_info=True)
+        await asyncio.sleep(interval_seconds)
+
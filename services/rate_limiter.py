@@ -0,0 +1,168 @@
+"""Ограничение частоты и параллельности запросов к AmoCRM
+
+AmoCRM ограничивает число запросов в секунду на аккаунт и при превышении
+отвечает 429. Перед каждым HTTP-запросом к аккаунту берется место
+в семафоре (не больше max_concurrency запросов одновременно) и токен из
+корзины (в среднем не больше rate запросов в секунду). Ответ 429
+с заголовком Retry-After приостанавливает выдачу токенов всего аккаунта.
+"""
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional
+
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+# Пауза после 429, если AmoCRM не прислал Retry-After, сек
+DEFAULT_RETRY_AFTER = 1.0
+# Верхняя граница паузы по Retry-After, сек
+MAX_RETRY_AFTER = 60.0
+
+
+def parse_retry_after(value: Optional[str]) -> float:
+    """Пауза из заголовка Retry-After (секунды); при отсутствии - DEFAULT_RETRY_AFTER"""
+    try:
+        seconds = float(value) if value else DEFAULT_RETRY_AFTER
+    except ValueError:
+        # Формат HTTP-даты AmoCRM не использует
+        seconds = DEFAULT_RETRY_AFTER
+    return min(max(seconds, 0.0), MAX_RETRY_AFTER)
+
+
+class TokenBucket:
+    """Корзина токенов: в среднем rate операций в секунду, всплеск до capacity"""
+
+    def __init__(self, rate: float, capacity: float):
+        """Инициализация корзины
+
+        Args:
+            rate: Скорость пополнения, токенов в секунду
+            capacity: Вместимость корзины (допустимый всплеск)
+        """
+        self.rate = rate
+        self.capacity = max(capacity, 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        # Ожидающие получают токены по очереди (asyncio.Lock справедлив)
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        """Дождаться и взять один токен"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if self._paused_until > now:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        """Не выдавать токены seconds секунд, затем начать с пустой корзины"""
+        now = time.monotonic()
+        self._paused_until = max(self._paused_until, now + seconds)
+        self._tokens = 0.0
+        self._updated = self._paused_until
+
+
+class AccountRateLimiter:
+    """Ограничитель запросов одного аккаунта AmoCRM с метриками ожидания"""
+
+    def __init__(self, name: str, rate: float, max_concurrency: int):
+        """Инициализация ограничителя
+
+        Args:
+            name: Название аккаунта для логов (поддомен)
+            rate: Запросов в секунду
+            max_concurrency: Максимум одновременных запросов
+        """
+        self.name = name
+        self.rate = rate
+        self.max_concurrency = max(max_concurrency, 1)
+        self._bucket = TokenBucket(rate, capacity=rate)
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        # Метрики
+        self.requests = 0
+        self.waiting = 0
+        self.throttled = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """Место для одного запроса: внутри блока можно выполнять HTTP-запрос"""
+        started = time.monotonic()
+        self.waiting += 1
+        acquired = False
+        try:
+            async with self._semaphore:
+                await self._bucket.acquire()
+                acquired = True
+                self.waiting -= 1
+                waited = time.monotonic() - started
+                self.requests += 1
+                self.total_wait += waited
+                self.max_wait = max(self.max_wait, waited)
+                if waited >= 1:
+                    logger.debug(f"Запрос к AmoCRM {self.name} ждал в очереди {waited:.1f} сек")
+                yield
+        finally:
+            if not acquired:
+                # Ожидание отменили: запрос так и не был выполнен
+                self.waiting -= 1
+
+    def retry_after(self, seconds: float):
+        """AmoCRM ответил 429: приостановить запросы аккаунта"""
+        self.throttled += 1
+        self._bucket.pause(seconds)
+        logger.warning(f"AmoCRM {self.name} ограничил частоту запросов (429), пауза {seconds:.1f} сек")
+
+    def stats(self) -> Dict:
+        """Метрики ожидания в очереди"""
+        return {
+            "rate": self.rate,
+            "max_concurrency": self.max_concurrency,
+            "requests": self.requests,
+            "waiting": self.waiting,
+            "throttled": self.throttled,
+            "avg_wait": self.total_wait / self.requests if self.requests else 0.0,
+            "max_wait": self.max_wait,
+        }
+
+
+# Поддомен аккаунта -> ограничитель
+_limiters: Dict[str, AccountRateLimiter] = {}
+
+
+def get_rate_limiter(subdomain: str, rate: float, max_concurrency: int) -> AccountRateLimiter:
+    """Получить общий ограничитель аккаунта
+
+    Если параметры аккаунта изменились (перезагрузка конфигурации), создается
+    новый ограничитель; запросы, уже ожидающие в старом, дорабатывают в нем.
+    """
+    limiter = _limiters.get(subdomain)
+    if limiter is None or limiter.rate != rate or limiter.max_concurrency != max(max_concurrency, 1):
+        if limiter is not None:
+            logger.info(f"Лимиты AmoCRM {subdomain} изменены: {rate} запросов/сек, до {max_concurrency} одновременно")
+        limiter = _limiters[subdomain] = AccountRateLimiter(subdomain, rate, max_concurrency)
+    return limiter
+
+
+def get_rate_limiter_stats() -> Dict[str, Dict]:
+    """Метрики всех аккаунтов: поддомен -> stats()"""
+    return {subdomain: limiter.stats() for subdomain, limiter in _limiters.items()}
+
+
+def clear_rate_limiters():
+    """Удалить все ограничители (при остановке бота вместе с сессиями AmoCRM)"""
+    _limiters.clear()
@@ -0,0 +1,625 @@
+"""Многопроцессный режим бота (BOT_WORKERS > 1)
+
+Один процесс Python упирается в одно ядро: на пике кампании разбор JSON,
+логирование и обработчики конкурируют за GIL. В этом режиме основной процесс
+только получает обновления (long polling или webhook) и раздает их N
+процессам-обработчикам, у каждого из которых свой Dispatcher:
+
+- обновление уходит процессу user_id % N, поэтому все обновления пользователя
+  обрабатывает один процесс в порядке поступления (кэш состояний FSM
+  в SQLiteStorage при этом остается согласованным);
+- обновления передаются через Unix-сокет кадрами "тип + длина + JSON"; процесс
+  подтверждает каждое принятое обновление, а неподтвержденные обновления
+  основной процесс хранит и повторно отправляет перезапущенному процессу;
+- очередь заявок, сессии и лимиты AmoCRM и фоновые задачи (архивация,
+  синхронизация сделок) работают только в основном процессе: обработчики
+  записывают заявки в БД и будят очередь, а команды администратора, которые
+  работают с этим состоянием, передают основному процессу по тому же сокету
+  (см. main_process_command);
+- упавший процесс-обработчик перезапускается.
+"""
+import asyncio
+import functools
+import json
+import multiprocessing
+import os
+import secrets
+import shutil
+import signal
+import struct
+import tempfile
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import aiohttp
+from aiogram import Bot
+from aiohttp import web
+
+from config import Config
+from database import Database
+from logger import get_logger
+from services.task_supervisor import get_task_supervisor
+from services.webhook_server import HEALTH_PATH, serve_webhook_app, wait_for_stop_signal
+
+logger = get_logger(__name__)
+
+# Тип сообщения (первый байт). От основного процесса: обновление и ответ на команду,
+# от процесса-обработчика: подтверждение обновления и команда
+MESSAGE_UPDATE = b"u"
+MESSAGE_REPLY = b"r"
+MESSAGE_ACK = b"a"
+MESSAGE_COMMAND = b"c"
+# Заголовок кадра: длина JSON в байтах (big-endian)
+FRAME_HEADER = struct.Struct(">I")
+# Подтверждение от процесса-обработчика: update_id принятого обновления
+ACK = struct.Struct(">q")
+# Сколько неподтвержденных обновлений хранить для одного процесса-обработчика
+MAX_PENDING_UPDATES = 1000
+# Сколько раз повторно отправлять обновление перезапущенному процессу: обновление,
+# на котором процесс падает, не должно перезапускать его бесконечно
+MAX_REDELIVERIES = 2
+# Сколько ждать запуска процесса-обработчика, сек
+WORKER_START_TIMEOUT = 30
+# Как часто проверять, что процессы-обработчики живы, сек
+WORKER_MONITOR_INTERVAL = 5
+# Пауза перед повторной передачей обновлений, если процесс-обработчик недоступен, сек
+ROUTE_RETRY_DELAY = 1
+# Таймаут long polling в основном процессе, сек
+POLLING_TIMEOUT = 30
+# Категория задач супервизора для обработки обновлений в процессе-обработчике
+WORKER_UPDATE_CATEGORY = "worker_update"
+# Категория задач супервизора для команд процессов-обработчиков в основном процессе
+WORKER_COMMAND_CATEGORY = "worker_command"
+# Сколько процесс-обработчик ждет ответа основного процесса на команду, сек
+MAIN_PROCESS_COMMAND_TIMEOUT = 120
+
+# Команды, которые выполняются в основном процессе: имя -> корутинная функция (db, **kwargs)
+_main_process_commands: Dict[str, Callable[..., Awaitable[Any]]] = {}
+
+
+def update_user_id(update: Dict) -> Optional[int]:
+    """ID пользователя (или чата), к которому относится обновление Telegram"""
+    for field, event in update.items():
+        if field == "update_id" or not isinstance(event, dict):
+            continue
+        for owner in ("from", "user", "chat", "voter_chat"):
+            value = event.get(owner)
+            if isinstance(value, dict) and "id" in value:
+                return value["id"]
+    return None
+
+
+def update_shard(update: Dict, workers: int) -> int:
+    """Номер процесса-обработчика для обновления: user_id % N"""
+    user_id = update_user_id(update)
+    if user_id is None:
+        # Обновления без пользователя (например, опросы канала) распределяются по update_id
+        user_id = update.get("update_id", 0)
+    return user_id % workers
+
+
+def encode_message(kind: bytes, data: Dict) -> bytes:
+    """Сообщение с JSON: тип + длина + JSON"""
+    payload = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode()
+    return kind + FRAME_HEADER.pack(len(payload)) + payload
+
+
+async def read_frame(reader: asyncio.StreamReader) -> Optional[bytes]:
+    """Прочитать кадр; None - соединение закрыто"""
+    try:
+        header = await reader.readexactly(FRAME_HEADER.size)
+        return await reader.readexactly(FRAME_HEADER.unpack(header)[0])
+    except asyncio.IncompleteReadError:
+        return None
+
+
+class _MainProcessLink:
+    """В процессе-обработчике: отправка команд основному процессу и ожидание ответов"""
+
+    def __init__(self, writer: asyncio.StreamWriter):
+        self._writer = writer
+        self._replies: Dict[int, asyncio.Future] = {}
+        self._next_id = 0
+
+    def notify(self, command: str, args: Dict):
+        """Отправить команду без ожидания ответа"""
+        self._writer.write(encode_message(MESSAGE_COMMAND, {"id": None, "command": command, "args": args}))
+
+    async def call(self, command: str, args: Dict) -> Any:
+        """Выполнить команду в основном процессе и вернуть ее результат
+
+        Raises:
+            RuntimeError: Основной процесс вернул ошибку, не ответил или соединение потеряно
+        """
+        if self._writer.is_closing():
+            raise RuntimeError("Нет связи с основным процессом")
+        self._next_id += 1
+        request_id = self._next_id
+        reply = self._replies[request_id] = asyncio.get_running_loop().create_future()
+        self._writer.write(encode_message(MESSAGE_COMMAND, {"id": request_id, "command": command, "args": args}))
+        try:
+            data = await asyncio.wait_for(reply, MAIN_PROCESS_COMMAND_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise RuntimeError(f"Основной процесс не выполнил команду {command} за {MAIN_PROCESS_COMMAND_TIMEOUT} сек")
+        finally:
+            self._replies.pop(request_id, None)
+        if "error" in data:
+            raise RuntimeError(data["error"])
+        return data.get("result")
+
+    def resolve(self, data: Dict):
+        """Ответ основного процесса на команду"""
+        reply = self._replies.get(data.get("id"))
+        if reply is not None and not reply.done():
+            reply.set_result(data)
+
+    def close(self):
+        """Соединение закрыто: команды, ожидающие ответа, завершаются ошибкой"""
+        for reply in self._replies.values():
+            if not reply.done():
+                reply.set_exception(RuntimeError("Соединение с основным процессом потеряно"))
+        self._replies.clear()
+
+
+# Связь с основным процессом (только в процессе-обработчике)
+_main_process_link: Optional[_MainProcessLink] = None
+
+
+def main_process_command(name: str):
+    """Декоратор: команда, которая работает с состоянием основного процесса
+
+    Очередь заявок, сессии, лимиты и выключатели AmoCRM, кэши и фоновые задачи
+    живут в основном процессе. В процессе-обработчике вызов декорированной
+    функции передается основному процессу, и она выполняется там с его БД;
+    в однопроцессном режиме и в основном процессе функция вызывается напрямую.
+
+    Функция принимает БД первым аргументом, остальные аргументы (только
+    именованные) и результат должны сериализоваться в JSON.
+
+    Args:
+        name: Имя команды в протоколе между процессами
+    """
+    def decorator(func: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+        _main_process_commands[name] = func
+
+        @functools.wraps(func)
+        async def wrapper(db: Database, **kwargs) -> Any:
+            if _main_process_link is None:
+                return await func(db, **kwargs)
+            return await _main_process_link.call(name, kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def notify_main_process(name: str, **kwargs) -> bool:
+    """Из процесса-обработчика: запустить команду в основном процессе, не дожидаясь ее
+
+    Returns:
+        False, если это не процесс-обработчик или связь с основным процессом потеряна
+    """
+    if _main_process_link is None:
+        return False
+    try:
+        _main_process_link.notify(name, kwargs)
+    except (ConnectionError, OSError) as e:
+        logger.warning(f"Не удалось передать команду {name} основному процессу: {e}")
+        return False
+    return True
+
+
+class WorkerPool:
+    """Процессы-обработчики и распределение обновлений между ними"""
+
+    def __init__(self, workers: int, target: Callable[[int, str], None], db: Database):
+        """Инициализация пула
+
+        Args:
+            workers: Количество процессов-обработчиков
+            target: Точка входа процесса: target(номер, путь к Unix-сокету).
+                Должна быть функцией уровня модуля (процессы запускаются через spawn)
+            db: База данных основного процесса для команд процессов-обработчиков
+        """
+        self.workers = workers
+        self._target = target
+        self._db = db
+        self._context = multiprocessing.get_context("spawn")
+        self._socket_dir = ""
+        self._processes: List[Optional[multiprocessing.Process]] = [None] * workers
+        self._writers: List[Optional[asyncio.StreamWriter]] = [None] * workers
+        self._watchers: List[Optional[asyncio.Task]] = [None] * workers
+        # Переданные, но еще не подтвержденные обновления: update_id -> [кадр, повторных отправок]
+        self._pending: List[OrderedDict] = [OrderedDict() for _ in range(workers)]
+        # Будит monitor, когда процесс-обработчик потерял соединение
+        self._wakeup = asyncio.Event()
+        self._routed = [0] * workers
+        self._restarts = [0] * workers
+        self._stopping = False
+
+    def _socket_path(self, index: int) -> str:
+        return os.path.join(self._socket_dir, f"worker_{index}.sock")
+
+    async def start(self):
+        """Запустить процессы-обработчики и подключиться к ним"""
+        self._socket_dir = tempfile.mkdtemp(prefix="bot_workers_")
+        await asyncio.gather(*(self._start_worker(i) for i in range(self.workers)))
+        logger.info(f"Запущено процессов-обработчиков: {self.workers}")
+
+    async def _start_worker(self, index: int):
+        """Запустить процесс-обработчик и дождаться его сокета"""
+        socket_path = self._socket_path(index)
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        process = self._context.Process(
+            target=self._target, args=(index, socket_path), name=f"bot_worker_{index}", daemon=False,
+        )
+        process.start()
+        self._processes[index] = process
+
+        deadline = asyncio.get_running_loop().time() + WORKER_START_TIMEOUT
+        while True:
+            try:
+                reader, writer = await asyncio.open_unix_connection(socket_path)
+                break
+            except (FileNotFoundError, ConnectionRefusedError):
+                if not process.is_alive():
+                    raise RuntimeError(f"Процесс-обработчик {index} завершился при запуске (код {process.exitcode})")
+                if asyncio.get_running_loop().time() > deadline:
+                    raise RuntimeError(f"Процесс-обработчик {index} не запустился за {WORKER_START_TIMEOUT} сек")
+                await asyncio.sleep(0.1)
+
+        # Обновления, которые не успел принять предыдущий процесс, уходят первыми.
+        # Между записью и установкой writer нет await, поэтому новые обновления
+        # из route() встанут после них
+        pending = self._pending[index]
+        if pending:
+            # Процесс принимает обновления по порядку: упасть на приеме могло только
+            # первое неподтвержденное
+            update_id, entry = next(iter(pending.items()))
+            if entry[1] >= MAX_REDELIVERIES:
+                logger.error(f"Обновление {update_id} отброшено: процесс-обработчик {index} "
+                             f"завершался, не подтвердив его, {entry[1] + 1} раз")
+                del pending[update_id]
+            else:
+                entry[1] += 1
+        for frame, _ in pending.values():
+            writer.write(frame)
+        self._writers[index] = writer
+        self._watchers[index] = asyncio.create_task(
+            self._watch_worker(index, reader, writer), name=f"bot_worker_{index}_watch",
+        )
+        if pending:
+            logger.info(f"Процессу-обработчику {index} повторно переданы обновления: {len(pending)}")
+        logger.debug(f"Процесс-обработчик {index} запущен (pid {process.pid})")
+
+    async def _watch_worker(self, index: int, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Читать подтверждения и команды процесса-обработчика до закрытия соединения
+
+        Закрытие соединения означает, что процесс завершился: monitor сразу его
+        перезапускает, не дожидаясь ошибки записи или очередной проверки.
+        """
+        pending = self._pending[index]
+        try:
+            while True:
+                kind = await reader.readexactly(1)
+                if kind == MESSAGE_ACK:
+                    (update_id,) = ACK.unpack(await reader.readexactly(ACK.size))
+                    pending.pop(update_id, None)
+                elif kind == MESSAGE_COMMAND:
+                    frame = await read_frame(reader)
+                    if frame is None:
+                        break
+                    self._spawn_command(index, writer, json.loads(frame))
+                else:
+                    logger.error(f"Неизвестный тип сообщения {kind!r} от процесса-обработчика {index}")
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, OSError):
+            pass
+        if self._stopping or self._writers[index] is not writer:
+            return
+        logger.error(f"❌ Процесс-обработчик {index} закрыл соединение")
+        writer.close()
+        self._writers[index] = None
+        self._wakeup.set()
+
+    def _spawn_command(self, index: int, writer: asyncio.StreamWriter, request: Dict):
+        """Запустить команду процесса-обработчика, не задерживая чтение подтверждений"""
+        name = request.get("command")
+        try:
+            get_task_supervisor().spawn(
+                self._run_command(index, writer, request), WORKER_COMMAND_CATEGORY, name=f"worker_{index}_{name}",
+            )
+        except RuntimeError as e:
+            logger.warning(str(e))
+
+    async def _run_command(self, index: int, writer: asyncio.StreamWriter, request: Dict):
+        """Выполнить команду процесса-обработчика и отправить ему результат"""
+        name = request.get("command")
+        reply: Dict[str, Any] = {"id": request.get("id")}
+        command = _main_process_commands.get(name)
+        try:
+            if command is None:
+                raise RuntimeError(f"Неизвестная команда {name}")
+            reply["result"] = await command(self._db, **request.get("args", {}))
+        except Exception as e:
+            logger.error(f"Ошибка команды {name} от процесса-обработчика {index}: {e}", exc_info=True)
+            reply["error"] = str(e) or type(e).__name__
+        if reply["id"] is None or writer.is_closing():
+            return
+        try:
+            writer.write(encode_message(MESSAGE_REPLY, reply))
+        except (ConnectionError, OSError) as e:
+            logger.warning(f"Не удалось отправить процессу-обработчику {index} ответ на команду {name}: {e}")
+
+    async def route(self, update: Dict) -> bool:
+        """Передать обновление процессу-обработчику пользователя
+
+        Обновление хранится до подтверждения процессом: если процесс упал или
+        перезапускается, оно будет отправлено перезапущенному процессу.
+
+        Returns:
+            False, если обновление не принято (бот останавливается или процесс
+            недоступен и накопил MAX_PENDING_UPDATES неподтвержденных обновлений) -
+            его нужно получить от Telegram повторно
+        """
+        if self._stopping:
+            return False
+        index = update_shard(update, self.workers)
+        pending = self._pending[index]
+        if len(pending) >= MAX_PENDING_UPDATES:
+            logger.error(f"Процесс-обработчик {index} не подтверждает обновления, "
+                         f"обновление {update.get('update_id')} не принято")
+            self._wakeup.set()
+            return False
+        frame = encode_message(MESSAGE_UPDATE, update)
+        pending[update.get("update_id", 0)] = [frame, 0]
+        self._routed[index] += 1
+
+        writer = self._writers[index]
+        if writer is None or writer.is_closing():
+            # Отправится, когда monitor перезапустит процесс
+            self._wakeup.set()
+            return True
+        try:
+            # write() сохраняет порядок кадров; drain() ограничивает буфер, если процесс не успевает
+            writer.write(frame)
+            await writer.drain()
+        except (ConnectionError, OSError) as e:
+            logger.error(f"Ошибка передачи обновления процессу-обработчику {index}: {e}")
+            if self._writers[index] is writer:
+                writer.close()
+                self._writers[index] = None
+            self._wakeup.set()
+        return True
+
+    async def monitor(self):
+        """Фоновая задача: перезапускает упавшие процессы-обработчики
+
+        Проверяет процессы раз в WORKER_MONITOR_INTERVAL секунд и сразу, как только
+        процесс-обработчик потерял соединение.
+        """
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), WORKER_MONITOR_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            for index, process in enumerate(self._processes):
+                if self._stopping or process is None:
+                    continue
+                if process.is_alive() and self._writers[index] is not None:
+                    continue
+                if process.is_alive():
+                    # Соединение потеряно: процесс завершается сам, иначе останавливаем его
+                    await asyncio.to_thread(process.join, 5)
+                    if process.is_alive():
+                        process.terminate()
+                        await asyncio.to_thread(process.join, 5)
+                logger.error(f"❌ Процесс-обработчик {index} завершился (код {process.exitcode}), перезапуск")
+                writer = self._writers[index]
+                if writer is not None:
+                    writer.close()
+                self._writers[index] = None
+                self._restarts[index] += 1
+                try:
+                    await self._start_worker(index)
+                except Exception as e:
+                    logger.error(f"Не удалось перезапустить процесс-обработчик {index}: {e}")
+
+    def forward_signal(self, signum: int):
+        """Передать сигнал процессам-обработчикам (например, SIGHUP для перезагрузки конфигурации)"""
+        for process in self._processes:
+            if process is not None and process.is_alive():
+                os.kill(process.pid, signum)
+
+    async def stop(self, timeout: float):
+        """Остановить прием обновлений и дождаться процессов-обработчиков
+
+        Закрытие сокета - сигнал процессу: он дорабатывает полученные обновления
+        (не дольше timeout) и завершается.
+        """
+        self._stopping = True
+        self._wakeup.set()
+        for writer in self._writers:
+            if writer is not None:
+                writer.close()
+        for writer in self._writers:
+            if writer is not None:
+                try:
+                    await writer.wait_closed()
+                except (ConnectionError, OSError):
+                    pass
+
+        def join_all():
+            for process in self._processes:
+                if process is not None:
+                    process.join(timeout + 5)
+            for process in self._processes:
+                if process is not None and process.is_alive():
+                    logger.warning(f"Процесс-обработчик {process.name} не завершился, принудительная остановка")
+                    process.terminate()
+                    process.join(5)
+
+        await asyncio.to_thread(join_all)
+        for watcher in self._watchers:
+            if watcher is not None:
+                watcher.cancel()
+        await asyncio.gather(*(w for w in self._watchers if w is not None), return_exceptions=True)
+        shutil.rmtree(self._socket_dir, ignore_errors=True)
+        logger.info("Процессы-обработчики остановлены")
+
+    def stats(self) -> List[Dict]:
+        """Состояние процессов-обработчиков для /healthz"""
+        return [
+            {
+                "worker": index,
+                "alive": process is not None and process.is_alive(),
+                "routed": self._routed[index],
+                "restarts": self._restarts[index],
+                "pending": len(self._pending[index]),
+            }
+            for index, process in enumerate(self._processes)
+        ]
+
+
+async def serve_worker(socket_path: str, handle_update: Callable[[Dict], None]):
+    """В процессе-обработчике: принимать обновления от основного процесса
+
+    Возвращается, когда основной процесс закрыл соединение или процесс
+    получил SIGTERM. Пока соединение открыто, команды main_process_command
+    передаются через него основному процессу.
+
+    Args:
+        socket_path: Путь к Unix-сокету
+        handle_update: Запускает обработку обновления (не ждет ее завершения)
+    """
+    disconnected = asyncio.Event()
+
+    async def on_connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        global _main_process_link
+        link = _main_process_link = _MainProcessLink(writer)
+        try:
+            while True:
+                try:
+                    kind = await reader.readexactly(1)
+                except asyncio.IncompleteReadError:
+                    break
+                frame = await read_frame(reader)
+                if frame is None:
+                    break
+                data = json.loads(frame)
+                if kind == MESSAGE_REPLY:
+                    link.resolve(data)
+                    continue
+                handle_update(data)
+                writer.write(MESSAGE_ACK + ACK.pack(data.get("update_id", 0)))
+        finally:
+            if _main_process_link is link:
+                _main_process_link = None
+            link.close()
+            writer.close()
+            disconnected.set()
+
+    server = await asyncio.start_unix_server(on_connection, path=socket_path)
+    # SIGINT процесс-обработчик игнорирует: его останавливает основной процесс
+    stop_signal = asyncio.create_task(wait_for_stop_signal((signal.SIGTERM,)))
+    disconnect = asyncio.create_task(disconnected.wait())
+    try:
+        await asyncio.wait({stop_signal, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        stop_signal.cancel()
+        disconnect.cancel()
+        server.close()
+        await server.wait_closed()
+
+
+async def run_front_polling(bot: Bot, pool: WorkerPool, allowed_updates: List[str]):
+    """Основной процесс: получать обновления через getUpdates и раздавать их до SIGINT/SIGTERM
+
+    Обновления запрашиваются напрямую (без разбора в объекты aiogram): основному
+    процессу нужен только user_id, а разбор выполняют процессы-обработчики.
+    """
+    # getUpdates не работает, пока зарегистрирован webhook
+    await bot.delete_webhook()
+    url = bot.session.api.api_url(token=bot.token, method="getUpdates")
+
+    async def poll():
+        offset = None
+        backoff = 1
+        timeout = aiohttp.ClientTimeout(total=POLLING_TIMEOUT + 10)
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            while True:
+                params = {"timeout": POLLING_TIMEOUT, "allowed_updates": allowed_updates}
+                if offset is not None:
+                    params["offset"] = offset
+                try:
+                    async with session.post(url, json=params) as response:
+                        data = await response.json(content_type=None)
+                    if not data.get("ok"):
+                        raise RuntimeError(data.get("description") or f"HTTP {response.status}")
+                except (aiohttp.ClientError, asyncio.TimeoutError, ValueError, RuntimeError) as e:
+                    logger.warning(f"Ошибка getUpdates: {e}. Повтор через {backoff} сек.")
+                    await asyncio.sleep(backoff)
+                    backoff = min(backoff * 2, 30)
+                    continue
+                backoff = 1
+                for update in data["result"]:
+                    if not await pool.route(update):
+                        # Offset не сдвигается: Telegram вернет это обновление и следующие
+                        # в очередном getUpdates, когда процесс-обработчик освободится
+                        await asyncio.sleep(ROUTE_RETRY_DELAY)
+                        break
+                    offset = update["update_id"] + 1
+
+    poll_task = asyncio.create_task(poll(), name="front_polling")
+    stop_signal = asyncio.create_task(wait_for_stop_signal())
+    try:
+        await asyncio.wait({poll_task, stop_signal}, return_when=asyncio.FIRST_COMPLETED)
+        if poll_task.done():
+            # Цикл опроса не должен завершаться сам: пробрасываем его ошибку
+            poll_task.result()
+        logger.info("Получен сигнал остановки, основной процесс перестает получать обновления")
+    finally:
+        poll_task.cancel()
+        stop_signal.cancel()
+        await asyncio.gather(poll_task, stop_signal, return_exceptions=True)
+
+
+def build_front_webhook_app(pool: WorkerPool, config: Config) -> web.Application:
+    """aiohttp-приложение основного процесса: проверяет секрет и раздает обновления"""
+    app = web.Application()
+    secret = config.webhook_secret.encode()
+
+    async def handle(request: web.Request) -> web.Response:
+        token = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "").encode()
+        if not secrets.compare_digest(token, secret):
+            return web.Response(status=401, text="Unauthorized")
+        if not await pool.route(await request.json()):
+            # Telegram повторит обновление
+            return web.Response(status=503, text="Worker unavailable")
+        return web.json_response({})
+
+    async def health(request: web.Request) -> web.Response:
+        workers = pool.stats()
+        alive = all(worker["alive"] for worker in workers)
+        return web.json_response(
+            {"status": "ok" if alive else "degraded", "mode": "webhook", "workers": workers},
+            status=200 if alive else 503,
+        )
+
+    app.router.add_post(config.webhook_path, handle)
+    app.router.add_get(HEALTH_PATH, health)
+    return app
+
+
+async def run_front_webhook(bot: Bot, pool: WorkerPool, config: Config, allowed_updates: List[str]):
+    """Основной процесс: принимать обновления через webhook и раздавать их до SIGINT/SIGTERM"""
+    await serve_webhook_app(build_front_webhook_app(pool, config), bot, config, allowed_updates)
+
+
+def install_worker_signal_handlers(reload: Callable[[], object]):
+    """В процессе-обработчике: Ctrl+C игнорируется (останавливает основной процесс), SIGHUP - перезагрузка"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if hasattr(signal, "SIGHUP"):
+        asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, reload)
@@ -0,0 +1,205 @@
+"""Супервизор фоновых задач бота
+
+Задачи, запущенные через asyncio.create_task без сохранения ссылки, может
+собрать сборщик мусора, их ошибки теряются, а при остановке бота они
+обрываются на полпути. Супервизор:
+- хранит ссылки на все запущенные задачи;
+- ограничивает число одновременно выполняемых задач категории (set_limit);
+- считает по категориям запуски, ошибки и длительность;
+- при остановке бота дожидается задач в работе (не дольше заданного времени),
+  а оставшиеся отменяет. Бесконечные фоновые циклы (cancel_on_shutdown=True)
+  отменяются сразу.
+"""
+import asyncio
+import time
+from typing import Coroutine, Dict, Optional, Set
+
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+# Сколько ждать завершения задач при остановке бота, сек
+TASK_DRAIN_TIMEOUT = 10.0
+
+
+class _CategoryStats:
+    """Метрики задач одной категории"""
+
+    def __init__(self, limit: Optional[int] = None):
+        self.limit = limit
+        self.semaphore = asyncio.Semaphore(limit) if limit else None
+        self.started = 0
+        self.running = 0
+        self.waiting = 0
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.total_duration = 0.0
+        self.max_duration = 0.0
+        self.last_error: Optional[str] = None
+
+    def stats(self) -> Dict:
+        finished = self.completed + self.failed
+        return {
+            "limit": self.limit,
+            "started": self.started,
+            "running": self.running,
+            "waiting": self.waiting,
+            "completed": self.completed,
+            "failed": self.failed,
+            "cancelled": self.cancelled,
+            "avg_duration": self.total_duration / finished if finished else 0.0,
+            "max_duration": self.max_duration,
+            "last_error": self.last_error,
+        }
+
+
+class TaskSupervisor:
+    """Реестр фоновых задач с ограничением параллельности по категориям"""
+
+    def __init__(self, limits: Optional[Dict[str, int]] = None):
+        """Инициализация супервизора
+
+        Args:
+            limits: Категория -> максимум одновременно выполняемых задач
+        """
+        self._categories: Dict[str, _CategoryStats] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        # Бесконечные циклы, которые при остановке отменяются без ожидания
+        self._services: Set[asyncio.Task] = set()
+        self._closing = False
+        for category, limit in (limits or {}).items():
+            self.set_limit(category, limit)
+
+    def set_limit(self, category: str, limit: Optional[int]):
+        """Ограничить число одновременно выполняемых задач категории (None - без ограничения)
+
+        Задачи, уже ожидающие места по старому лимиту, дождутся его.
+        """
+        stats = self._category(category)
+        stats.limit = limit if limit and limit > 0 else None
+        stats.semaphore = asyncio.Semaphore(stats.limit) if stats.limit else None
+
+    def _category(self, category: str) -> _CategoryStats:
+        stats = self._categories.get(category)
+        if stats is None:
+            stats = self._categories[category] = _CategoryStats()
+        return stats
+
+    def spawn(self, coro: Coroutine, category: str, name: Optional[str] = None,
+              cancel_on_shutdown: bool = False) -> asyncio.Task:
+        """Запустить задачу под присмотром супервизора
+
+        Args:
+            coro: Корутина
+            category: Категория для лимита и метрик (например, "crm_warmup")
+            name: Имя задачи для логов (по умолчанию - категория)
+            cancel_on_shutdown: Задача - бесконечный фоновый цикл; при остановке
+                отменяется сразу, без ожидания
+
+        Returns:
+            Запущенная задача
+
+        Raises:
+            RuntimeError: Супервизор уже останавливается
+        """
+        if self._closing:
+            coro.close()
+            raise RuntimeError(f"Бот останавливается, задача {name or category} не запущена")
+        stats = self._category(category)
+        stats.started += 1
+        task = asyncio.create_task(self._run(coro, stats, name or category), name=name or category)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        if cancel_on_shutdown:
+            self._services.add(task)
+            task.add_done_callback(self._services.discard)
+        return task
+
+    async def _run(self, coro: Coroutine, stats: _CategoryStats, name: str):
+        """Выполнить задачу с учетом лимита категории и записать метрики"""
+        semaphore = stats.semaphore
+        try:
+            if semaphore is not None:
+                stats.waiting += 1
+                try:
+                    await semaphore.acquire()
+                finally:
+                    stats.waiting -= 1
+        except asyncio.CancelledError:
+            coro.close()
+            stats.cancelled += 1
+            raise
+
+        stats.running += 1
+        started = time.monotonic()
+        try:
+            result = await coro
+        except asyncio.CancelledError:
+            stats.cancelled += 1
+            raise
+        except Exception as e:
+            stats.failed += 1
+            stats.last_error = f"{type(e).__name__}: {e}"
+            logger.error(f"❌ Фоновая задача {name} завершилась с ошибкой: {e}", exc_info=True)
+            return None
+        else:
+            stats.completed += 1
+            return result
+        finally:
+            duration = time.monotonic() - started
+            stats.running -= 1
+            stats.total_duration += duration
+            stats.max_duration = max(stats.max_duration, duration)
+            if semaphore is not None:
+                semaphore.release()
+
+    async def drain(self, timeout: float = TASK_DRAIN_TIMEOUT) -> int:
+        """Остановить прием задач и дождаться выполняемых
+
+        Args:
+            timeout: Сколько ждать, сек; оставшиеся задачи отменяются
+
+        Returns:
+            Количество задач, отмененных по таймауту
+        """
+        self._closing = True
+        for task in list(self._services):
+            task.cancel()
+
+        pending = {task for task in self._tasks if task not in self._services}
+        if pending:
+            logger.info(f"Ожидание завершения фоновых задач: {len(pending)} (не дольше {timeout:.0f} сек)")
+            _, pending = await asyncio.wait(pending, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        if pending:
+            logger.warning(f"Отменено фоновых задач по таймауту: {len(pending)}")
+        return len(pending)
+
+    def stats(self) -> Dict[str, Dict]:
+        """Метрики по категориям для админ-панели: категория -> stats()"""
+        return {category: stats.stats() for category, stats in self._categories.items()}
+
+
+# Глобальный супервизор (создается при первом обращении). После остановки
+# остается на месте: поздние вызовы spawn() получают RuntimeError, а не новый
+# супервизор, который запустил бы задачу после закрытия сессий
+_task_supervisor: Optional[TaskSupervisor] = None
+
+
+def get_task_supervisor() -> TaskSupervisor:
+    """Получить супервизор фоновых задач (singleton)"""
+    global _task_supervisor
+    if _task_supervisor is None:
+        _task_supervisor = TaskSupervisor()
+    return _task_supervisor
+
+
+async def shutdown_task_supervisor(timeout: float = TASK_DRAIN_TIMEOUT) -> int:
+    """Дождаться фоновых задач при остановке бота (см. TaskSupervisor.drain)"""
+    if _task_supervisor is None:
+        return 0
+    return await _task_supervisor.drain(timeout)
@@ -0,0 +1,156 @@
+"""Получение обновлений Telegram через webhook (BOT_MODE=webhook)
+
+Вместо одного long-poll соединения бот поднимает aiohttp-сервер: Telegram (или
+reverse proxy перед несколькими экземплярами бота) присылает обновления POST
+запросами на WEBHOOK_PATH. Запрос проверяется по заголовку
+X-Telegram-Bot-Api-Secret-Token, ответ отдается сразу, а обновление
+обрабатывается в фоне через супервизор задач - при остановке бот дожидается
+обновлений в работе. GET /healthz - проверка состояния для балансировщика.
+"""
+import asyncio
+import re
+import signal
+import time
+from typing import Dict, List, Sequence
+
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler
+from aiohttp import web
+
+from config import Config
+from logger import get_logger
+from services.task_supervisor import get_task_supervisor
+
+logger = get_logger(__name__)
+
+HEALTH_PATH = "/healthz"
+# Категория супервизора для обработки обновлений
+WEBHOOK_UPDATE_CATEGORY = "webhook_update"
+# Допустимый секрет по требованиям Bot API
+_SECRET_RE = re.compile(r"^[A-Za-z0-9_-]{1,256}$")
+
+
+class SupervisedRequestHandler(SimpleRequestHandler):
+    """Обработчик webhook: обновления обрабатываются в фоне под супервизором задач"""
+
+    async def _handle_request_background(self, bot: Bot, request: web.Request) -> web.Response:
+        update = await request.json(loads=bot.session.json_loads)
+        try:
+            get_task_supervisor().spawn(
+                self._background_feed_update(bot=bot, update=update),
+                WEBHOOK_UPDATE_CATEGORY,
+                name=f"update_{update.get('update_id')}",
+            )
+        except RuntimeError:
+            # Бот останавливается: Telegram повторит обновление (другому экземпляру)
+            return web.Response(status=503, text="Shutting down")
+        return web.json_response({}, dumps=bot.session.json_dumps)
+
+    async def close(self) -> None:
+        # Сессию бота закрывает main.py после обработки обновлений в работе
+        pass
+
+
+def validate_webhook_config(config: Config) -> str:
+    """Проверить настройки webhook
+
+    Returns:
+        Текст ошибки или пустая строка, если настройки корректны
+    """
+    if not config.webhook_secret:
+        return "WEBHOOK_SECRET не установлен: без секрета обновления может прислать кто угодно"
+    if not _SECRET_RE.match(config.webhook_secret):
+        return "WEBHOOK_SECRET может содержать только символы A-Z, a-z, 0-9, _ и - (до 256)"
+    if not config.webhook_path.startswith("/"):
+        return "WEBHOOK_PATH должен начинаться с /"
+    return ""
+
+
+def build_webhook_app(dp: Dispatcher, bot: Bot, config: Config) -> web.Application:
+    """Создать aiohttp-приложение с обработчиком webhook и /healthz
+
+    Args:
+        dp: Диспетчер с зарегистрированными роутерами
+        bot: Бот
+        config: Конфигурация (WEBHOOK_PATH, WEBHOOK_SECRET)
+    """
+    app = web.Application()
+    started = time.monotonic()
+
+    async def health(request: web.Request) -> web.Response:
+        stats: Dict[str, Dict] = get_task_supervisor().stats()
+        updates = stats.get(WEBHOOK_UPDATE_CATEGORY, {})
+        return web.json_response({
+            "status": "ok",
+            "mode": "webhook",
+            "uptime": round(time.monotonic() - started, 1),
+            "updates_running": updates.get("running", 0),
+            "updates_failed": updates.get("failed", 0),
+        })
+
+    app.router.add_get(HEALTH_PATH, health)
+    SupervisedRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        secret_token=config.webhook_secret,
+    ).register(app, path=config.webhook_path)
+    return app
+
+
+async def wait_for_stop_signal(signals: Sequence[int] = (signal.SIGINT, signal.SIGTERM)):
+    """Ждать сигнала остановки (на Windows - до KeyboardInterrupt)"""
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    installed = []
+    for sig in signals:
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+            installed.append(sig)
+        except (NotImplementedError, RuntimeError):
+            pass
+    try:
+        await stop_event.wait()
+    finally:
+        for sig in installed:
+            loop.remove_signal_handler(sig)
+
+
+async def serve_webhook_app(app: web.Application, bot: Bot, config: Config, allowed_updates: List[str]):
+    """Запустить aiohttp-приложение webhook и работать до SIGINT/SIGTERM
+
+    Если задан WEBHOOK_URL, адрес регистрируется в Telegram (setWebhook).
+    При остановке webhook не удаляется: обновления копятся в Telegram или
+    доставляются другим экземплярам бота.
+    """
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, config.webhook_host, config.webhook_port)
+    await site.start()
+    logger.info(
+        f"Webhook-сервер запущен: http://{config.webhook_host}:{config.webhook_port}{config.webhook_path} "
+        f"(проверка состояния - {HEALTH_PATH})"
+    )
+    try:
+        if config.webhook_url:
+            await bot.set_webhook(
+                f"{config.webhook_url}{config.webhook_path}",
+                secret_token=config.webhook_secret,
+                allowed_updates=allowed_updates,
+            )
+            logger.info(f"Webhook зарегистрирован в Telegram: {config.webhook_url}{config.webhook_path}")
+        await wait_for_stop_signal()
+        logger.info("Получен сигнал остановки, webhook-сервер перестает принимать обновления")
+    finally:
+        # Сервер закрывается до остановки супервизора: новые обновления не принимаются,
+        # а обновления в работе дожидается shutdown_task_supervisor в main.py
+        await runner.cleanup()
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot, config: Config):
+    """Обрабатывать обновления из webhook в этом процессе до SIGINT/SIGTERM"""
+    workflow_data = {"dispatcher": dp, "bots": [bot], "bot": bot, **dp.workflow_data}
+    await dp.emit_startup(**workflow_data)
+    try:
+        await serve_webhook_app(build_webhook_app(dp, bot, config), bot, config, dp.resolve_used_update_types())
+    finally:
+        await dp.emit_shutdown(**workflow_data)
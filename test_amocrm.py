@@ -11,7 +11,8 @@ import os
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from config import Config
-from services import AmoCRM
+from services import AmoCRM, close_amocrm_sessions
+from services.city_routing import route_city
 from logger import setup_logger
 
 logger = setup_logger(__name__)
@@ -141,35 +142,16 @@ async def main():
     ]
     
     for city_name, expected_crm in test_cities:
-        city_lower = city_name.lower()
-        
-        city1_cities = [
-            "волгоград", "volgograd", "краснодар", "krasnodar",
-            "ростов-на-дону", "ростов", "rostov", "rostov-on-don",
-            "самара", "samara", "сочи", "sochi",
-            "ставрополь", "stavropol", "уфа", "ufa"
-        ]
-        
-        city2_cities = [
-            "воронеж", "voronezh", "екатеринбург", "ekaterinburg", "yekaterinburg",
-            "ижевск", "izhevsk", "казань", "kazan", "красноярск", "krasnoyarsk",
-            "липецк", "lipetsk", "минск", "minsk",
-            "набережные челны", "набережные", "naberezhnye", "chelny",
-            "нижний новгород", "нижний", "nizhny", "novgorod", "nizhny-novgorod",
-            "новосибирск", "novosibirsk", "омск", "omsk",
-            "тамбов", "tambov", "тюмень", "tyumen", "челябинск", "chelyabinsk"
-        ]
-        
-        if any(city_keyword in city_lower for city_keyword in city1_cities):
-            selected = "City1 (АТЛАНТ)"
-        elif any(city_keyword in city_lower for city_keyword in city2_cities):
-            selected = "City2 (ЭТАЖИ)"
-        else:
-            selected = "City2 (ЭТАЖИ) - по умолчанию"
+        route = route_city(city_name)
+        selected = f"City{route.crm_type[-1]} ({route.account_name})"
+        if route.city is None:
+            selected += " - по умолчанию"
         
         status = "✅" if selected == expected_crm or "по умолчанию" in expected_crm else "⚠️"
         logger.info(f"{status} {city_name} → {selected}")
     
+    await close_amocrm_sessions()
+    
     logger.info("\n" + "="*60)
     logger.info("ТЕСТИРОВАНИЕ ЗАВЕРШЕНО")
     logger.info("="*60)
@@ -0,0 +1,7 @@
+"""Общие настройки тестов: корневая директория проекта в пути импорта"""
+import sys
+from pathlib import Path
+
+# Добавляем корневую директорию проекта в путь
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
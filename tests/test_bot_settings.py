@@ -0,0 +1,68 @@
+"""Снимок настроек бота и подписка на его изменения (services/bot_settings.py)"""
+import json
+import os
+
+import pytest
+
+from services.bot_settings import BotSettingsService
+
+
+@pytest.fixture
+def service(tmp_path) -> BotSettingsService:
+    return BotSettingsService(str(tmp_path / "bot_settings.json"))
+
+
+def test_subscriber_called_once_per_change(service):
+    received = []
+    service.subscribe(received.append)
+    # Подписчик сразу получает текущий снимок
+    assert len(received) == 1
+
+    service.set_promo_code("spring")
+    assert [s.promo_code for s in received[1:]] == ["SPRING"]
+
+    # Те же значения - не изменение
+    service.set_promo_code("SPRING")
+    service.snapshot()
+    assert len(received) == 2
+
+    service.set_ticket_url("https://example.com/tickets")
+    assert len(received) == 3
+    assert received[-1].ticket_url == "https://example.com/tickets"
+
+
+def test_subscriber_called_on_file_change(service):
+    received = []
+    service.subscribe(received.append)
+
+    settings = json.loads(service.file_path.read_text(encoding="utf-8"))
+    settings["promo_code"] = "FROMFILE"
+    service.file_path.write_text(json.dumps(settings, ensure_ascii=False), encoding="utf-8")
+    # Сигнатура файла - mtime и размер: сдвигаем mtime на случай совпадения
+    stat = service.file_path.stat()
+    os.utime(service.file_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+    assert service.snapshot().promo_code == "FROMFILE"
+    assert service.snapshot().promo_code == "FROMFILE"
+    assert [s.promo_code for s in received[1:]] == ["FROMFILE"]
+
+
+def test_failing_subscriber_does_not_block_others(service):
+    received = []
+
+    @service.subscribe
+    def broken(settings):
+        if settings.promo_code == "FIRST":
+            raise RuntimeError("ошибка подписчика")
+
+    service.subscribe(received.append)
+    service.set_promo_code("first")
+    assert [s.promo_code for s in received[1:]] == ["FIRST"]
+
+
+def test_unsubscribe(service):
+    received = []
+    service.subscribe(received.append)
+    service.unsubscribe(received.append)
+    service.set_promo_code("second")
+    assert len(received) == 1
@@ -0,0 +1,47 @@
+"""Маршрутизация городов по аккаунтам AmoCRM (services/city_routing.py)"""
+from pathlib import Path
+
+import pytest
+
+from services.city_routing import CityRouter, load_city_router
+
+ROUTING_PATH = Path(__file__).parent.parent / "city_routing.json"
+
+
+@pytest.fixture(scope="module")
+def router() -> CityRouter:
+    return load_city_router(str(ROUTING_PATH))
+
+
+@pytest.mark.parametrize("city, crm_type, name", [
+    ("Волгоград", "city1", "Волгоград"),
+    ("ростов на дону", "city1", "Ростов-на-Дону"),
+    ("Rostov-on-Don", "city1", "Ростов-на-Дону"),
+    ("г. Казань", "city2", "Казань"),
+    ("Казань, ТЦ Мега", "city2", "Казань"),
+    ("Nizhniy Novgorod", "city2", "Нижний Новгород"),
+])
+def test_known_cities(router, city, crm_type, name):
+    route = router.route(city)
+    assert (route.crm_type, route.city) == (crm_type, name)
+
+
+@pytest.mark.parametrize("city, crm_type, name", [
+    # До общей таблицы город искался подстрокой, и регионы попадали в аккаунт своего города
+    ("Волгоградская обл", "city1", "Волгоград"),
+    ("Ростовская область", "city1", "Ростов-на-Дону"),
+    ("Краснодарский край", "city1", "Краснодар"),
+    ("Самарская область", "city1", "Самара"),
+    ("Омская область", "city2", "Омск"),
+    ("Липецкая обл.", "city2", "Липецк"),
+])
+def test_region_routes_to_its_city(router, city, crm_type, name):
+    route = router.route(city)
+    assert (route.crm_type, route.city) == (crm_type, name)
+
+
+@pytest.mark.parametrize("city", ["Москва", "Томск", "", None])
+def test_unknown_city_uses_default_account(router, city):
+    route = router.route(city)
+    assert route.city is None
+    assert route.crm_type == router.default_crm_type
@@ -1,4 +1,6 @@
 """Утилиты для работы с администраторами"""
+import hashlib
+
 from config import Config
 from logger import get_logger
 
@@ -12,3 +14,11 @@ def is_admin(user_id: int, config: Config) -> bool:
         logger.debug(f"Пользователь {user_id} является администратором")
     return is_admin_user
 
+
+def short_hash(value: str, length: int = 8) -> str:
+    """Короткий стабильный хэш строки для callback_data и id inline-результатов
+    
+    callback_data ограничена 64 байтами, а города и slug могут быть длинными
+    и на кириллице (2 байта на символ), поэтому передается хэш, а не значение.
+    """
+    return hashlib.sha1(value.encode('utf-8')).hexdigest()[:length]
@@ -0,0 +1,90 @@
+"""Асинхронный кэш с TTL и объединением одновременных загрузок (single-flight)"""
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class AsyncTTLCache:
+    """Кэш значений, загружаемых асинхронно (например, из AmoCRM API)
+
+    Значение живет ttl секунд. Если несколько корутин одновременно запрашивают
+    отсутствующий ключ, загрузка выполняется один раз, а остальные ждут ее
+    результата. Значения None не кэшируются: неудачная загрузка будет
+    повторена при следующем обращении.
+    """
+
+    def __init__(self, ttl: float, name: str = "cache"):
+        """Инициализация кэша
+
+        Args:
+            ttl: Время жизни значения в секундах
+            name: Название кэша для логов
+        """
+        self.ttl = ttl
+        self.name = name
+        # Ключ -> (время истечения по time.monotonic(), значение)
+        self._values: Dict[Hashable, Tuple[float, Any]] = {}
+        # Ключ -> загрузка, которая выполняется прямо сейчас
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Получить значение без загрузки (None, если нет или устарело)"""
+        cached = self._values.get(key)
+        if cached and cached[0] > time.monotonic():
+            return cached[1]
+        return None
+
+    def set(self, key: Hashable, value: Any):
+        """Положить значение в кэш"""
+        self._values[key] = (time.monotonic() + self.ttl, value)
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """Получить значение из кэша или загрузить его
+
+        Args:
+            key: Ключ кэша
+            loader: Корутина-функция без аргументов, загружающая значение
+
+        Returns:
+            Значение (или None, если загрузка не удалась)
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            # Кто-то уже загружает этот ключ - ждем его результат.
+            # shield: отмена ожидающего не должна отменять общую загрузку
+            return await asyncio.shield(inflight)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await loader()
+            if value is not None:
+                self.set(key, value)
+            future.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Исключение уже получит вызывающий код; ожидающих может не быть
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    def invalidate(self, key: Optional[Hashable] = None):
+        """Сбросить значение по ключу или весь кэш (key=None)"""
+        if key is None:
+            self._values.clear()
+            logger.debug(f"Кэш {self.name} очищен")
+        else:
+            self._values.pop(key, None)
@@ -17,7 +17,7 @@
         utm_medium="cpc"
     )
 """
-from config import Config
+from config import get_config
 from utils import encode_deep_link
 
 
@@ -67,7 +67,7 @@ def generate_bot_link(
         'https://t.me/theatrfest_help_bot?start=<encoded_data>'
     """
     try:
-        config = Config.load()
+        config = get_config()
         username = bot_username or config.bot_username
     except:
         username = bot_username or "theatrfest_help_bot"
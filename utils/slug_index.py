@@ -0,0 +1,136 @@
+"""Индекс slug для поиска по префиксу и исправления опечаток
+
+Префиксный поиск работает по отсортированному списку slug (bisect),
+нечеткий поиск - по словарю удалений символов (как в SymSpell): для каждого
+slug строятся все варианты с удалением до max_distance символов, поэтому поиск
+кандидатов не зависит от количества slug, а точное расстояние считается только
+для нескольких найденных кандидатов. Словарь строится при первом нечетком
+поиске: индекс пересоздается после каждого сохранения маппинга, а опечатки
+в ссылках редки.
+
+Цифры в slug - номер спектакля в городе (kazan3, ufa2), поэтому их изменение
+опечаткой не считается: ufa1 и ufa2 - разные спектакли.
+"""
+import bisect
+from functools import cached_property
+from typing import Dict, Iterable, List, Optional, Set
+
+
+def _deletes(word: str, max_distance: int) -> Set[str]:
+    """Все варианты слова с удалением от 0 до max_distance символов"""
+    result = {word}
+    frontier = {word}
+    for _ in range(max_distance):
+        next_frontier = set()
+        for item in frontier:
+            for i in range(len(item)):
+                next_frontier.add(item[:i] + item[i + 1:])
+        next_frontier -= result
+        result |= next_frontier
+        frontier = next_frontier
+    return result
+
+
+def _digits(word: str) -> str:
+    """Цифры слова по порядку (номер спектакля в slug)"""
+    return "".join(ch for ch in word if ch.isdigit())
+
+
+def edit_distance(a: str, b: str, max_distance: int) -> int:
+    """Расстояние Дамерау-Левенштейна (с перестановкой соседних символов)
+
+    Возвращает max_distance + 1, если расстояние больше max_distance.
+    """
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+
+    prev_prev: List[int] = []
+    prev = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        row_min = current[0]
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(prev[j] + 1, current[j - 1] + 1, prev[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], prev_prev[j - 2] + 1)
+            row_min = min(row_min, current[j])
+        if row_min > max_distance:
+            return max_distance + 1
+        prev_prev, prev = prev, current
+    return min(prev[len(b)], max_distance + 1)
+
+
+class SlugIndex:
+    """Индекс slug: поиск по префиксу и ближайший slug с учетом опечаток"""
+
+    def __init__(self, slugs: Iterable[str], max_distance: int = 2):
+        """Инициализация индекса
+
+        Args:
+            slugs: Список slug
+            max_distance: Максимальное число опечаток для нечеткого поиска
+        """
+        self.max_distance = max_distance
+        # Ключ поиска (в нижнем регистре) -> исходный slug
+        self._by_key: Dict[str, str] = {slug.lower(): slug for slug in slugs}
+        self._sorted_keys: List[str] = sorted(self._by_key)
+
+    def __len__(self) -> int:
+        return len(self._sorted_keys)
+
+    def search_prefix(self, prefix: str, limit: int = 50) -> List[str]:
+        """Найти slug, начинающиеся с prefix (без учета регистра), в алфавитном порядке"""
+        prefix = prefix.strip().lower()
+        start = bisect.bisect_left(self._sorted_keys, prefix)
+        result = []
+        for key in self._sorted_keys[start:]:
+            if not key.startswith(prefix) or len(result) >= limit:
+                break
+            result.append(self._by_key[key])
+        return result
+
+    @cached_property
+    def _deletes(self) -> Dict[str, List[str]]:
+        """Словарь удалений: вариант -> ключи slug (строится при первом обращении)"""
+        deletes: Dict[str, List[str]] = {}
+        for key in self._sorted_keys:
+            for variant in _deletes(key, self.max_distance):
+                deletes.setdefault(variant, []).append(key)
+        return deletes
+
+    def find_closest(self, query: str) -> Optional[str]:
+        """Найти единственный ближайший slug с учетом опечаток
+
+        Для коротких запросов (до 4 символов) допускается одна опечатка,
+        для остальных - до max_distance. Кандидатами считаются только slug
+        с теми же цифрами, что и в запросе. Если несколько slug одинаково
+        близки, возвращается None: угадывать между ними нельзя.
+        """
+        key = query.strip().lower()
+        if not key:
+            return None
+        if key in self._by_key:
+            return self._by_key[key]
+
+        max_distance = 1 if len(key) <= 4 else self.max_distance
+        digits = _digits(key)
+        candidates: Set[str] = set()
+        for variant in _deletes(key, max_distance):
+            candidates.update(c for c in self._deletes.get(variant, ()) if _digits(c) == digits)
+
+        best: Optional[str] = None
+        best_distance = max_distance + 1
+        ambiguous = False
+        for candidate in candidates:
+            # Граница сужается до лучшего найденного расстояния
+            bound = best_distance if best is not None else max_distance
+            distance = edit_distance(key, candidate, bound)
+            if distance < best_distance:
+                best, best_distance, ambiguous = candidate, distance, False
+            elif distance == best_distance:
+                ambiguous = True
+
+        if best is None or best_distance > max_distance or ambiguous:
+            return None
+        return self._by_key[best]